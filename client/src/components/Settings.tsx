@@ -14,11 +14,11 @@ interface Settings {
 
 export default function Settings() {
   const [settings, setSettings] = useState<Settings>({
-    chunk_size: 1000,
-    chunk_overlap: 200,
+    chunk_size: 500,
+    chunk_overlap: 50,
     top_k_retrieval: 10,
     temperature: 0.7,
-    model: "gpt-3.5-turbo",
+    model: "gpt-4",
     typewriter_speed: 50,
     theme: "light",
     batch_processing: true,
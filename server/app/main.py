@@ -1,7 +1,20 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.routes import upload, query
 from app.routes.settings import router as settings_router
+from app.services import admission
+from app.services import clients
+from app.services import jobs
+from app.services import lexical_index
+from app.services import metrics
+from app.services import pipeline
+from app.services import query_cache
+from app.services import storage
+from app.services import vector_index
+from app.services.shared_state import WRITER_RETRY_INTERVAL, shared_state
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,16 +27,77 @@ import os
 # - Add .env and pydantic
 # - Add tests
 
+async def _become_writer(local_index, keyword_index):
+    """Catch up with the files the previous writer left behind, then run the ingestion jobs here."""
+    for index in (local_index, keyword_index):
+        if index is not None:
+            await asyncio.to_thread(index.refresh)
+    query_cache.query_cache.invalidate()
+    await jobs.start_job_queue()
+
+
+async def _wait_for_writer_lock(local_index, keyword_index):
+    """In a reader worker, take over as the writer once the current one exits."""
+    while not shared_state.try_become_writer():
+        await asyncio.sleep(WRITER_RETRY_INTERVAL)
+    await _become_writer(local_index, keyword_index)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With several uvicorn workers one of them writes (ingestion, index
+    # files) and the others only read; see services/shared_state.py
+    shared_state.start()
+    clients.clients.start()
+    supabase = clients.get_supabase()
+    local_index = vector_index.get_local_index()
+    keyword_index = lexical_index.get_lexical_index()
+    for index in (local_index, keyword_index):
+        if index is not None:
+            shared_state.on_change(index.refresh)
+    shared_state.on_change(query_cache.query_cache.invalidate)
+
+    takeover = None
+    if shared_state.is_writer:
+        if local_index is not None and len(local_index) == 0:
+            await asyncio.to_thread(vector_index.rebuild_from_supabase, supabase, local_index)
+        if keyword_index is not None and len(keyword_index) == 0:
+            await asyncio.to_thread(lexical_index.rebuild_from_supabase, supabase, keyword_index)
+        shared_state.publish()
+        await jobs.start_job_queue()
+    else:
+        await jobs.start_job_queue(run_jobs=False)
+        takeover = asyncio.create_task(_wait_for_writer_lock(local_index, keyword_index))
+    yield
+    if takeover is not None:
+        takeover.cancel()
+        await asyncio.gather(takeover, return_exceptions=True)
+    await jobs.stop_job_queue()
+    pipeline.shutdown()
+    storage.storage_capacity.shutdown()
+    await clients.clients.aclose()
+    shared_state.close()
+
 app = FastAPI(
     title="AI-Powered Document Search",
     description="Upload documents and query them using AI",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latency histograms, counters and in-flight gauges in Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# Inside the metrics middleware so rejected requests are counted with their 429/503 status
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -1,67 +1,388 @@
-from openai import OpenAI
-from typing import Optional
-from fastapi import APIRouter, Body
+from datetime import datetime
+from typing import Any, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from app.services import metrics
+from app.services.admission import INTERACTIVE
+from app.services.clients import get_async_openai, get_openai
+from app.services.context import build_context
 from app.services.embedding import embed_chunks
-from supabase import create_client, Client
+from app.services.filters import ChunkFilter
+from app.services.query_cache import query_cache, question_key
+from app.services.reranking import get_reranker
+from app.services.retrieval import get_retriever
+from app.services.settings import get_settings
+from app.services.shared_state import shared_state
+from app.services.storage import storage_capacity
+import asyncio
+import json
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_ANON_KEY")
-)
+retriever = get_retriever()
+reranker = get_reranker()
+
+# Questions accepted by one /query/batch request
+QUERY_BATCH_MAX_QUESTIONS = int(os.getenv("QUERY_BATCH_MAX_QUESTIONS", "500"))
+# Chat completions in flight per /query/batch request
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
 
 router = APIRouter(prefix="/query", tags=["query"])
 
+class QueryFilters(BaseModel):
+    """Only retrieve chunks of these documents, filenames, metadata values or upload window."""
+    document_ids: Optional[list[str]] = None
+    filenames: Optional[list[str]] = None
+    metadata: Optional[dict[str, Any]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+
 class QueryRequest(BaseModel):
     question: str
     top_k: Optional[int] = None
+    stream: bool = False
+    filters: Optional[QueryFilters] = None
+
+    def chunk_filter(self) -> Optional[ChunkFilter]:
+        return ChunkFilter(**self.filters.model_dump()) if self.filters else None
+
+
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
+    top_k: Optional[int] = None
+    filters: Optional[QueryFilters] = None
+
+    def chunk_filter(self) -> Optional[ChunkFilter]:
+        return ChunkFilter(**self.filters.model_dump()) if self.filters else None
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+async def sync_corpus():
+    """In a reader worker, pick up documents the writer ingested or deleted since the last query."""
+    if shared_state.stale:
+        await asyncio.to_thread(shared_state.sync)
+
+
+def _fetch_k(top_k: int) -> int:
+    return reranker.candidates(top_k) if reranker else top_k
+
+
+def rerank(question: str, matches: list[dict], top_k: int, timings: dict,
+           pipeline: str = "query") -> tuple[list[dict], Optional[dict]]:
+    """
+    Re-score over-fetched matches and keep the best top_k when reranking is
+    enabled. Adds rerank_ms to timings; the stats are None when disabled.
+    """
+    if reranker is None:
+        return matches, None
+    start = time.perf_counter()
+    with metrics.stage(pipeline, "rerank"):
+        matches, stats = reranker.rerank(question, matches, top_k)
+    timings["rerank_ms"] = round(timings.get("rerank_ms", 0.0) + _elapsed_ms(start), 1)
+    return matches, stats
+
+
+def build_system_prompt(question: str, retrieved_chunks: list[str]) -> str:
+    context = "\n\n".join(retrieved_chunks)
+    return (
+        "You are an AI assistant that answers questions based on the provided documents. "
+        "Answer clearly, concisely, and include facts only from the context below.\n\n"
+        f"Context:\n{context}\n\nQuestion: {question}"
+    )
+
+
+async def retrieve(question: str, top_k: int, cached: dict, timings: dict,
+                   filters: Optional[ChunkFilter] = None) -> list[dict]:
+    """
+    Embed the question and fetch the closest chunks matching filters,
+    using the query cache where possible.
+    """
+    await sync_corpus()
+
+    # 1. Embed the question
+    start = time.perf_counter()
+    embedding_key = question_key(question)
+    with metrics.stage("query", "embed"):
+        question_embedding = query_cache.embeddings.get(embedding_key)
+        if question_embedding is None:
+            cached["embedding"] = False
+            question_embedding = (await asyncio.to_thread(embed_chunks, [question]))[0]
+            query_cache.embeddings.set(embedding_key, question_embedding)
+    metrics.record_cache("query_embedding", cached["embedding"])
+    timings["embed_ms"] = _elapsed_ms(start)
+
+    # 2. Search for similar chunks (pgvector or the local index, optionally fused with BM25)
+    start = time.perf_counter()
+    retrieval_key = query_cache.retrieval_key(question, top_k, filters.key() if filters else None)
+    with metrics.stage("query", "retrieve"):
+        matches = query_cache.retrievals.get(retrieval_key)
+        if matches is None:
+            cached["retrieval"] = False
+            matches = await storage_capacity.run_async(INTERACTIVE, retriever.match_chunks,
+                                                       question_embedding, top_k, question, filters)
+            query_cache.retrievals.set(retrieval_key, matches)
+    metrics.record_cache("retrieval", cached["retrieval"])
+    timings["retrieve_ms"] = _elapsed_ms(start)
+    return matches
+
 
 @router.post("")
-async def query_docs(request: QueryRequest):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def query_docs(request: QueryRequest, settings: dict = Depends(get_settings)):
+    if request.stream:
+        return StreamingResponse(stream_query(request, settings), media_type="text/event-stream")
+
     try:
-        # 1. Embed the question
-        question_embedding = embed_chunks([request.question])[0]
-
-        # 2. Search Supabase for similar chunks using pgvector
-        results = supabase.rpc(
-            "match_chunks",
-            {
-                "query_embedding": question_embedding,
-                "match_count": request.top_k or 10
-            }
-        ).execute()
-
-        # 3. Get matched documents from Supabase response
-        retrieved_chunks = [result["content"] for result in results.data]
-        metadatas = [result["metadata"] for result in results.data]
-
-        # 4. Create the context prompt
-        context = "\n\n".join(retrieved_chunks)
-        system_prompt = (
-            "You are an AI assistant that answers questions based on the provided documents. "
-            "Answer clearly, concisely, and include facts only from the context below.\n\n"
-            f"Context:\n{context}\n\nQuestion: {request.question}"
-        )
-
-        # 5. Call OpenAI Chat Model
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-            ],
-        )
+        request_start = time.perf_counter()
+        top_k = request.top_k or settings["top_k_retrieval"]
+        model = settings["model"]
+        cached = {"embedding": True, "retrieval": True, "answer": True}
+        timings = {}
+
+        matches = await retrieve(request.question, _fetch_k(top_k), cached, timings, request.chunk_filter())
+        matches, rerank_stats = rerank(request.question, matches, top_k, timings)
+
+        # 3. Merge, dedup and fit the matched chunks to the context budget
+        retrieved_chunks, used_matches, context_stats = build_context(matches)
+        metadatas = [result["metadata"] for result in used_matches]
+
+        start = time.perf_counter()
+        answer_key = query_cache.answer_key(request.question, [result["id"] for result in matches], model,
+                                            settings["temperature"])
+        with metrics.stage("query", "generate"):
+            answer = query_cache.answers.get(answer_key)
+            if answer is None:
+                cached["answer"] = False
+
+                # 4. Create the context prompt
+                system_prompt = build_system_prompt(request.question, retrieved_chunks)
+
+                # 5. Call OpenAI Chat Model
+                response = await asyncio.to_thread(
+                    get_openai().chat.completions.create,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                    ],
+                    temperature=settings["temperature"],
+                )
+                answer = response.choices[0].message.content
+                query_cache.answers.set(answer_key, answer)
+        _record_query(cached, context_stats)
+        timings["generate_ms"] = _elapsed_ms(start)
+        timings["total_ms"] = _elapsed_ms(request_start)
 
         return {
             "question": request.question,
-            "answer": response.choices[0].message.content,
-            "sources": metadatas
+            "answer": answer,
+            "sources": metadatas,
+            "cached": cached,
+            "timings": timings,
+            "context": context_stats,
+            "rerank": rerank_stats
         }
 
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+
+async def retrieve_many(questions: list[str], top_k: int, cached: list[dict], timings: dict,
+                        filters: Optional[ChunkFilter] = None) -> list[list[dict]]:
+    """
+    retrieve() for a list of questions: the uncached questions are embedded
+    in one batched call and searched with one match_many call.
+    """
+    await sync_corpus()
+
+    # 1. Embed the questions
+    start = time.perf_counter()
+    embedding_keys = [question_key(question) for question in questions]
+    with metrics.stage("query_batch", "embed"):
+        embeddings = [query_cache.embeddings.get(key) for key in embedding_keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            new_embeddings = await asyncio.to_thread(embed_chunks, [questions[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+                cached[i]["embedding"] = False
+                query_cache.embeddings.set(embedding_keys[i], embedding)
+    for flags in cached:
+        metrics.record_cache("query_embedding", flags["embedding"])
+    timings["embed_ms"] = _elapsed_ms(start)
+
+    # 2. Search for similar chunks for all questions at once
+    start = time.perf_counter()
+    filter_key = filters.key() if filters else None
+    retrieval_keys = [query_cache.retrieval_key(question, top_k, filter_key) for question in questions]
+    with metrics.stage("query_batch", "retrieve"):
+        matches = [query_cache.retrievals.get(key) for key in retrieval_keys]
+        missing = [i for i, rows in enumerate(matches) if rows is None]
+        if missing:
+            new_matches = await storage_capacity.run_async(
+                INTERACTIVE, retriever.match_many,
+                [embeddings[i] for i in missing], top_k, [questions[i] for i in missing], filters
+            )
+            for i, rows in zip(missing, new_matches):
+                matches[i] = rows
+                cached[i]["retrieval"] = False
+                query_cache.retrievals.set(retrieval_keys[i], rows)
+    for flags in cached:
+        metrics.record_cache("retrieval", flags["retrieval"])
+    timings["retrieve_ms"] = _elapsed_ms(start)
+    return matches
+
+
+@router.post("/batch")
+async def query_batch(request: BatchQueryRequest, settings: dict = Depends(get_settings)):
+    """
+    Answer many questions in one request, e.g. an evaluation set. Questions
+    are embedded and retrieved together; answers are generated concurrently,
+    at most QUERY_BATCH_CONCURRENCY at a time. A failed answer is reported
+    in that question's result without failing the others.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(request.questions) > QUERY_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX_QUESTIONS} questions per batch")
+
+    try:
+        request_start = time.perf_counter()
+        top_k = request.top_k or settings["top_k_retrieval"]
+        model = settings["model"]
+        cached = [{"embedding": True, "retrieval": True, "answer": True} for _ in request.questions]
+        timings = {}
+
+        matches_list = await retrieve_many(request.questions, _fetch_k(top_k), cached, timings,
+                                           request.chunk_filter())
+        reranked = await asyncio.to_thread(lambda: [
+            rerank(question, matches, top_k, timings, "query_batch")
+            for question, matches in zip(request.questions, matches_list)
+        ])
+
+        semaphore = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+
+        async def answer_one(question: str, matches: list[dict], rerank_stats: Optional[dict], flags: dict) -> dict:
+            retrieved_chunks, used_matches, context_stats = build_context(matches)
+            answer_key = query_cache.answer_key(question, [result["id"] for result in matches], model,
+                                                settings["temperature"])
+            try:
+                answer = query_cache.answers.get(answer_key)
+                if answer is None:
+                    flags["answer"] = False
+                    async with semaphore:
+                        response = await get_async_openai().chat.completions.create(
+                            model=model,
+                            messages=[
+                                {"role": "system", "content": build_system_prompt(question, retrieved_chunks)},
+                            ],
+                            temperature=settings["temperature"],
+                        )
+                    answer = response.choices[0].message.content
+                    query_cache.answers.set(answer_key, answer)
+            except Exception as e:
+                return {"question": question, "error": str(e), "cached": flags}
+            _record_query(flags, context_stats)
+            return {
+                "question": question,
+                "answer": answer,
+                "sources": [result["metadata"] for result in used_matches],
+                "cached": flags,
+                "context": context_stats,
+                "rerank": rerank_stats
+            }
+
+        start = time.perf_counter()
+        with metrics.stage("query_batch", "generate"):
+            results = await asyncio.gather(*(
+                answer_one(question, matches, rerank_stats, flags)
+                for question, (matches, rerank_stats), flags in zip(request.questions, reranked, cached)
+            ))
+        timings["generate_ms"] = _elapsed_ms(start)
+        timings["total_ms"] = _elapsed_ms(request_start)
+        timings["questions_per_second"] = round(len(results) / max(timings["total_ms"] / 1000, 1e-9), 1)
+
+        return {
+            "results": results,
+            "total_questions": len(results),
+            "failed_questions": len([r for r in results if "error" in r]),
+            "timings": timings
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _record_query(cached: dict, context_stats: dict):
+    metrics.record_cache("answer", cached["answer"])
+    metrics.context_tokens_total.inc(context_stats["tokens_retrieved"], kind="retrieved")
+    metrics.context_tokens_total.inc(context_stats["tokens_used"], kind="used")
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_query(request: QueryRequest, settings: dict):
+    """
+    Server-sent events for a query: a "sources" event once retrieval is
+    done, a "token" event per generated token, then "done" with timings
+    including time to first token. Failures are sent as an "error" event.
+    """
+    request_start = time.perf_counter()
+    top_k = request.top_k or settings["top_k_retrieval"]
+    model = settings["model"]
+    cached = {"embedding": True, "retrieval": True, "answer": True}
+    timings = {}
+
+    try:
+        matches = await retrieve(request.question, _fetch_k(top_k), cached, timings, request.chunk_filter())
+        matches, rerank_stats = rerank(request.question, matches, top_k, timings)
+        retrieved_chunks, used_matches, context_stats = build_context(matches)
+        yield _sse("sources", {"sources": [result["metadata"] for result in used_matches]})
+
+        start = time.perf_counter()
+        answer_key = query_cache.answer_key(request.question, [result["id"] for result in matches], model,
+                                            settings["temperature"])
+        with metrics.stage("query", "generate"):
+            answer = query_cache.answers.get(answer_key)
+            if answer is not None:
+                timings["time_to_first_token_ms"] = _elapsed_ms(request_start)
+                yield _sse("token", {"token": answer})
+            else:
+                cached["answer"] = False
+                stream = await get_async_openai().chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": build_system_prompt(request.question, retrieved_chunks)},
+                    ],
+                    temperature=settings["temperature"],
+                    stream=True,
+                )
+                parts = []
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if not token:
+                        continue
+                    if not parts:
+                        timings["time_to_first_token_ms"] = _elapsed_ms(request_start)
+                    parts.append(token)
+                    yield _sse("token", {"token": token})
+                query_cache.answers.set(answer_key, "".join(parts))
+        _record_query(cached, context_stats)
+        timings["generate_ms"] = _elapsed_ms(start)
+        timings["total_ms"] = _elapsed_ms(request_start)
+
+        yield _sse("done", {"question": request.question, "cached": cached, "timings": timings,
+                            "context": context_stats, "rerank": rerank_stats})
+
+    except Exception as e:
+        yield _sse("error", {"error": str(e)})
@@ -1,8 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import json
-import os
 from typing import Optional
+from app.services.settings import DEFAULT_SETTINGS, settings_store
 
 router = APIRouter(prefix="/settings")
 
@@ -16,33 +15,13 @@ class SettingsUpdate(BaseModel):
     theme: Optional[str] = None
     batch_processing: Optional[bool] = None
 
-DEFAULT_SETTINGS = {
-    "chunk_size": 1000,
-    "chunk_overlap": 200,
-    "top_k_retrieval": 10,
-    "temperature": 0.7,
-    "model": "gpt-3.5-turbo",
-    "typewriter_speed": 50,
-    "theme": "light",
-    "batch_processing": True
-}
-
-SETTINGS_FILE = "settings.json"
-
 def load_settings():
-    """Load settings from JSON file or return defaults"""
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return DEFAULT_SETTINGS.copy()
-    return DEFAULT_SETTINGS.copy()
+    """Current settings, served from memory and reloaded when the file changes"""
+    return settings_store.get()
 
 def save_settings(settings: dict):
-    """Save settings to JSON file"""
-    with open(SETTINGS_FILE, 'w') as f:
-        json.dump(settings, f, indent=2)
+    """Atomically save settings to the JSON file"""
+    return settings_store.save(settings)
 
 @router.get("")
 def get_settings():
@@ -71,7 +50,7 @@ def update_settings(settings_update: SettingsUpdate):
     if current_settings.get("top_k_retrieval") and current_settings["top_k_retrieval"] < 1:
         raise HTTPException(status_code=400, detail="Top-K retrieval must be at least 1")
     
-    save_settings(current_settings)
+    current_settings = save_settings(current_settings)
     return {"message": "Settings updated successfully", "settings": current_settings}
 
 @router.post("/reset")
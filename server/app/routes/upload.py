@@ -1,117 +1,77 @@
 import json
-import os
 import asyncio
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.services.parsing import parse_file, parse_raw_bird_text, birds_list_to_string
-from app.services import chunking
-from app.services import embedding
-from app.services import storage
-from supabase import create_client, Client
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
+from app.services import jobs
+from app.services.embedding import EmbeddingError
+from app.services import pipeline
+from app.services.parsing import upload_source
+from app.services.settings import get_settings
+from app.services.shared_state import shared_state
 from dotenv import load_dotenv
+import os
 
 load_dotenv()
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_ANON_KEY")
-)
+# Files of one /upload/batch request ingested at the same time
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
-# ... rest of your existing code
 
-router = APIRouter(prefix="/upload", tags=["upload"])
+def _get_job_queue() -> jobs.JobQueue:
+    if jobs.job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue is not running")
+    return jobs.job_queue
+
+
+async def _ingest(file: UploadFile, settings: dict, processing_steps: Optional[list] = None) -> dict:
+    """
+    Ingest an upload and wait for the result. The writer worker parses it
+    in place; any other worker reads it into bytes and hands it over as a
+    job, waiting for the result.
+    """
+    if shared_state.is_writer:
+        # Parse from the spooled upload; only page-parallel PDF extraction
+        # writes it out again, to a temp file the worker processes can open
+        with upload_source(file) as source:
+            return await pipeline.ingest_document(file.filename, source, processing_steps, settings=settings)
+    return await _get_job_queue().run(file.filename, await file.read(), processing_steps)
+
 
 @router.post("")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), background: bool = False, settings: dict = Depends(get_settings)):
+    """
+    Upload and ingest a single file. Uploading a file again under the same
+    name updates the stored document in place when its content changed and
+    is skipped otherwise. With background=true the file is
+    queued and a job is returned immediately; poll /upload/jobs/{id} or
+    stream /upload/jobs/{id}/events for progress.
+    """
     if not file.filename.endswith((".pdf", ".docx")):
         raise HTTPException(status_code=400, detail="Unsupported file type")
     try:
-
-        existing_doc = supabase.table("documents").select("id").eq("filename", file.filename).execute()
-        
-        if existing_doc.data:
-            return {
-                "message": "File already uploaded",
-                "filename": file.filename,
-                "status": "skipped"
-            }
-        # Initialize processing steps
-        processing_steps = [
-            {"step": "uploading_file", "status": "completed"},
-            {"step": "parsing_text", "status": "pending"},
-            {"step": "creating_chunks", "status": "pending"},
-            {"step": "generating_embeddings", "status": "pending"},
-            {"step": "storing_in_vector_db", "status": "pending"}
-        ]
-
-        # 1. parse the file
-        text = parse_file(file)
-        processing_steps[1]["status"] = "completed"  # parsing_text completed
-        
-        cleaned_text_list = parse_raw_bird_text(text)
-        
-        if not text or len(text.strip()) == 0:
-            raise HTTPException(status_code=400, detail="No text found in the file")
-        
-        cleaned_text_str = birds_list_to_string(cleaned_text_list)
-        # Write cleaned text list to JSON file
-        output_dir = "data"
-        os.makedirs(output_dir, exist_ok=True)
-        
-        output_file = os.path.join(output_dir, "birds.json")
-        with open(output_file, "w") as f:
-            json.dump(cleaned_text_list, f, indent=2)
-        
-        # 2. chunk the text
-        chunks = chunking.chunk_text(cleaned_text_str, chunk_size=500, overlap=50)
-        processing_steps[2]["status"] = "completed"  # creating_chunks completed
-        
-        # 3. embed the chunks
-        embeddings = embedding.embed_chunks(chunks)
-        processing_steps[3]["status"] = "completed"  # generating_embeddings completed
-        
-        if not embeddings:
-            return {"error": "Failed to generate embeddings"}
-        
-        #4. create metadata object for each chunk
-        metadata_list = [
-            {
-                "file_name": file.filename,
-                "chunk_index": i
-            }
-            for i in range(len(chunks))
-        ]
-
-        # 5. Store in vector DB (Chroma)
-        storage.store_embeddings(chunks, embeddings, metadata_list)
-        processing_steps[4]["status"] = "completed"  # storing_in_vector_db completed
-
-        # Create chunk previews (first 2 chunks with truncated text)
-        chunk_previews = []
-        for i, chunk in enumerate(chunks[:2]):  # Show first 2 chunks
-            preview_text = chunk[:150] + "..." if len(chunk) > 150 else chunk
-            chunk_previews.append({
-                "index": i,
-                "preview": preview_text,
-                "full_length": len(chunk)
-            })
-
-        return {
-            "filename": file.filename,
-            "num_chunks": len(chunks),
-            "chunk_previews": chunk_previews,
-            "embedding_preview": embeddings[0][:5] if embeddings else [],
-            "processing_steps": processing_steps
-        }
+        if background:
+            return await _get_job_queue().submit(file.filename, await file.read())
+        return await _ingest(file, settings)
+    except pipeline.IngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EmbeddingError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/batch")
-async def upload_files_batch(files: list[UploadFile] = File(...)):
+async def upload_files_batch(files: list[UploadFile] = File(...), background: bool = False,
+                             settings: dict = Depends(get_settings)):
     """
-    Upload multiple files simultaneously for batch processing.
+    Upload multiple files simultaneously for batch processing, at most
+    UPLOAD_BATCH_CONCURRENCY at a time, or one at a time when the
+    batch_processing setting is off.
+    With background=true one job per file is queued and returned immediately.
     """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
@@ -121,93 +81,36 @@ async def upload_files_batch(files: list[UploadFile] = File(...)):
         if not file.filename.endswith((".pdf", ".docx")):
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
     
+    if background:
+        queue = _get_job_queue()
+        queued = [await queue.submit(file.filename, await file.read()) for file in files]
+        return {"jobs": queued, "total_files": len(files)}
+
     results = []
     
     try:
-        # Process all files in parallel
-        
+        # Process files in parallel, a bounded number at a time
+        semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
         async def process_single_file(file: UploadFile):
+            processing_steps = pipeline.new_processing_steps()
             try:
-                # Initialize processing steps for this file
-                processing_steps = [
-                    {"step": "uploading_file", "status": "completed"},
-                    {"step": "parsing_text", "status": "pending"},
-                    {"step": "creating_chunks", "status": "pending"},
-                    {"step": "generating_embeddings", "status": "pending"},
-                    {"step": "storing_in_vector_db", "status": "pending"}
-                ]
-
-                # 1. parse the file
-                text = parse_file(file)
-                processing_steps[1]["status"] = "completed"
-                
-                cleaned_text_list = parse_raw_bird_text(text)
-                
-                if not text or len(text.strip()) == 0:
-                    return {
-                        "filename": file.filename,
-                        "error": "No text found in the file",
-                        "processing_steps": processing_steps
-                    }
-                
-                cleaned_text_str = birds_list_to_string(cleaned_text_list)
-                
-                # 2. chunk the text
-                chunks = chunking.chunk_text(cleaned_text_str, chunk_size=500, overlap=50)
-                processing_steps[2]["status"] = "completed"
-                
-                # 3. embed the chunks
-                embeddings = embedding.embed_chunks(chunks)
-                processing_steps[3]["status"] = "completed"
-                
-                if not embeddings:
-                    return {
-                        "filename": file.filename,
-                        "error": "Failed to generate embeddings",
-                        "processing_steps": processing_steps
-                    }
-                
-                # 4. create metadata object for each chunk
-                metadata_list = [
-                    {
-                        "file_name": file.filename,
-                        "chunk_index": i
-                    }
-                    for i in range(len(chunks))
-                ]
-
-                # 5. Store in vector DB (Chroma)
-                storage.store_embeddings(chunks, embeddings, metadata_list)
-                processing_steps[4]["status"] = "completed"
-
-                # Create chunk previews
-                chunk_previews = []
-                for i, chunk in enumerate(chunks[:2]):
-                    preview_text = chunk[:150] + "..." if len(chunk) > 150 else chunk
-                    chunk_previews.append({
-                        "index": i,
-                        "preview": preview_text,
-                        "full_length": len(chunk)
-                    })
+                async with semaphore:
+                    return await _ingest(file, settings, processing_steps)
 
-                return {
-                    "filename": file.filename,
-                    "num_chunks": len(chunks),
-                    "chunk_previews": chunk_previews,
-                    "embedding_preview": embeddings[0][:5] if embeddings else [],
-                    "processing_steps": processing_steps
-                }
-                
             except Exception as e:
                 return {
                     "filename": file.filename,
                     "error": str(e),
-                    "processing_steps": processing_steps if 'processing_steps' in locals() else []
+                    "processing_steps": processing_steps
                 }
         
-        # Process all files concurrently
-        tasks = [process_single_file(file) for file in files]
-        results = await asyncio.gather(*tasks)
+        if settings["batch_processing"]:
+            # Process files concurrently
+            tasks = [process_single_file(file) for file in files]
+            results = await asyncio.gather(*tasks)
+        else:
+            results = [await process_single_file(file) for file in files]
         
         return {
             "batch_results": results,
@@ -217,4 +120,25 @@ async def upload_files_batch(files: list[UploadFile] = File(...)):
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status, processing steps and result of an ingestion job."""
+    job = await asyncio.to_thread(_get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    """Server-sent events with the job state after every step change."""
+    queue = _get_job_queue()
+    if await asyncio.to_thread(queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in queue.events(job_id):
+            yield f"data: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
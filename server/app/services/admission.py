@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from app.services import metrics
+
+# Requests handled at once per route group (0 = unlimited), requests allowed
+# to wait for a slot, and seconds one may wait before it is turned away
+QUERY_MAX_CONCURRENCY = int(os.getenv("QUERY_MAX_CONCURRENCY", "32"))
+QUERY_MAX_QUEUE = int(os.getenv("QUERY_MAX_QUEUE", "64"))
+QUERY_QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", "10"))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+UPLOAD_MAX_QUEUE = int(os.getenv("UPLOAD_MAX_QUEUE", "16"))
+UPLOAD_QUEUE_TIMEOUT = float(os.getenv("UPLOAD_QUEUE_TIMEOUT", "30"))
+
+# Callers of shared embedding and storage capacity, most urgent first
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = ("interactive", "bulk")
+
+# Route templates admitted through each group's limiter; other routes are not limited
+ROUTE_GROUPS = {
+    "/query": "query",
+    "/query/batch": "query",
+    "/upload": "upload",
+    "/upload/batch": "upload",
+}
+
+T = TypeVar("T")
+
+
+class Overloaded(Exception):
+    """A request turned away by admission control, with the Retry-After hint in seconds."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class RouteLimiter:
+    """
+    Concurrency limit with a bounded FIFO queue for one route group, used
+    on the event loop. A request over the limit waits for a slot; when
+    max_queue requests are already waiting it gets a 429 at once, and
+    one that waits longer than queue_timeout gets a 503. Both carry a
+    Retry-After estimated from the queue length and recent request times.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        # Moving average of the time a request holds its slot
+        self.service_seconds = 1.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil((self.queued + 1) * self.service_seconds / max(1, self.limit)))
+
+    def _report(self):
+        metrics.admission_queue_depth.set(self.queued, group=self.name)
+        metrics.admission_in_flight.set(self.in_flight, group=self.name)
+
+    def _reject(self, status_code: int, reason: str, detail: str):
+        metrics.admission_rejected_total.inc(group=self.name, reason=reason)
+        raise Overloaded(status_code, detail, self.retry_after())
+
+    async def acquire(self):
+        if self.limit <= 0:
+            return
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            metrics.admission_wait_seconds.observe(0.0, group=self.name)
+            self._report()
+            return
+        if self.queued >= self.max_queue:
+            self._reject(429, "queue_full", f"Too many {self.name} requests waiting, try again later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._report()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self._reject(503, "timeout", f"No {self.name} capacity within {self.queue_timeout:g}s, try again later")
+        except asyncio.CancelledError:
+            # The client went away; hand the slot on if it was already ours
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self._forget(waiter)
+            raise
+        metrics.admission_wait_seconds.observe(time.perf_counter() - start, group=self.name)
+
+    def _forget(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._report()
+
+    def release(self, elapsed: float):
+        if self.limit <= 0:
+            return
+        if elapsed:
+            self.service_seconds = 0.9 * self.service_seconds + 0.1 * elapsed
+        # The slot passes straight to the oldest waiter still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._report()
+                return
+        self.in_flight -= 1
+        self._report()
+
+
+class PriorityLimiter:
+    """
+    Concurrent calls to a capacity shared by queries and ingestion, such as
+    the embeddings API or Supabase. Waiting interactive callers are let in
+    before bulk ones, and bulk callers never hold more than
+    capacity - reserve slots, so a query waits for at most one call to
+    finish rather than behind a whole batch upload. Used from worker
+    threads: `with limiter.slot(BULK):` or limiter.run(BULK, fn, *args),
+    and from the event loop with `await limiter.run_async(INTERACTIVE, fn, *args)`.
+    """
+
+    def __init__(self, name: str, capacity: int, reserve: int = 0):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.reserve = max(0, min(reserve, self.capacity - 1))
+        self.in_use = [0, 0]
+        self.waiting = [0, 0]
+        self._cond = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _can_enter(self, priority: int) -> bool:
+        if sum(self.in_use) >= self.capacity:
+            return False
+        if priority == INTERACTIVE:
+            return True
+        return not self.waiting[INTERACTIVE] and self.in_use[BULK] < self.capacity - self.reserve
+
+    def _report(self, priority: int):
+        metrics.capacity_queue_depth.set(self.waiting[priority], resource=self.name,
+                                         priority=PRIORITY_NAMES[priority])
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE):
+        start = time.perf_counter()
+        with self._cond:
+            self.waiting[priority] += 1
+            self._report(priority)
+            try:
+                self._cond.wait_for(lambda: self._can_enter(priority))
+            finally:
+                self.waiting[priority] -= 1
+                self._report(priority)
+            self.in_use[priority] += 1
+        metrics.capacity_wait_seconds.observe(time.perf_counter() - start, resource=self.name,
+                                              priority=PRIORITY_NAMES[priority])
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use[priority] -= 1
+                self._cond.notify_all()
+
+    def run(self, priority: int, fn: Callable[..., T], *args, **kwargs) -> T:
+        with self.slot(priority):
+            return fn(*args, **kwargs)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._cond:
+            if self._executor is None:
+                # No more threads than slots: callers beyond that queue here
+                # instead of blocking threads of the loop's default executor
+                self._executor = ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix=self.name)
+            return self._executor
+
+    async def run_async(self, priority: int, fn: Callable[..., T], *args, **kwargs) -> T:
+        """run() from the event loop, in this limiter's own threads."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), functools.partial(self.run, priority, fn, *args, **kwargs))
+
+    def shutdown(self):
+        """Stop the threads of run_async(). Called on application shutdown."""
+        with self._cond:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+route_limiters: Dict[str, RouteLimiter] = {
+    "query": RouteLimiter("query", QUERY_MAX_CONCURRENCY, QUERY_MAX_QUEUE, QUERY_QUEUE_TIMEOUT),
+    "upload": RouteLimiter("upload", UPLOAD_MAX_CONCURRENCY, UPLOAD_MAX_QUEUE, UPLOAD_QUEUE_TIMEOUT),
+}
+
+
+async def _send_overloaded(send, error: Overloaded):
+    body = json.dumps({"detail": error.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": error.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(error.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting requests to the routes in ROUTE_GROUPS
+    through their group's RouteLimiter. The slot is held until the
+    response, including a streamed one, is complete. Requests that cannot
+    be admitted are answered with 429 or 503 and a Retry-After header
+    before the body is read.
+    """
+
+    def __init__(self, app, limiters: Optional[Dict[str, RouteLimiter]] = None, groups: Optional[Dict[str, str]] = None):
+        self.app = app
+        self.limiters = route_limiters if limiters is None else limiters
+        self.groups = ROUTE_GROUPS if groups is None else groups
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        limiter = self.limiters.get(self.groups.get(metrics.route_path(scope)))
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            await limiter.acquire()
+        except Overloaded as error:
+            return await _send_overloaded(send, error)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
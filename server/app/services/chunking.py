@@ -1,3 +1,20 @@
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.tokens import count_tokens_many
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "16"))
+
+# A paragraph ends before a blank line, a sentence after its closing
+# punctuation (and any quotes or brackets) when whitespace follows
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s)")
+_NON_SPACE = re.compile(r"\S")
+_WORD = re.compile(r"\S+")
+
+
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 50) -> list[str]:
     """
     Chunk the text into smaller chunks of a specified size.
@@ -5,7 +22,7 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 50) -> list[str
     chunks = []
     start = 0
     text_length = len(text)
-    
+
     while start < text_length:
         end = start + chunk_size
         chunk = text[start:end]
@@ -13,4 +30,152 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 50) -> list[str
         start += chunk_size - overlap
 
     return chunks
-    
\ No newline at end of file
+
+
+def _spans(text: str, pos: int, endpos: int, boundary: re.Pattern, include_boundary: bool) -> Iterator[Tuple[int, int]]:
+    """
+    (start, end) of the pieces of text[pos:endpos] separated by boundary,
+    each starting at its first non-space character. Searching for the next
+    boundary is much faster than matching each piece with a lazy pattern.
+    """
+    while True:
+        first = _NON_SPACE.search(text, pos, endpos)
+        if first is None:
+            return
+        start = first.start()
+        found = boundary.search(text, start + 1, endpos)
+        if found is None:
+            end = endpos
+        else:
+            end = found.end() if include_boundary else found.start()
+        yield start, end
+        pos = end
+
+
+def _iter_units(pages: Iterable[Tuple[Optional[int], str]], max_tokens: int, split_tokens: int) -> Iterator[Dict]:
+    """
+    Split a stream of (page number, text) pairs into sentence units with
+    document-level character offsets. Sentences longer than max_tokens are
+    split on word boundaries into pieces of split_tokens, leaving room for
+    overlap in front of each piece. Tokens are counted a page at a time.
+    """
+    offset = 0
+    for page, page_text in pages:
+        sentences = []
+        for paragraph_start, paragraph_end in _spans(page_text, 0, len(page_text), _PARAGRAPH_BREAK, False):
+            first = True
+            for start, end in _spans(page_text, paragraph_start, paragraph_end, _SENTENCE_END, True):
+                sentences.append((start, end, " ".join(page_text[start:end].split()), first))
+                first = False
+
+        token_counts = count_tokens_many([text for _, _, text, _ in sentences])
+        for (start, end, text, first), tokens in zip(sentences, token_counts):
+            if tokens <= max_tokens:
+                yield {"text": text, "page": page, "start": offset + start, "end": offset + end,
+                       "tokens": tokens, "paragraph_start": first}
+                continue
+
+            # Oversized sentence: pack words up to the budget
+            all_words = list(_WORD.finditer(page_text, start, end))
+            costs = count_tokens_many([word.group() + " " for word in all_words])
+            words: List[re.Match] = []
+            word_tokens = 0
+            for word, cost in zip(all_words, costs):
+                if words and word_tokens + cost > split_tokens:
+                    yield {"text": " ".join(w.group() for w in words), "page": page,
+                           "start": offset + words[0].start(), "end": offset + words[-1].end(),
+                           "tokens": word_tokens, "paragraph_start": first}
+                    first = False
+                    words, word_tokens = [], 0
+                words.append(word)
+                word_tokens += cost
+            if words:
+                yield {"text": " ".join(w.group() for w in words), "page": page,
+                       "start": offset + words[0].start(), "end": offset + words[-1].end(),
+                       "tokens": word_tokens, "paragraph_start": first}
+        offset += len(page_text)
+
+
+def _tail(unit: Dict, max_tokens: int) -> Dict:
+    """The trailing words of a sentence that fit in max_tokens, used as overlap."""
+    # Every word costs at least one token, so no more than max_tokens can fit
+    words = unit["text"].rsplit(" ", max_tokens)[-max_tokens:] if max_tokens > 0 else []
+    kept: List[str] = []
+    tokens = 0
+    for word, cost in zip(reversed(words), reversed(count_tokens_many([word + " " for word in words]))):
+        if tokens + cost > max_tokens:
+            break
+        kept.append(word)
+        tokens += cost
+    text = " ".join(reversed(kept))
+    return {"text": text, "page": unit["page"], "start": unit["end"] - len(text), "end": unit["end"],
+            "tokens": tokens, "paragraph_start": False}
+
+
+def _make_chunk(units: List[Dict]) -> Dict:
+    parts = []
+    for i, unit in enumerate(units):
+        if i:
+            parts.append("\n\n" if unit["paragraph_start"] else " ")
+        parts.append(unit["text"])
+    pages = [unit["page"] for unit in units if unit["page"] is not None]
+    return {
+        "text": "".join(parts),
+        "page_start": min(pages) if pages else None,
+        "page_end": max(pages) if pages else None,
+        "char_start": units[0]["start"],
+        "char_end": units[-1]["end"],
+        "tokens": sum(unit["tokens"] for unit in units),
+    }
+
+
+def iter_chunks(pages: Iterable[Tuple[Optional[int], str]], max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Dict]:
+    """
+    Pack sentences from a stream of (page number, text) pairs into chunks
+    of at most max_tokens, never cutting a sentence unless it alone is over
+    budget. Chunks prefer to end at paragraph boundaries once half full,
+    and start with up to overlap_tokens of trailing text from the previous
+    chunk (whole sentences when they fit, otherwise the last words).
+
+    Yields dicts with text, page_start, page_end, char_start, char_end and
+    tokens. Only the sentences of the current chunk are held in memory.
+    """
+    window: List[Dict] = []
+    window_tokens = 0
+    fresh = False  # window holds sentences not yet emitted
+
+    for unit in _iter_units(pages, max_tokens, max(1, max_tokens - overlap_tokens)):
+        full = window_tokens + unit["tokens"] > max_tokens
+        at_paragraph = unit["paragraph_start"] and window_tokens >= max_tokens // 2
+        if fresh and (full or at_paragraph):
+            yield _make_chunk(window)
+
+            kept: List[Dict] = []
+            kept_tokens = 0
+            for previous in reversed(window):
+                if kept_tokens + previous["tokens"] > overlap_tokens:
+                    tail = _tail(previous, overlap_tokens)
+                    if not kept and tail["text"]:
+                        kept, kept_tokens = [tail], tail["tokens"]
+                    break
+                kept.insert(0, previous)
+                kept_tokens += previous["tokens"]
+            if kept_tokens + unit["tokens"] > max_tokens:
+                kept, kept_tokens = [], 0
+            window, window_tokens, fresh = kept, kept_tokens, False
+        elif full:
+            # Only overlap left in the window and no room for the next sentence
+            window, window_tokens = [], 0
+
+        window.append(unit)
+        window_tokens += unit["tokens"]
+        fresh = True
+
+    if fresh:
+        yield _make_chunk(window)
+
+
+def chunk_document(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Dict]:
+    """Chunk a single string; page numbers are unknown."""
+    return list(iter_chunks([(None, text)], max_tokens, overlap_tokens))
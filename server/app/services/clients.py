@@ -0,0 +1,127 @@
+import os
+import threading
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+from supabase import Client, create_client
+from supabase.lib.client_options import SyncClientOptions
+
+load_dotenv()
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # optional, clients fall back to HTTP/1.1
+    HTTP2_AVAILABLE = False
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and HTTP2_AVAILABLE
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class ClientRegistry:
+    """
+    One pooled client per external service, shared by every route and
+    background worker so connections and TLS sessions are reused:
+    - supabase: PostgREST over a keep-alive httpx.Client
+    - openai: sync OpenAI client, used from worker threads
+    - async_openai: AsyncOpenAI client for streaming on the event loop
+
+    start() is called from the FastAPI lifespan and close() on shutdown.
+    Otherwise each accessor creates only its own client on first use, so
+    scripts and benchmarks that only embed need no Supabase settings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._supabase: Optional[Client] = None
+        self._openai: Optional[OpenAI] = None
+        self._async_openai: Optional[AsyncOpenAI] = None
+        self._http: list = []
+
+    @property
+    def started(self) -> bool:
+        return any(client is not None for client in (self._supabase, self._openai, self._async_openai))
+
+    def start(self, supabase_client=None):
+        """
+        Create every pooled client up front. supabase_client replaces the
+        Supabase client, e.g. with the in-memory backend for offline
+        benchmarks.
+        """
+        if supabase_client is not None:
+            with self._lock:
+                self._supabase = supabase_client
+        self.supabase()
+        self.openai()
+        self.async_openai()
+
+    async def aclose(self):
+        """Close every pooled connection. The registry can be started again."""
+        with self._lock:
+            http, self._http = self._http, []
+            self._supabase = self._openai = self._async_openai = None
+        for client in http:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                client.close()
+
+    def _pool(self, client_class, **kwargs):
+        # Called with the lock held
+        client = client_class(http2=HTTP2_ENABLED, limits=_limits(),
+                              timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0), **kwargs)
+        self._http.append(client)
+        return client
+
+    def supabase(self) -> Client:
+        if self._supabase is None:
+            with self._lock:
+                if self._supabase is None:
+                    self._supabase = create_client(
+                        os.getenv("SUPABASE_URL"),
+                        os.getenv("SUPABASE_ANON_KEY"),
+                        options=SyncClientOptions(httpx_client=self._pool(httpx.Client, follow_redirects=True)),
+                    )
+        return self._supabase
+
+    def openai(self) -> OpenAI:
+        if self._openai is None:
+            with self._lock:
+                if self._openai is None:
+                    self._openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=self._pool(httpx.Client))
+        return self._openai
+
+    def async_openai(self) -> AsyncOpenAI:
+        if self._async_openai is None:
+            with self._lock:
+                if self._async_openai is None:
+                    self._async_openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                                                     http_client=self._pool(httpx.AsyncClient))
+        return self._async_openai
+
+clients = ClientRegistry()
+
+
+def get_supabase() -> Client:
+    return clients.supabase()
+
+
+def get_openai() -> OpenAI:
+    return clients.openai()
+
+
+def get_async_openai() -> AsyncOpenAI:
+    return clients.async_openai()
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.tokens import count_tokens
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+# Estimated Jaccard similarity of word shingles above which a chunk counts as a duplicate
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+_MINHASH_PERMUTATIONS = 64
+_SHINGLE_WORDS = 3
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0)
+_MINHASH_A = _rng.integers(1, _PRIME, size=_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_B = _rng.integers(0, _PRIME, size=_MINHASH_PERMUTATIONS, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of the word 3-shingles in text."""
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(max(1, len(words) - _SHINGLE_WORDS + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") >> 3 for s in shingles],
+        dtype=np.uint64,
+    )
+    # (a * x + b) mod p; the products wrap in uint64, which is fine for hashing
+    return ((np.outer(hashes, _MINHASH_A) + _MINHASH_B) % _PRIME).min(axis=0)
+
+
+def _word_overlap(previous: str, following: str) -> int:
+    """Number of words at the end of previous repeated at the start of following."""
+    a, b = previous.split(), following.split()
+    for n in range(min(len(a), len(b)), 0, -1):
+        if a[-n:] == b[:n]:
+            return n
+    return 0
+
+
+def _merge_adjacent(matches: List[Dict]) -> List[Dict]:
+    """
+    Group retrieved chunks into blocks, joining consecutive chunks of the same
+    file into one block with the repeated overlap removed. Blocks keep the
+    rank of their best chunk.
+    """
+    blocks: List[Dict] = []
+    by_position: Dict[Tuple[str, int], Dict] = {}
+
+    def position(item):
+        metadata = item[1].get("metadata") or {}
+        index = metadata.get("chunk_index")
+        return str(metadata.get("file_name")), -1 if index is None else index
+
+    for rank, match in sorted(enumerate(matches), key=position):
+        metadata = match.get("metadata") or {}
+        file_name, index = metadata.get("file_name"), metadata.get("chunk_index")
+        previous = by_position.get((file_name, index - 1)) if index is not None else None
+        if previous is not None:
+            overlap = _word_overlap(previous["text"], match["content"])
+            words = match["content"].split()
+            if overlap < len(words):
+                previous["text"] += " " + " ".join(words[overlap:])
+            previous["matches"].append(match)
+            previous["rank"] = min(previous["rank"], rank)
+            block = previous
+        else:
+            block = {"text": match["content"], "matches": [match], "rank": rank}
+            blocks.append(block)
+        if index is not None:
+            by_position[(file_name, index)] = block
+    blocks.sort(key=lambda block: block["rank"])
+    return blocks
+
+
+def build_context(matches: List[Dict], max_tokens: Optional[int] = None,
+                  dedup_threshold: Optional[float] = None) -> Tuple[List[str], List[Dict], Dict]:
+    """
+    Assemble retrieved chunks (best first) into prompt context:
+    - adjacent chunks of the same file are merged, dropping the overlap
+    - near-duplicate blocks (MinHash Jaccard >= dedup_threshold) are dropped
+    - blocks are added in rank order while they fit in max_tokens
+
+    Returns the context texts, the matches they were built from, and stats
+    with retrieved, used and saved token counts.
+    """
+    max_tokens = CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+    dedup_threshold = CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+    retrieved_tokens = sum(count_tokens(match["content"]) for match in matches)
+
+    blocks = _merge_adjacent(matches)
+    kept: List[Dict] = []
+    signatures: List[np.ndarray] = []
+    duplicates = 0
+    over_budget = 0
+    used_tokens = 0
+    for block in blocks:
+        signature = minhash(block["text"])
+        if any(np.mean(signature == other) >= dedup_threshold for other in signatures):
+            duplicates += 1
+            continue
+        tokens = count_tokens(block["text"])
+        if used_tokens + tokens > max_tokens:
+            over_budget += 1
+            continue
+        signatures.append(signature)
+        kept.append(block)
+        used_tokens += tokens
+
+    stats = {
+        "retrieved_chunks": len(matches),
+        "context_blocks": len(kept),
+        "merged_chunks": len(matches) - len(blocks),
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+        "tokens_retrieved": retrieved_tokens,
+        "tokens_used": used_tokens,
+        "tokens_saved": retrieved_tokens - used_tokens,
+    }
+    return [block["text"] for block in kept], [match for block in kept for match in block["matches"]], stats
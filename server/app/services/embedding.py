@@ -1,27 +1,276 @@
-from typing import List
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+import random
+import threading
+import time
+import openai
 from openai import OpenAI
 import os
 
-def embed_chunks(chunks: List[str]) -> List[List[float]]:
+from app.services.admission import INTERACTIVE, PriorityLimiter
+from app.services.clients import get_openai
+from app.services import metrics
+from app.services.embedding_cache import cache_key, get_cache
+from app.services.tokens import count_tokens, limit_tokens
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Shortened embeddings via the API's dimensions parameter (0 = the model's full size)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+# Provider limits per request: number of inputs, total tokens and tokens per input
+EMBED_MAX_INPUTS = int(os.getenv("EMBED_MAX_INPUTS", "2048"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "250000"))
+EMBED_MAX_INPUT_TOKENS = 8191
+
+# Requests in flight across all callers, and tokens sent per minute (0 = unlimited)
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+# Of those, requests ingestion may not use, so question embeddings never queue behind it
+EMBED_INTERACTIVE_RESERVE = int(os.getenv("EMBED_INTERACTIVE_RESERVE", "1"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "0.5"))
+
+
+class EmbeddingError(Exception):
+    """Raised when some or all chunks could not be embedded."""
+
+
+@dataclass
+class EmbeddingResult:
     """
-    Call OpenAI's embedding API using the v1 client.
-    Returns a list of embedding vectors.
+    Embeddings in input order. Entries for inputs that failed are None and
+    their indices and error messages are listed in failed.
     """
+    embeddings: List[Optional[List[float]]]
+    failed: Dict[int, str] = field(default_factory=dict)
+    requests: int = 0  # batches sent, not counting retries
+    retries: int = 0
+    cache_hits: int = 0
 
-    # Initialize client once
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    @property
+    def ok(self) -> bool:
+        return not self.failed
 
-    if not chunks:
-        return []
+    def raise_for_failures(self):
+        if self.failed:
+            first_error = next(iter(self.failed.values()))
+            raise EmbeddingError(f"Failed to embed {len(self.failed)} of {len(self.embeddings)} chunks: {first_error}")
+
+
+class TokenBucket:
+    """Blocks callers until the tokens-per-minute budget allows another request."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int, borrow: bool = False):
+        """
+        Take tokens, sleeping until the budget allows. With borrow the
+        tokens are taken at once and the bucket may go into debt, which
+        later callers wait out; used for interactive requests.
+        """
+        if self.capacity <= 0:
+            return
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens or borrow:
+                    self.available -= tokens
+                    return
+                wait = (tokens - self.available) / self.rate
+            time.sleep(wait)
+
+
+_client: Optional[OpenAI] = None
+_client_base: Optional[OpenAI] = None
+_client_lock = threading.Lock()
+_dispatch_pool = ThreadPoolExecutor(max_workers=EMBED_MAX_CONCURRENCY, thread_name_prefix="embed-batch")
+_token_bucket = TokenBucket(EMBED_TOKENS_PER_MINUTE)
+_capacity = PriorityLimiter("embeddings", EMBED_MAX_CONCURRENCY, EMBED_INTERACTIVE_RESERVE)
+
+
+def get_client() -> OpenAI:
+    """The registry's OpenAI client, sharing its connection pool, without SDK retries."""
+    global _client, _client_base
+    base = get_openai()
+    with _client_lock:
+        if _client is None or _client_base is not base:
+            # Retries are handled here so they share the rate limit budget
+            _client, _client_base = base.with_options(max_retries=0), base
+    return _client
+
+
+def split_batches(token_counts: List[int], max_inputs: int = EMBED_MAX_INPUTS, max_tokens: int = EMBED_BATCH_TOKENS) -> List[List[int]]:
+    """Group input indices into batches under the per-request input and token limits."""
+    batches = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, tokens in enumerate(token_counts):
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _is_fatal(error: Exception) -> bool:
+    """Errors every batch of the call would hit alike, such as a bad API key, model or client setup."""
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError, openai.NotFoundError)):
+        return True
+    return not isinstance(error, openai.APIError)
 
-    try:
-        response = client.embeddings.create(
-            input=chunks,
-            model="text-embedding-3-small"
-        )
 
-        # Return list of vectors
-        return [item.embedding for item in response.data]
+def _retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return EMBED_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
 
+
+def _embed_batch(texts: List[str], tokens: int, model: str, dimensions: int = 0, priority: int = INTERACTIVE):
+    """
+    Send one batch, retrying rate limits and server errors. Returns (vectors, retries).
+    Every attempt holds one slot of the shared embeddings capacity at the given priority.
+    """
+    client = get_client()
+    options = {"dimensions": dimensions} if dimensions else {}
+    attempt = 0
+    while True:
+        _token_bucket.acquire(tokens, borrow=priority == INTERACTIVE)
+        try:
+            with _capacity.slot(priority):
+                response = client.embeddings.create(input=texts, model=model, **options)
+            vectors = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in vectors], attempt
+        except Exception as e:
+            if attempt >= EMBED_MAX_RETRIES or not _is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt))
+            attempt += 1
+
+
+def _run_inline(fn, *args) -> Future:
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
     except Exception as e:
-        return []
+        future.set_exception(e)
+    return future
+
+
+def embed_texts(chunks: List[str], model: str = EMBEDDING_MODEL, use_cache: bool = True,
+                dimensions: int = EMBEDDING_DIMENSIONS, priority: int = INTERACTIVE) -> EmbeddingResult:
+    """
+    Embed chunks in token-aware batches dispatched concurrently.
+    Chunks already in the embedding cache, or repeated within the call,
+    are not sent to the API. Failures are reported per input instead of
+    failing the whole call, except errors every batch would hit, such as
+    a bad API key or model: those cancel the remaining batches and raise
+    EmbeddingError. With dimensions the API returns shortened
+    vectors, cached separately from full-size ones. Ingestion passes
+    priority=BULK so queries get the embeddings capacity first; a single
+    batch is sent from the calling thread instead of queueing in the
+    dispatch pool behind other callers' batches.
+    """
+    result = EmbeddingResult(embeddings=[None] * len(chunks))
+    if not chunks:
+        return result
+
+    cache = get_cache() if use_cache else None
+    cache_model = f"{model}@{dimensions}" if dimensions else model
+    keys = [cache_key(chunk, cache_model) for chunk in chunks]
+    cached = cache.get_many(keys) if cache else {}
+
+    # One API input per distinct uncached key
+    pending: Dict[str, List[int]] = {}
+    for i, key in enumerate(keys):
+        if key in cached:
+            result.embeddings[i] = cached[key]
+            result.cache_hits += 1
+        else:
+            pending.setdefault(key, []).append(i)
+
+    unique = [positions[0] for positions in pending.values()]
+    token_counts = {i: count_tokens(chunks[i]) for i in unique}
+    # Request limits and the token budget use the padded estimate when tiktoken is missing
+    limit_counts = {i: limit_tokens(token_counts[i]) for i in unique}
+    for i in unique:
+        if limit_counts[i] > EMBED_MAX_INPUT_TOKENS:
+            result.failed[i] = f"Input has {limit_counts[i]} tokens, more than the {EMBED_MAX_INPUT_TOKENS} allowed"
+
+    indices = [i for i in unique if i not in result.failed]
+    batches = [
+        [indices[j] for j in batch]
+        for batch in split_batches([limit_counts[i] for i in indices], EMBED_MAX_INPUTS, EMBED_BATCH_TOKENS)
+    ]
+
+    result.requests = len(batches)
+    if cache:
+        metrics.cache_lookups_total.inc(result.cache_hits, cache="embedding", result="hit")
+        metrics.cache_lookups_total.inc(len(chunks) - result.cache_hits, cache="embedding", result="miss")
+    metrics.embedding_tokens_total.inc(sum(token_counts[i] for i in indices))
+    submit = _dispatch_pool.submit if len(batches) > 1 else _run_inline
+    futures = [
+        (batch, submit(
+            _embed_batch, [chunks[i] for i in batch], sum(limit_counts[i] for i in batch), model, dimensions, priority
+        ))
+        for batch in batches
+    ]
+    fresh: Dict[str, List[float]] = {}
+    for batch, future in futures:
+        try:
+            vectors, retries = future.result()
+            result.retries += retries
+            for i, vector in zip(batch, vectors):
+                fresh[keys[i]] = vector
+        except Exception as e:
+            if _is_fatal(e):
+                for _, pending_future in futures:
+                    pending_future.cancel()
+                raise EmbeddingError(f"Failed to embed {len(chunks)} chunks: {e}") from e
+            for i in batch:
+                result.failed[i] = str(e)
+
+    # Fan results and failures out to repeated chunks
+    for key, positions in pending.items():
+        first = positions[0]
+        for i in positions:
+            if key in fresh:
+                result.embeddings[i] = fresh[key]
+            elif i != first:
+                result.failed[i] = result.failed[first]
+
+    if cache:
+        cache.put_many(fresh)
+    return result
+
+
+def embed_chunks(chunks: List[str]) -> List[List[float]]:
+    """
+    Call OpenAI's embedding API using the shared v1 client.
+    Returns a list of embedding vectors, raising EmbeddingError if any chunk failed.
+    """
+    result = embed_texts(chunks)
+    result.raise_for_failures()
+    return result.embeddings
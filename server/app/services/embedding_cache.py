@@ -0,0 +1,140 @@
+import array
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.db")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+# Inserts between exact recounts of the table, which pick up entries
+# written and evicted by other worker processes sharing the file
+_RECOUNT_INTERVAL = 10000
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so trivial edits still hit the cache."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by a hash of the normalized chunk text
+    and the model name. Vectors are stored as packed float32 and the least
+    recently used entries are evicted once max_entries is exceeded.
+
+    The number of entries is tracked as rows are inserted rather than
+    counted on every write. hits and misses count every key looked up,
+    repeats included, like the cache lookup metrics.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries = self._count()
+        self._inserts_since_count = 0
+
+    def _count(self) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the keys that are present and mark them as used."""
+        requested = list(keys)
+        keys = list(dict.fromkeys(requested))
+        found: Dict[str, List[float]] = {}
+        with self._lock, self._conn:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array.array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            hits = sum(1 for key in requested if key in found)
+            self.hits += hits
+            self.misses += len(requested) - hits
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array.array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock, self._conn:
+            inserted = self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows).rowcount
+            if inserted < len(rows):
+                # Some keys were already stored, e.g. by another worker
+                self._conn.executemany("UPDATE embeddings SET vector = ?, last_used = ? WHERE key = ?",
+                                       [(blob, used, key) for key, blob, used in rows])
+            self._entries += inserted
+            self._inserts_since_count += inserted
+            self._evict()
+
+    def _evict(self):
+        if self._inserts_since_count >= _RECOUNT_INTERVAL:
+            self._entries, self._inserts_since_count = self._count(), 0
+        if self._entries <= self.max_entries:
+            return
+        # Count exactly before deleting anything
+        self._entries, self._inserts_since_count = self._count(), 0
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._entries = self.max_entries
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._count()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Shared cache instance, or None when EMBED_CACHE_PATH is empty."""
+    global _cache
+    if not EMBED_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES)
+    return _cache
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment is not None and moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    """
+    Restricts retrieval to chunks of the given documents or filenames,
+    whose metadata contains every key/value in metadata, and that were
+    stored within [uploaded_after, uploaded_before]. Empty fields do not
+    filter. The vector backends apply it inside the similarity search.
+    """
+    document_ids: Optional[List[str]] = None
+    filenames: Optional[List[str]] = None
+    metadata: Optional[Dict[str, Any]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "uploaded_after", _parse_time(self.uploaded_after))
+        object.__setattr__(self, "uploaded_before", _parse_time(self.uploaded_before))
+
+    def __bool__(self) -> bool:
+        return any(value is not None for value in (self.document_ids, self.filenames, self.metadata,
+                                                   self.uploaded_after, self.uploaded_before))
+
+    def key(self) -> tuple:
+        """Hashable form for cache keys."""
+        return (
+            tuple(sorted(self.document_ids or ())) if self.document_ids is not None else None,
+            tuple(sorted(self.filenames or ())) if self.filenames is not None else None,
+            tuple(sorted((k, repr(v)) for k, v in self.metadata.items())) if self.metadata else None,
+            self.uploaded_after,
+            self.uploaded_before,
+        )
+
+    def rpc_params(self) -> Dict[str, Any]:
+        """Extra match_chunks arguments; only the ones set, so the unfiltered call stays unchanged."""
+        params = {
+            "filter_document_ids": self.document_ids,
+            "filter_filenames": self.filenames,
+            "filter_metadata": self.metadata or None,
+            "filter_uploaded_after": self.uploaded_after.isoformat() if self.uploaded_after else None,
+            "filter_uploaded_before": self.uploaded_before.isoformat() if self.uploaded_before else None,
+        }
+        return {name: value for name, value in params.items() if value is not None}
+
+    @classmethod
+    def from_rpc_params(cls, params: Mapping[str, Any]) -> "ChunkFilter":
+        return cls(
+            document_ids=params.get("filter_document_ids"),
+            filenames=params.get("filter_filenames"),
+            metadata=params.get("filter_metadata"),
+            uploaded_after=params.get("filter_uploaded_after"),
+            uploaded_before=params.get("filter_uploaded_before"),
+        )
+
+    def _time_filtered(self) -> bool:
+        return self.uploaded_after is not None or self.uploaded_before is not None
+
+    def _matches_metadata(self, row: Mapping[str, Any]) -> bool:
+        metadata = row.get("metadata") or {}
+        return all(metadata.get(key) == value for key, value in self.metadata.items())
+
+    def _matches_time(self, created_at) -> bool:
+        created_at = _parse_time(created_at)
+        if created_at is None:
+            return False
+        if self.uploaded_after is not None and created_at < self.uploaded_after:
+            return False
+        if self.uploaded_before is not None and created_at > self.uploaded_before:
+            return False
+        return True
+
+    def matches(self, row: Mapping[str, Any]) -> bool:
+        """Whether a chunk row (id, document_id, metadata, created_at) passes the filter."""
+        if self.document_ids is not None and row.get("document_id") not in self.document_ids:
+            return False
+        if self.filenames is not None and (row.get("metadata") or {}).get("file_name") not in self.filenames:
+            return False
+        if self.metadata and not self._matches_metadata(row):
+            return False
+        return not self._time_filtered() or self._matches_time(row.get("created_at"))
+
+    def candidates(self, rows: List[Dict], by_document: Mapping[str, Iterable[int]],
+                   by_filename: Mapping[str, Iterable[int]], created: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Positions of the rows that pass, looked up through the per-document
+        and per-filename position maps of an index so a filter on a few
+        documents never touches the rest of the corpus. created holds the
+        rows' created_at as epoch seconds (NaN when unknown) to check the
+        upload window without parsing every timestamp.
+        """
+        positions = None
+        if self.document_ids is not None:
+            positions = {p for document_id in self.document_ids for p in by_document.get(document_id, ())}
+        if self.filenames is not None:
+            named = {p for filename in self.filenames for p in by_filename.get(filename, ())}
+            positions = named if positions is None else positions & named
+        if positions is None:
+            positions = np.arange(len(rows), dtype=np.int64)
+        else:
+            positions = np.array(sorted(positions), dtype=np.int64)
+            positions = positions[positions < len(rows)]
+
+        if self._time_filtered():
+            if created is not None:
+                times = created[positions]
+                keep = ~np.isnan(times)
+                if self.uploaded_after is not None:
+                    keep &= times >= self.uploaded_after.timestamp()
+                if self.uploaded_before is not None:
+                    keep &= times <= self.uploaded_before.timestamp()
+                positions = positions[keep]
+            else:
+                positions = positions[[self._matches_time(rows[p].get("created_at")) for p in positions]]
+        if self.metadata:
+            positions = positions[[self._matches_metadata(rows[p]) for p in positions]]
+        return positions.astype(np.int64)
+
+
+def created_epochs(rows: Iterable[Mapping[str, Any]]) -> List[float]:
+    """created_at of each row as epoch seconds, NaN when missing."""
+    epochs = []
+    for row in rows:
+        created_at = _parse_time(row.get("created_at"))
+        epochs.append(created_at.timestamp() if created_at is not None else float("nan"))
+    return epochs
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from app.services import pipeline
+from app.services.embedding import EmbeddingError
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Seconds between checks for jobs and job updates written by other worker processes
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class JobStore:
+    """
+    SQLite-backed job records. Uploaded bytes are kept in a separate table
+    until the job finishes so queued jobs can be resumed after a restart.
+    """
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                steps TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_payloads (
+                job_id TEXT PRIMARY KEY,
+                data BLOB NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _row_to_job(self, row) -> Dict:
+        return {
+            "id": row[0],
+            "filename": row[1],
+            "status": row[2],
+            "processing_steps": json.loads(row[3]),
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def create(self, filename: str, data: bytes) -> Dict:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        steps = pipeline.new_processing_steps()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, 'queued', ?, NULL, NULL, ?, ?)",
+                (job_id, filename, json.dumps(steps), now, now),
+            )
+            self._conn.execute("INSERT INTO job_payloads VALUES (?, ?)", (job_id, data))
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def payload(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM job_payloads WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, job_id: str, status: Optional[str] = None, steps: Optional[List[Dict]] = None,
+               result: Optional[Dict] = None, error: Optional[str] = None):
+        fields = {"updated_at": time.time()}
+        if status is not None:
+            fields["status"] = status
+        if steps is not None:
+            fields["steps"] = json.dumps(steps)
+        if result is not None:
+            fields["result"] = json.dumps(result)
+        if error is not None:
+            fields["error"] = error
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            if status in TERMINAL_STATUSES:
+                self._conn.execute("DELETE FROM job_payloads WHERE job_id = ?", (job_id,))
+
+    def unfinished(self) -> List[str]:
+        """Ids of jobs that were queued or running when the process stopped."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY created_at", TERMINAL_STATUSES
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def queued(self) -> List[str]:
+        """Ids of jobs waiting to run, oldest first, including ones submitted by other processes."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """
+    Runs ingestion jobs on a bounded pool of asyncio workers and pushes
+    every status change to subscribers of that job.
+
+    With several server processes only the writer (see shared_state)
+    starts the queue; the others only submit jobs to the shared store.
+    The running queue polls the store for jobs submitted elsewhere, and
+    events() polls it for updates made by another process. Store reads and
+    writes run in worker threads so SQLite never blocks the event loop.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.store = store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._enqueued: Set[str] = set()
+        # Latest step list per job not yet written, and the task writing it
+        self._pending_steps: Dict[str, List[Dict]] = {}
+        self._step_writers: Dict[str, asyncio.Task] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        # Resume anything that did not finish before the last shutdown
+        for job_id in await asyncio.to_thread(self.store.unfinished):
+            await asyncio.to_thread(self.store.update, job_id, status="queued", steps=pipeline.new_processing_steps())
+            self._enqueue(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._poll()))
+
+    async def stop(self):
+        tasks = self._tasks + list(self._step_writers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._enqueued:
+            self._enqueued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _poll(self):
+        """Pick up jobs other processes submitted to the shared store."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for job_id in await asyncio.to_thread(self.store.queued):
+                self._enqueue(job_id)
+
+    async def submit(self, filename: str, data: bytes) -> Dict:
+        job = await asyncio.to_thread(self.store.create, filename, data)
+        if self.running:
+            self._enqueue(job["id"])
+        return job
+
+    async def run(self, filename: str, data: bytes, processing_steps: Optional[List[Dict]] = None) -> Dict:
+        """
+        Submit a job and wait for it to finish, for a process that does not
+        ingest itself. Returns the ingestion result; a failed job raises
+        the IngestionError or EmbeddingError the ingestion raised, or a
+        RuntimeError. processing_steps is updated with the final steps.
+        """
+        job = await self.submit(filename, data)
+        async for job in self.events(job["id"]):
+            pass
+        if processing_steps is not None:
+            processing_steps[:] = job["processing_steps"]
+        if job["status"] == "completed":
+            return job["result"]
+        error_type = (job["result"] or {}).get("error_type")
+        error = {"IngestionError": pipeline.IngestionError, "EmbeddingError": EmbeddingError}.get(error_type, RuntimeError)
+        raise error(job["error"])
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def _update_and_get(self, job_id: str, changes: Dict) -> Optional[Dict]:
+        self.store.update(job_id, **changes)
+        return self.store.get(job_id)
+
+    async def _publish(self, job_id: str, **changes):
+        job = await asyncio.to_thread(self._update_and_get, job_id, changes)
+        for subscriber in self._subscribers.get(job_id, ()):
+            subscriber.put_nowait(job)
+
+    def _publish_steps(self, job_id: str, steps: List[Dict]):
+        """
+        on_step callback, called on the event loop. Only the latest steps
+        are kept; one task per job writes them, so updates that arrive
+        while a write is in progress are coalesced into the next one.
+        """
+        self._pending_steps[job_id] = [dict(step) for step in steps]
+        if job_id not in self._step_writers:
+            self._step_writers[job_id] = asyncio.create_task(self._write_steps(job_id))
+
+    async def _write_steps(self, job_id: str):
+        try:
+            while job_id in self._pending_steps:
+                await self._publish(job_id, steps=self._pending_steps.pop(job_id))
+        finally:
+            del self._step_writers[job_id]
+
+    async def _flush_steps(self, job_id: str):
+        """Wait until every step update of the job is written, before its final status."""
+        writer = self._step_writers.get(job_id)
+        if writer is not None:
+            await writer
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict]:
+        """Yield the job's current state, then every update until it finishes."""
+        updates: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(updates)
+        try:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            while job is not None:
+                yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    break
+                job = await self._next_update(job, updates)
+        finally:
+            self._subscribers[job_id].discard(updates)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+    async def _next_update(self, job: Dict, updates: asyncio.Queue) -> Optional[Dict]:
+        """The next pushed update, or the next change seen in the store when another process runs the job."""
+        while True:
+            try:
+                return await asyncio.wait_for(updates.get(), self.poll_interval)
+            except asyncio.TimeoutError:
+                latest = await asyncio.to_thread(self.store.get, job["id"])
+                if latest is None or latest["updated_at"] != job["updated_at"]:
+                    return latest
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._enqueued.discard(job_id)
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        data = await asyncio.to_thread(self.store.payload, job_id)
+        if job is None or data is None or job["status"] != "queued":
+            return
+
+        await self._publish(job_id, status="running")
+        try:
+            result = await pipeline.ingest_document(
+                job["filename"], data,
+                processing_steps=job["processing_steps"],
+                on_step=lambda steps: self._publish_steps(job_id, steps),
+            )
+            await self._flush_steps(job_id)
+            await self._publish(job_id, status="completed", result=result)
+        except Exception as e:
+            await self._flush_steps(job_id)
+            await self._publish(job_id, status="failed", result={"error_type": type(e).__name__}, error=str(e))
+
+
+job_queue: Optional[JobQueue] = None
+
+
+async def start_job_queue(run_jobs: bool = True) -> JobQueue:
+    """
+    Open the shared job store. Jobs are only run when run_jobs is set;
+    otherwise they wait for the process that does, see start().
+    """
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(JobStore(JOBS_DB), JOB_WORKERS)
+    if run_jobs and not job_queue.running:
+        await job_queue.start()
+    return job_queue
+
+
+async def stop_job_queue():
+    global job_queue
+    if job_queue is not None:
+        await job_queue.stop()
+        job_queue.store.close()
+        job_queue = None
@@ -0,0 +1,252 @@
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.filters import ChunkFilter, created_epochs
+from app.services.vector_index import live_mask, read_log, top_k_indices
+
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "false").lower() == "true"
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+
+# Keeps policy numbers, versions and codes like "hr-101", "4.2.1" or "w-2" whole
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Incrementally maintained BM25 inverted index over chunk content.
+
+    Postings are stored per term as two compact arrays, internal document
+    numbers (uint32) and term frequencies (uint16), scored with numpy views
+    over the same buffers. Deleted documents and chunks are tombstoned and
+    masked out at query time; compact() drops their postings.
+    Chunk rows are persisted append-only in LEXICAL_INDEX_DIR/rows.jsonl and
+    the postings are rebuilt from it on load; refresh() indexes what another
+    worker process appended since.
+    """
+
+    def __init__(self, directory: str = LEXICAL_INDEX_DIR, k1: float = 1.2, b: float = 0.75):
+        self.directory = directory
+        self.rows_path = os.path.join(directory, "rows.jsonl")
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.rows: List[Dict] = []
+        self.lengths = array("I")
+        self.postings: Dict[str, tuple] = {}
+        self.documents: Dict[str, array] = {}
+        self.positions: Dict[str, int] = {}
+        self.by_filename: Dict[str, array] = {}
+        self.created = array("d")  # created_at as epoch seconds
+        self.alive = bytearray()
+        self.live_count = 0
+        self.live_length = 0
+        # Bytes of rows.jsonl read so far and its inode, for refresh()
+        self._offset = 0
+        self._inode: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def _load(self):
+        records, self._offset, self._inode = read_log(self.rows_path)
+        rows, alive = live_mask(records)
+        self._index([row for row, live in zip(rows, alive) if live])
+
+    def _reset(self):
+        self.rows, self.lengths, self.postings = [], array("I"), {}
+        self.documents, self.positions, self.by_filename = {}, {}, {}
+        self.created = array("d")
+        self.alive = bytearray()
+        self.live_count = self.live_length = 0
+
+    def refresh(self):
+        """
+        Index rows and apply tombstones another process appended since the
+        last load or refresh. Reloads everything when the rows file was
+        replaced by compact().
+        """
+        with self._lock:
+            records, offset, inode = read_log(self.rows_path, self._offset)
+            if inode != self._inode:
+                self._reset()
+                self._load()
+                return
+            self._offset = offset
+            for record in records:
+                if "deleted_document" in record:
+                    self._forget_document(record["deleted_document"])
+                elif "deleted_chunks" in record:
+                    self._forget_chunks(record["deleted_chunks"])
+                else:
+                    self._index([record])
+
+    def _index(self, rows: List[Dict]):
+        self.created.extend(created_epochs(rows))
+        for row in rows:
+            doc = len(self.rows)
+            terms = Counter(tokenize(row["content"]))
+            length = sum(terms.values())
+            self.rows.append(row)
+            self.lengths.append(length)
+            self.alive.append(1)
+            self.documents.setdefault(row["document_id"], array("I")).append(doc)
+            self.positions[row["id"]] = doc
+            self.by_filename.setdefault((row.get("metadata") or {}).get("file_name"), array("I")).append(doc)
+            self.live_count += 1
+            self.live_length += length
+            for term, freq in terms.items():
+                docs, freqs = self.postings.setdefault(term, (array("I"), array("H")))
+                docs.append(doc)
+                freqs.append(min(freq, 65535))
+
+    def add(self, rows: List[Dict]):
+        """Index chunk rows (id, document_id, content, metadata) after they are stored."""
+        if not rows:
+            return
+        with self._lock:
+            with open(self.rows_path, "a") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                self._offset, self._inode = f.tell(), os.fstat(f.fileno()).st_ino
+            self._index(rows)
+
+    def delete_document(self, document_id: str):
+        with self._lock:
+            with open(self.rows_path, "a") as f:
+                f.write(json.dumps({"deleted_document": document_id}) + "\n")
+                self._offset, self._inode = f.tell(), os.fstat(f.fileno()).st_ino
+            self._forget_document(document_id)
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        """Drop individual chunks, e.g. the ones removed by re-ingesting an edited document."""
+        if not chunk_ids:
+            return
+        with self._lock:
+            with open(self.rows_path, "a") as f:
+                f.write(json.dumps({"deleted_chunks": list(chunk_ids)}) + "\n")
+                self._offset, self._inode = f.tell(), os.fstat(f.fileno()).st_ino
+            self._forget_chunks(chunk_ids)
+
+    def _forget_document(self, document_id: str):
+        for doc in self.documents.pop(document_id, ()):
+            self._kill(doc)
+
+    def _forget_chunks(self, chunk_ids: List[str]):
+        for chunk_id in chunk_ids:
+            doc = self.positions.get(chunk_id)
+            if doc is not None:
+                self._kill(doc)
+
+    def update_rows(self, rows: List[Dict]):
+        """Replace the indexed rows with the same ids."""
+        with self._lock:
+            rows = [{**self.rows[self.positions[row["id"]]], **row} for row in rows if row["id"] in self.positions]
+            self.delete_chunks([row["id"] for row in rows])
+            self.add(rows)
+
+    def _kill(self, doc: int):
+        if self.alive[doc]:
+            self.alive[doc] = 0
+            self.live_count -= 1
+            self.live_length -= self.lengths[doc]
+            if self.positions.get(self.rows[doc]["id"]) == doc:
+                del self.positions[self.rows[doc]["id"]]
+
+    def compact(self):
+        """
+        Rebuild postings and the rows file without deleted documents.
+        Only run in the writer; readers reload on refresh().
+        """
+        with self._lock:
+            rows = [row for doc, row in enumerate(self.rows) if self.alive[doc]]
+            with open(self.rows_path + ".tmp", "w") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            os.replace(self.rows_path + ".tmp", self.rows_path)
+            self._offset, self._inode = os.path.getsize(self.rows_path), os.stat(self.rows_path).st_ino
+            self._reset()
+            self._index(rows)
+
+    def search(self, query: str, top_k: int, filters: Optional[ChunkFilter] = None) -> List[Dict]:
+        """
+        Top chunks by BM25 score, shaped like match_chunks rows plus a
+        score. With filters, chunks that do not match score zero.
+        """
+        with self._lock:
+            if not self.live_count:
+                return []
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+            norms = self.k1 * (1 - self.b + self.b * lengths / (self.live_length / self.live_count))
+            alive = np.frombuffer(self.alive, dtype=np.uint8)
+            scores = np.zeros(len(self.rows), dtype=np.float32)
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                docs = np.frombuffer(posting[0], dtype=np.uint32)
+                # Postings of deleted chunks stay until compact() but do not count
+                df = int(alive[docs].sum())
+                if not df:
+                    continue
+                freqs = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+                idf = math.log(1 + (self.live_count - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms[docs])
+            scores *= alive
+            if filters:
+                allowed = np.zeros(len(self.rows), dtype=np.float32)
+                created = np.frombuffer(self.created, dtype=np.float64)
+                allowed[filters.candidates(self.rows, self.documents, self.by_filename, created)] = 1
+                scores *= allowed
+            best = [int(doc) for doc in top_k_indices(scores, top_k) if scores[doc] > 0]
+            return [
+                {
+                    "id": self.rows[doc]["id"],
+                    "content": self.rows[doc]["content"],
+                    "metadata": self.rows[doc]["metadata"],
+                    "score": float(scores[doc]),
+                }
+                for doc in best
+            ]
+
+
+_lexical_index: Optional[BM25Index] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[BM25Index]:
+    """The shared BM25 index, or None unless HYBRID_RETRIEVAL=true."""
+    global _lexical_index
+    if not HYBRID_RETRIEVAL:
+        return None
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = BM25Index()
+    return _lexical_index
+
+
+def rebuild_from_supabase(client, index: BM25Index, page_size: int = 1000):
+    """Load every stored chunk from Supabase into an empty lexical index."""
+    start = 0
+    while True:
+        # Ordered so pages neither skip nor repeat rows
+        chunks = (client.table("chunks").select("id, document_id, content, metadata, created_at")
+                  .order("id").range(start, start + page_size - 1).execute().data)
+        if not chunks:
+            break
+        index.add(chunks)
+        start += page_size
+    print(f"Loaded {len(index)} chunks into the lexical index")
@@ -0,0 +1,226 @@
+import copy
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.filters import ChunkFilter
+from app.services.quantization import BinaryCodes
+from app.services.vector_index import top_k_indices
+
+
+class MemoryResponse:
+    """Mimics the `.data` attribute of a postgrest APIResponse."""
+
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+class MemoryQuery:
+    """
+    A tiny subset of the postgrest query builder: insert, upsert, update,
+    select, delete, eq and in_ filters, order, range, then execute(). Every execute() counts as
+    one round-trip and sleeps for the client's simulated latency.
+    """
+
+    def __init__(self, client: "MemoryClient", table: str):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.payload: List[Dict[str, Any]] = []
+        self.filters: List[tuple] = []
+        self.bounds: Optional[tuple] = None
+        self.order_by: Optional[str] = None
+
+    def insert(self, rows):
+        self.action = "insert"
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows):
+        self.action = "upsert"
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def update(self, values: Dict[str, Any]):
+        self.action = "update"
+        self.payload = [values]
+        return self
+
+    def select(self, columns: str = "*"):
+        self.action = "select"
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column: str, value: Any):
+        self.filters.append((column, lambda v, value=value: v == value))
+        return self
+
+    def in_(self, column: str, values: List[Any]):
+        allowed = set(values)
+        self.filters.append((column, lambda v: v in allowed))
+        return self
+
+    def order(self, column: str):
+        self.order_by = column
+        return self
+
+    def range(self, start: int, end: int):
+        self.bounds = (start, end + 1)
+        return self
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(check(row.get(column)) for column, check in self.filters)
+
+    def execute(self) -> MemoryResponse:
+        self.client._round_trip(self.table, self.action)
+        with self.client._lock:
+            rows = self.client.tables.setdefault(self.table, [])
+
+            if self.action == "insert":
+                inserted = []
+                for row in self.payload:
+                    row = copy.deepcopy(row)
+                    row.setdefault("id", str(uuid.uuid4()))
+                    rows.append(row)
+                    inserted.append(row)
+                self.client._changed(self.table)
+                return MemoryResponse(inserted)
+
+            if self.action == "upsert":
+                positions = {row.get("id"): i for i, row in enumerate(rows)}
+                for row in self.payload:
+                    row = copy.deepcopy(row)
+                    if row.get("id") in positions:
+                        rows[positions[row["id"]]].update(row)
+                    else:
+                        rows.append(row)
+                self.client._changed(self.table)
+                return MemoryResponse(copy.deepcopy(self.payload))
+
+            if self.action == "update":
+                updated = [row for row in rows if self._matches(row)]
+                for row in updated:
+                    row.update(copy.deepcopy(self.payload[0]))
+                self.client._changed(self.table)
+                return MemoryResponse(updated)
+
+            if self.action == "delete":
+                deleted = [row for row in rows if self._matches(row)]
+                self.client.tables[self.table] = [row for row in rows if not self._matches(row)]
+                self.client._changed(self.table)
+                return MemoryResponse(deleted)
+
+            selected = [row for row in rows if self._matches(row)]
+            if self.order_by:
+                selected.sort(key=lambda row: row.get(self.order_by))
+            if self.bounds:
+                selected = selected[self.bounds[0]:self.bounds[1]]
+            return MemoryResponse(selected)
+
+
+class MemoryRpc:
+    def __init__(self, client: "MemoryClient", name: str, params: Dict[str, Any]):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> MemoryResponse:
+        self.client._round_trip(self.name, "rpc")
+        filters = ChunkFilter.from_rpc_params(self.params)
+        match_count = self.params.get("match_count", 10)
+        if self.name == "match_chunks":
+            return MemoryResponse(self.client._match_chunks(self.params["query_embedding"], match_count, filters))
+        if self.name == "match_chunks_binary":
+            return MemoryResponse(self.client._match_chunks(self.params["query_embedding"], match_count, filters,
+                                                            self.params.get("rescore_count")))
+        if self.name == "match_chunks_batch":
+            return MemoryResponse([
+                {"query_index": i, **row}
+                for i, embedding in enumerate(self.params["query_embeddings"])
+                for row in self.client._match_chunks(embedding, match_count, filters)
+            ])
+        raise ValueError(f"Unknown function {self.name}")
+
+
+class MemoryClient:
+    """
+    In-process stand-in for the Supabase client used to benchmark and
+    exercise the storage layer and the query path offline. rpc()
+    implements match_chunks and match_chunks_batch as exact cosine
+    searches over the stored embeddings, filters included, like the SQL
+    functions in the README, and match_chunks_binary as a Hamming distance
+    shortlist rescored by cosine similarity.
+
+    latency simulates the network cost of each request, and fail_after
+    makes the Nth write request raise so cleanup paths can be exercised.
+    """
+
+    def __init__(self, latency: float = 0.0, fail_after: Optional[int] = None):
+        self.latency = latency
+        self.fail_after = fail_after
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.requests = 0
+        self.writes = 0
+        self._lock = threading.RLock()
+        self._matrix = None  # (normalized vectors, chunk rows), rebuilt after writes
+
+    def table(self, name: str) -> MemoryQuery:
+        return MemoryQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> MemoryRpc:
+        return MemoryRpc(self, name, params or {})
+
+    def _changed(self, table: str):
+        if table in ("chunks", "embeddings"):
+            self._matrix = None
+
+    def _match_chunks(self, query_embedding: List[float], match_count: int,
+                      filters: Optional[ChunkFilter] = None,
+                      rescore_count: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._matrix is None:
+                chunks = {row["id"]: row for row in self.tables.get("chunks", [])}
+                pairs = [
+                    (chunks[row["chunk_id"]], row["vector_data"])
+                    for row in self.tables.get("embeddings", []) if row["chunk_id"] in chunks
+                ]
+                vectors = np.array(
+                    [json.loads(v) if isinstance(v, str) else v for _, v in pairs], dtype=np.float32
+                ).reshape(len(pairs), -1)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                self._matrix = (vectors, [row for row, _ in pairs])
+            vectors, rows = self._matrix
+        if filters:
+            keep = [i for i, row in enumerate(rows) if filters.matches(row)]
+            vectors, rows = vectors[keep], [rows[i] for i in keep]
+        if not rows:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if rescore_count:
+            shortlist = top_k_indices(BinaryCodes(vectors.shape[1]).extended(vectors).scores(query), rescore_count)
+            vectors, rows = vectors[shortlist], [rows[i] for i in shortlist]
+        scores = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        k = min(match_count, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {"id": rows[i]["id"], "content": rows[i]["content"], "metadata": rows[i]["metadata"],
+             "similarity": float(scores[i])}
+            for i in best
+        ]
+
+    def _round_trip(self, table: str, action: str):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if action in ("insert", "upsert", "update"):
+            self.writes += 1
+            if self.fail_after is not None and self.writes > self.fail_after:
+                raise RuntimeError(f"Simulated failure writing to {table}")
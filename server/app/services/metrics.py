@@ -0,0 +1,273 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+# Adds a Server-Timing header with per-stage durations to every response
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+# Seconds; ingestion stages on large files run well past the usual 10s bucket
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.inc_key(self._key(labels), amount)
+
+    def inc_key(self, key: LabelValues, amount: float = 1.0):
+        """inc() with label values already in labelnames order, for hot paths."""
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0.0)]
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc_key(self._key(labels), -amount)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram in Prometheus' text format."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (last one is +Inf), sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        self.observe_key(self._key(labels), value)
+
+    def observe_key(self, key: LabelValues, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines = self.header()
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    "rag_stage_duration_seconds", "Time spent in each ingestion and query stage.", ("pipeline", "stage")))
+stages_in_flight = registry.register(Gauge(
+    "rag_stage_in_flight", "Stages currently running.", ("pipeline", "stage")))
+request_seconds = registry.register(Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency until the response is complete.",
+    ("method", "route", "status")))
+requests_in_flight = registry.register(Gauge(
+    "rag_http_requests_in_flight", "HTTP requests currently being handled.", ("method", "route")))
+chunks_total = registry.register(Counter(
+    "rag_chunks_ingested_total", "Chunks stored by document ingestion."))
+pages_total = registry.register(Counter(
+    "rag_pages_extracted_total", "PDF pages extracted by document ingestion."))
+documents_total = registry.register(Counter(
+    "rag_documents_ingested_total", "Documents processed by ingestion, by outcome.", ("outcome",)))
+embedding_tokens_total = registry.register(Counter(
+    "rag_embedding_tokens_total", "Tokens sent to the embeddings API."))
+context_tokens_total = registry.register(Counter(
+    "rag_context_tokens_total", "Retrieved and prompt context tokens per query.", ("kind",)))
+cache_lookups_total = registry.register(Counter(
+    "rag_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result")))
+admission_queue_depth = registry.register(Gauge(
+    "rag_admission_queue_depth", "Requests waiting for a slot, per route group.", ("group",)))
+admission_in_flight = registry.register(Gauge(
+    "rag_admission_in_flight", "Requests holding a slot, per route group.", ("group",)))
+admission_wait_seconds = registry.register(Histogram(
+    "rag_admission_wait_seconds", "Time admitted requests waited for a slot.", ("group",)))
+admission_rejected_total = registry.register(Counter(
+    "rag_admission_rejected_total", "Requests turned away with 429 (queue_full) or 503 (timeout).",
+    ("group", "reason")))
+capacity_queue_depth = registry.register(Gauge(
+    "rag_capacity_queue_depth", "Calls waiting for shared embedding or storage capacity.", ("resource", "priority")))
+capacity_wait_seconds = registry.register(Histogram(
+    "rag_capacity_wait_seconds", "Time calls waited for shared embedding or storage capacity.",
+    ("resource", "priority")))
+
+# Stage timings of the current request, for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+class stage:
+    """
+    Time a block as one stage: histogram, in-flight gauge and Server-Timing
+    entry. Used as `with metrics.stage("query", "retrieve"):`.
+    """
+    __slots__ = ("key", "name", "start")
+
+    def __init__(self, pipeline: str, name: str):
+        self.key = (pipeline, name)
+        self.name = name
+
+    def __enter__(self):
+        stages_in_flight.inc_key(self.key)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stages_in_flight.inc_key(self.key, -1)
+        stage_seconds.observe_key(self.key, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def record_cache(cache: str, hit: bool):
+    cache_lookups_total.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def route_path(scope) -> str:
+    # Route templates keep label cardinality bounded (/upload/jobs/{job_id})
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording latency and in-flight requests per route, and
+    adding a Server-Timing header with the request's stage timings when
+    METRICS_SERVER_TIMING is on. Requests for /metrics itself are not counted.
+    """
+
+    def __init__(self, app, server_timing: Optional[bool] = None):
+        self.app = app
+        self.server_timing = METRICS_SERVER_TIMING if server_timing is None else server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = route_path(scope)
+        if route == "/metrics":
+            return await self.app(scope, receive, send)
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        key = (scope["method"], route)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = server_timing_header(timings, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        requests_in_flight.inc_key(key)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            requests_in_flight.inc_key(key, -1)
+            request_seconds.observe_key(key + (str(status),), time.perf_counter() - start)
+            _request_timings.reset(token)
@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from app.services.parsing import birds_list_to_string, iter_raw_birds
+
+# Normalizer applied to documents without a type-specific one
+DOCUMENT_NORMALIZER = os.getenv("DOCUMENT_NORMALIZER", "passthrough")
+# Per file type overrides, e.g. ".pdf=bird_list,.docx=passthrough"
+DOCUMENT_NORMALIZER_BY_TYPE = os.getenv("DOCUMENT_NORMALIZER_BY_TYPE", "")
+# Directory for normalizer debug artifacts (empty = not written)
+NORMALIZER_DEBUG_DIR = os.getenv("NORMALIZER_DEBUG_DIR", "")
+
+Pages = Iterable[Tuple[Optional[int], str]]
+
+_normalizers: Dict[str, Callable[[], "Normalizer"]] = {}
+
+
+def register_normalizer(name: str):
+    """Class decorator adding a normalizer to the registry under name."""
+    def register(cls):
+        cls.name = name
+        _normalizers[name] = cls
+        return cls
+    return register
+
+
+class Normalizer:
+    """
+    A stage between parsing and chunking that rewrites the stream of
+    (page number, text) pairs. After normalize() has been consumed,
+    artifact holds JSON-serializable debug output, or None.
+    A new instance is created per document.
+    """
+
+    name = ""
+
+    def __init__(self):
+        self.artifact: Optional[Any] = None
+
+    def normalize(self, pages: Pages) -> Iterator[Tuple[Optional[int], str]]:
+        raise NotImplementedError
+
+
+@register_normalizer("passthrough")
+class PassThroughNormalizer(Normalizer):
+    """Pages are chunked as extracted, keeping their page numbers."""
+
+    def normalize(self, pages: Pages) -> Iterator[Tuple[Optional[int], str]]:
+        yield from pages
+
+
+def _iter_lines(pages: Pages) -> Iterator[str]:
+    """The lines of the concatenated page texts, joining lines split across pages."""
+    partial = ""
+    for _, text in pages:
+        lines = (partial + text).splitlines(keepends=True)
+        # A last line without a line break may continue on the next page
+        partial = lines.pop() if lines and lines[-1].splitlines()[0] == lines[-1] else ""
+        yield from lines
+    if partial:
+        yield partial
+
+
+@register_normalizer("bird_list")
+class BirdListNormalizer(Normalizer):
+    """
+    Rewrites a list of bird entries (name, description, "Habitat:" line)
+    into one clean record per bird. Each record is yielded as soon as its
+    entry is complete, even when it spans pages, so the chunker receives
+    them as they are parsed; page numbers are dropped. With
+    NORMALIZER_DEBUG_DIR set the parsed entries are kept as the debug
+    artifact.
+    """
+
+    def normalize(self, pages: Pages) -> Iterator[Tuple[Optional[int], str]]:
+        birds = [] if NORMALIZER_DEBUG_DIR else None
+        self.artifact = birds
+        separator = ""
+        for bird in iter_raw_birds(_iter_lines(pages)):
+            if birds is not None:
+                birds.append(bird)
+            # Records are separated by blank lines, so each starts a paragraph
+            yield None, separator + birds_list_to_string([bird])
+            separator = "\n\n"
+
+
+def _parse_by_type(spec: str) -> Dict[str, str]:
+    by_type = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        extension, _, name = entry.partition("=")
+        by_type["." + extension.strip().lstrip(".").lower()] = name.strip()
+    return by_type
+
+
+def normalizer_name(filename: str, default: Optional[str] = None, by_type: Optional[Dict[str, str]] = None) -> str:
+    """The configured normalizer for a file, by its extension."""
+    by_type = _parse_by_type(DOCUMENT_NORMALIZER_BY_TYPE) if by_type is None else by_type
+    return by_type.get(os.path.splitext(filename)[1].lower(), default or DOCUMENT_NORMALIZER)
+
+
+def get_normalizer(filename: str, name: Optional[str] = None) -> Normalizer:
+    """A fresh instance of the normalizer named name, or of the one configured for filename."""
+    name = name or normalizer_name(filename)
+    if name not in _normalizers:
+        raise ValueError(f"Unknown normalizer {name!r}, expected one of {', '.join(sorted(_normalizers))}")
+    return _normalizers[name]()
+
+
+def artifact_path(filename: str, digest: str, normalizer: str, directory: Optional[str] = None) -> Optional[str]:
+    """
+    Per-document debug artifact path, or None when artifacts are disabled.
+    The content hash is part of the name, so concurrent uploads and new
+    versions of the same file never write to the same path.
+    """
+    directory = NORMALIZER_DEBUG_DIR if directory is None else directory
+    if not directory:
+        return None
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.basename(filename))
+    return os.path.join(directory, f"{stem}.{digest[:16]}.{normalizer}.json")
+
+
+def write_artifact(path: str, artifact: Any):
+    """Write an artifact to a temporary file and rename it into place. Errors are logged, not raised."""
+    tmp_path = None
+    try:
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".artifact-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(artifact, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Could not write normalizer artifact {path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
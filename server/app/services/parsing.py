@@ -1,82 +1,265 @@
+import io
+import mmap
 import fitz
 import docx
-from typing import Union, List, Dict
+import tempfile
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Union, List, Dict, Iterable, Iterator, Optional, Tuple
 from fastapi import UploadFile
-# Write birds to JSON file
-import json
 import os
 
+# Pages handed to one worker process at a time when extracting large PDFs;
+# every range reopens the file, so very small ranges cost more than they win
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "64"))
+# PDFs with fewer pages are extracted in the calling thread
+EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "64"))
+
+# Bytes Starlette keeps an upload in memory before spooling it to disk
+# (MultiPartParser.spool_max_size)
+UPLOAD_SPOOL_MAX_BYTES = 1024 * 1024
+
+# A document as a path on disk or a buffer already in memory
+Source = Union[str, os.PathLike, bytes, memoryview]
+
+
+def _is_path(source: Source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+@contextmanager
+def upload_source(file: UploadFile) -> Iterator[memoryview]:
+    """
+    View of an upload's spooled file, using only the public file API.
+    Uploads small enough for Starlette to keep in memory are read into
+    bytes; larger ones have been spooled to disk and are mapped read-only.
+    In-process parsing reads the mapping without a copy, but the spooled
+    file has no path, so page-parallel extraction still writes it to a
+    temp file once (see _as_path). The view is released on exit so the
+    upload can be closed afterwards.
+    """
+    spooled = file.file
+    spooled.flush()
+    size = spooled.seek(0, os.SEEK_END)
+    spooled.seek(0)
+    fd = None
+    # fileno() would roll an in-memory spool over to disk, so it is only
+    # asked for uploads past Starlette's in-memory limit
+    if size > UPLOAD_SPOOL_MAX_BYTES:
+        try:
+            fd = spooled.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            pass  # a file object with no descriptor behind it
+    if fd is None:
+        view = memoryview(spooled.read())
+        try:
+            yield view
+        finally:
+            view.release()
+        return
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+
+@contextmanager
+def _as_path(source: Source, suffix: str) -> Iterator[str]:
+    """Path to the document, spilling an in-memory buffer to a temp file once so worker processes can open it."""
+    if _is_path(source):
+        yield os.fspath(source)
+        return
+    with tempfile.NamedTemporaryFile(suffix=suffix) as spill:
+        spill.write(source)
+        spill.flush()
+        yield spill.name
+
+def _open_pdf(source: Source) -> fitz.Document:
+    if _is_path(source):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+def _is_empty(source: Source) -> bool:
+    return os.path.getsize(source) == 0 if _is_path(source) else len(source) == 0
+
+def iter_pdf_pages(source: Source) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for each page of a PDF, one page at a time."""
+    if _is_empty(source):
+        return
+    with _open_pdf(source) as doc:
+        for page in doc:
+            yield page.number + 1, page.get_text()
+
+def extract_pdf_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """(page number, text) for pages [start, stop) of a PDF. Runs inside a worker process."""
+    with fitz.open(path, filetype="pdf") as doc:
+        return [(number + 1, doc[number].get_text()) for number in range(start, stop)]
+
+def iter_pdf_pages_parallel(source: Source, executor: Executor,
+                            pages_per_task: int = EXTRACT_PAGES_PER_TASK,
+                            max_in_flight: Optional[int] = None,
+                            page_count: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, text) for each page of a PDF in order, extracting
+    page ranges in executor's worker processes. At most max_in_flight
+    ranges are queued ahead of the consumer, so memory stays bounded on
+    very large documents. Workers open the file by path; an in-memory
+    source is written to a temp file once rather than pickled per task.
+    page_count saves reopening the PDF when the caller already knows it.
+    """
+    if _is_empty(source):
+        return
+    if page_count is None:
+        with _open_pdf(source) as doc:
+            page_count = doc.page_count
+    max_in_flight = max_in_flight or 2 * (os.cpu_count() or 2)
+    ranges = iter([(start, min(start + pages_per_task, page_count))
+                   for start in range(0, page_count, pages_per_task)])
+
+    with _as_path(source, ".pdf") as path:
+        pending = deque(executor.submit(extract_pdf_range, path, start, stop)
+                        for start, stop in _take(ranges, max_in_flight))
+        try:
+            while pending:
+                pages = pending.popleft().result()
+                for start, stop in _take(ranges, 1):
+                    pending.append(executor.submit(extract_pdf_range, path, start, stop))
+                yield from pages
+        finally:
+            # Stopped early: drop queued ranges and wait for running ones before the spill file goes away
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled():
+                    future.exception()
+
+def _take(iterator: Iterator, n: int) -> List:
+    return [item for _, item in zip(range(n), iterator)]
+
+def docx_paragraphs(source: Source) -> List[Tuple[None, str]]:
+    """(None, text) for each DOCX paragraph. Takes a path so it can run in a worker process."""
+    if _is_empty(source):
+        return []
+    doc = docx.Document(os.fspath(source) if _is_path(source) else io.BytesIO(source))
+    return [(None, para.text + "\n\n") for para in doc.paragraphs]
+
+def iter_docx_paragraphs(source: Source) -> Iterator[Tuple[None, str]]:
+    """Yield (None, text) for each DOCX paragraph; DOCX has no page numbers."""
+    return iter(docx_paragraphs(source))
+
+def _iter_pdf_pages_auto(source: Source, executor: Executor) -> Iterator[Tuple[int, str]]:
+    """iter_pdf_pages for small PDFs, iter_pdf_pages_parallel for large ones, opening the PDF once to decide."""
+    if _is_empty(source):
+        return
+    with _open_pdf(source) as doc:
+        if doc.page_count < EXTRACT_PARALLEL_MIN_PAGES:
+            for page in doc:
+                yield page.number + 1, page.get_text()
+            return
+        page_count = doc.page_count
+    yield from iter_pdf_pages_parallel(source, executor, page_count=page_count)
+
+def iter_pages(filename: str, source: Source, executor: Optional[Executor] = None) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Stream (page number, text) pairs from a supported file, in page order.
+    With an executor, PDFs of EXTRACT_PARALLEL_MIN_PAGES pages or more are
+    split into page ranges extracted in parallel, and DOCX parsing is moved
+    off the calling thread; smaller PDFs are read in place.
+    """
+    if filename.endswith(".pdf"):
+        if executor is None:
+            return iter_pdf_pages(source)
+        return _iter_pdf_pages_auto(source, executor)
+    elif filename.endswith(".docx"):
+        if executor is not None and not _is_empty(source):
+            with _as_path(source, ".docx") as path:
+                return iter(executor.submit(docx_paragraphs, path).result())
+        return iter_docx_paragraphs(source)
+    return iter(())
+
+def parse_pdf_bytes(data: Source) -> str:
+    """Extract text from a PDF using PyMuPDF."""
+    return "".join(text for _, text in iter_pdf_pages(data))
+
+def parse_docx_bytes(data: Source) -> str:
+    """Extract text from a DOCX using python-docx."""
+    return "".join(text[:-1] for _, text in docx_paragraphs(data))
+
+def parse_bytes(filename: str, data: Source) -> Union[str, None]:
+    """
+    Extract text from a document's bytes or path based on the filename
+    extension. Only takes picklable arguments so it can run in a process pool.
+    """
+    if filename.endswith(".pdf"):
+        return parse_pdf_bytes(data)
+    elif filename.endswith(".docx"):
+        return parse_docx_bytes(data)
+    else:
+        return None  # Unsupported file type
+
 def parse_pdf(file: UploadFile) -> str:
     """Extract text from a PDF file using PyMuPDF."""
-    text = ""
-    with fitz.open(stream=file.file.read(), filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+    with upload_source(file) as source:
+        return parse_pdf_bytes(source)
 
 def parse_docx(file: UploadFile) -> str:
     """Extract text from a DOCX file using python-docx."""
-    text = ""
-    doc = docx.Document(file.file)
-    for para in doc.paragraphs:
-        text += para.text + "\n"
-    return text
+    with upload_source(file) as source:
+        return parse_docx_bytes(source)
 
 def parse_file(file: UploadFile) -> Union[str, None]:
     """Determine file type and extract text accordingly."""
-    if file.filename.endswith(".pdf"):
-        return parse_pdf(file)
-    elif file.filename.endswith(".docx"):
-        return parse_docx(file)
-    else:
-        return None  # Unsupported file type
+    with upload_source(file) as source:
+        return parse_bytes(file.filename, source)
+
+def iter_raw_birds(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Parse bird entries (name, description lines, "Habitat:" line) out of a
+    stream of text lines, yielding each entry as soon as its Habitat line
+    is read.
+    """
+    name: Optional[str] = None
+    description_lines: List[str] = []
+    first = True
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        # Skip the main title line if it's present
+        if first:
+            first = False
+            if "fascinating birds" in line.lower():
+                continue
+
+        if name is None:
+            name = line
+        elif line.startswith("Habitat:"):
+            yield _bird_entry(name, description_lines, line.replace("Habitat:", "").strip())
+            name, description_lines = None, []
+        else:
+            description_lines.append(line)
+
+    # Last entry without a Habitat line
+    if name is not None:
+        yield _bird_entry(name, description_lines, "")
+
+
+def _bird_entry(name: str, description_lines: List[str], habitat: str) -> Dict[str, str]:
+    # Clean 'nesting' from description and habitat (case-insensitive)
+    description = " ".join(description_lines).replace("nesting", "").replace("Nesting", "")
+    habitat = habitat.replace("nesting", "").replace("Nesting", "")
+    return {
+        "name": name,
+        "description": description,
+        "habitat": habitat
+    }
+
 
-def parse_raw_bird_text(raw_text: str):
-    lines = [line.strip() for line in raw_text.splitlines() if line.strip()]
-    birds = []
-    i = 0
-
-    # Skip the main title line if it's present
-    if "fascinating birds" in lines[0].lower():
-        i += 1
-
-    while i < len(lines):
-        # Bird name
-        name = lines[i]
-        i += 1
-
-        # Gather description lines until "Habitat:" is found
-        description_lines = []
-        while i < len(lines) and not lines[i].startswith("Habitat:"):
-            description_lines.append(lines[i])
-            i += 1
-
-        # Get habitat line
-        habitat = ""
-        if i < len(lines) and lines[i].startswith("Habitat:"):
-            habitat = lines[i].replace("Habitat:", "").strip()
-            i += 1
-
-
-        # Clean 'nesting' from description and habitat (case-insensitive)
-        description = " ".join(description_lines).replace("nesting", "").replace("Nesting", "")
-        habitat = habitat.replace("nesting", "").replace("Nesting", "")
-
-        # Append parsed bird entry
-        birds.append({
-            "name": name,
-            "description": description,
-            "habitat": habitat
-        })
-
-    # Create output directory if it doesn't exist
-    os.makedirs('output', exist_ok=True)
-    
-    # Write birds to JSON file
-    with open('output/birds.json', 'w') as f:
-        json.dump(birds, f, indent=4)
-
-    return birds
+def parse_raw_bird_text(raw_text: str) -> List[Dict[str, str]]:
+    """Parse bird entries (name, description lines, "Habitat:" line) out of raw text."""
+    return list(iter_raw_birds(raw_text.splitlines()))
 
 def birds_list_to_string(birds: List[Dict[str, str]]) -> str:
     """
@@ -0,0 +1,299 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.parsing import Source, iter_pages
+from app.services import admission
+from app.services import chunking
+from app.services import metrics
+from app.services import normalizers
+from app.services.settings import chunking_params, settings_store
+from app.services import embedding
+from app.services import storage
+from app.services import versioning
+
+# Per-stage concurrency limits. Parsing is CPU-bound and runs in worker
+# processes, large PDFs split into page ranges across them; embedding and storage are network-bound and run in their own
+# bounded thread pools so neither stage can starve the other.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+STORE_CONCURRENCY = int(os.getenv("STORE_CONCURRENCY", "4"))
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_embed_pool: Optional[ThreadPoolExecutor] = None
+_store_pool: Optional[ThreadPoolExecutor] = None
+_artifact_pool: Optional[ThreadPoolExecutor] = None
+
+
+class IngestionError(Exception):
+    """Raised when a document cannot be ingested because of its content."""
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+
+def _get_embed_pool() -> ThreadPoolExecutor:
+    global _embed_pool
+    if _embed_pool is None:
+        _embed_pool = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+    return _embed_pool
+
+
+def _get_store_pool() -> ThreadPoolExecutor:
+    global _store_pool
+    if _store_pool is None:
+        _store_pool = ThreadPoolExecutor(max_workers=STORE_CONCURRENCY, thread_name_prefix="store")
+    return _store_pool
+
+
+def _get_artifact_pool() -> ThreadPoolExecutor:
+    global _artifact_pool
+    if _artifact_pool is None:
+        # One writer keeps debug output off the request path without competing for disk
+        _artifact_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifacts")
+    return _artifact_pool
+
+
+def shutdown():
+    """Stop the worker pools. Called on application shutdown."""
+    global _parse_pool, _embed_pool, _store_pool, _artifact_pool
+    for pool in (_parse_pool, _embed_pool, _store_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    if _artifact_pool is not None:
+        # Let queued debug artifacts finish writing
+        _artifact_pool.shutdown(wait=True)
+    _parse_pool = _embed_pool = _store_pool = _artifact_pool = None
+
+
+def new_processing_steps() -> List[Dict[str, str]]:
+    return [
+        {"step": "uploading_file", "status": "completed"},
+        {"step": "parsing_text", "status": "pending"},
+        {"step": "creating_chunks", "status": "pending"},
+        {"step": "generating_embeddings", "status": "pending"},
+        {"step": "storing_in_vector_db", "status": "pending"}
+    ]
+
+
+class StepTracker:
+    """
+    Updates processing_steps in place as stages start and finish, records
+    each stage's duration and notifies an optional on_step callback.
+    """
+
+    def __init__(self, processing_steps: List[Dict], on_step: Optional[Callable[[List[Dict]], None]] = None):
+        self.steps = processing_steps
+        self.on_step = on_step
+        self._started: Dict[int, float] = {}
+
+    def _notify(self):
+        if self.on_step:
+            self.on_step(self.steps)
+
+    def start(self, index: int):
+        self._started[index] = time.perf_counter()
+        self.steps[index]["status"] = "running"
+        self._notify()
+
+    def complete(self, index: int):
+        self.steps[index]["status"] = "completed"
+        if index in self._started:
+            self.steps[index]["duration_ms"] = round((time.perf_counter() - self._started[index]) * 1000, 1)
+        self._notify()
+
+    def skip_remaining(self):
+        for step in self.steps:
+            if step["status"] == "pending":
+                step["status"] = "skipped"
+        self._notify()
+
+    def fail(self):
+        for step in self.steps:
+            if step["status"] == "running":
+                step["status"] = "failed"
+        self._notify()
+
+
+def _extract_chunks(filename: str, source: Source, executor, normalizer: normalizers.Normalizer,
+                    max_tokens: int, overlap_tokens: int) -> Tuple[List[Dict], int]:
+    """
+    Stream pages out of the document, large PDFs a page range per worker
+    process, through the normalizer into the chunker. Returns the chunk
+    records in order and the number of pages extracted. Pages are chunked
+    as they arrive, so only the pages in flight and the chunks are held in
+    memory, never the whole extracted text.
+    Runs in a thread; the heavy lifting of extraction happens in executor.
+    """
+    pages = 0
+
+    def counted():
+        nonlocal pages
+        for page, text in iter_pages(filename, source, executor):
+            if page is not None:
+                pages += 1
+            yield page, text
+
+    chunks = list(chunking.iter_chunks(normalizer.normalize(counted()), max_tokens, overlap_tokens))
+    return chunks, pages
+
+
+async def ingest_document(filename: str, data: Source, processing_steps: Optional[List[Dict]] = None,
+                          on_step: Optional[Callable[[List[Dict]], None]] = None,
+                          settings: Optional[Dict] = None) -> Dict:
+    """
+    Run parse, chunk, embed and store for one document without blocking
+    the event loop. processing_steps is updated in place as stages start
+    and finish, and on_step is called after every update. Chunk size and
+    overlap come from settings, the current application settings by default.
+    data is the document's bytes, a memoryview over them (see
+    parsing.upload_source) or a path to the file.
+
+    Documents are versioned by content hash: re-uploading an unchanged
+    file is skipped, and an edited one is diffed chunk by chunk against
+    the stored version so only new chunks are embedded and written.
+    Raises IngestionError for documents that cannot be ingested.
+    """
+    if processing_steps is None:
+        processing_steps = new_processing_steps()
+    if settings is None:
+        settings = settings_store.get()
+    tracker = StepTracker(processing_steps, on_step)
+    try:
+        result = await _run_stages(filename, data, tracker, settings)
+    except Exception:
+        tracker.fail()
+        metrics.documents_total.inc(outcome="failed")
+        raise
+    metrics.documents_total.inc(outcome=result.get("status", "completed"))
+    return result
+
+
+def _store(loop, fn, *args, **kwargs):
+    """Run a storage call in the store pool, holding a bulk slot of the shared storage capacity."""
+    return loop.run_in_executor(_get_store_pool(), functools.partial(
+        storage.storage_capacity.run, admission.BULK, fn, *args, **kwargs))
+
+
+async def _run_stages(filename: str, data: Source, tracker: StepTracker, settings: Dict) -> Dict:
+    loop = asyncio.get_running_loop()
+
+    # 0. an unchanged re-upload is skipped, a changed one becomes the next version
+    digest = await asyncio.to_thread(versioning.content_hash, data)
+    existing = await _store(loop, storage.find_document, filename)
+    existing_metadata = (existing or {}).get("metadata") or {}
+    if existing and existing_metadata.get("content_hash") == digest:
+        tracker.skip_remaining()
+        return {
+            "message": "File already uploaded",
+            "filename": filename,
+            "status": "skipped",
+            "document_id": existing["id"],
+            "version": existing_metadata.get("version", 1),
+            "processing_steps": tracker.steps
+        }
+
+    # 1-2. parse the file, run the configured normalizer over its pages and
+    # chunk them as they arrive; the two stages overlap, so both are timed
+    # over the same span
+    normalizer = normalizers.get_normalizer(filename)
+    max_tokens, overlap_tokens = chunking_params(settings)
+    tracker.start(1)
+    tracker.start(2)
+    with metrics.stage("ingest", "parse"), metrics.stage("ingest", "chunk"):
+        started = time.perf_counter()
+        chunk_records, pages = await asyncio.to_thread(
+            _extract_chunks, filename, data, _get_parse_pool(), normalizer, max_tokens, overlap_tokens)
+        extract_seconds = time.perf_counter() - started
+        if not chunk_records:
+            raise IngestionError("No text found in the file")
+    metrics.pages_total.inc(pages)
+    tracker.complete(1)  # parsing_text completed
+    chunks = [record["text"] for record in chunk_records]
+    tracker.complete(2)  # creating_chunks completed
+
+    artifact_path = normalizers.artifact_path(filename, digest, normalizer.name)
+    if artifact_path and normalizer.artifact is not None:
+        _get_artifact_pool().submit(normalizers.write_artifact, artifact_path, normalizer.artifact)
+
+    # 3. create metadata object for each chunk
+    metadata_list = [
+        {
+            "file_name": filename,
+            "chunk_index": i,
+            "page_start": record["page_start"],
+            "page_end": record["page_end"],
+            "char_start": record["char_start"],
+            "char_end": record["char_end"],
+            "chunk_hash": versioning.chunk_hash(record["text"])
+        }
+        for i, record in enumerate(chunk_records)
+    ]
+
+    # 4. on re-upload only chunks that are not stored yet get embedded
+    if existing:
+        stored = await _store(loop, storage.fetch_chunks, existing["id"])
+        diff = versioning.diff_chunks(metadata_list, chunks, stored)
+    else:
+        diff = versioning.ChunkDiff(added=list(range(len(chunks))))
+    new_chunks = [chunks[i] for i in diff.added]
+    new_metadata = [metadata_list[i] for i in diff.added]
+
+    # 5. embed the new chunks
+    tracker.start(3)
+    with metrics.stage("ingest", "embed"):
+        embedded = await loop.run_in_executor(_get_embed_pool(), functools.partial(
+            embedding.embed_texts, new_chunks, priority=admission.BULK))
+    embedded.raise_for_failures()
+    embeddings = embedded.embeddings
+
+    if new_chunks and not embeddings:
+        raise IngestionError("Failed to generate embeddings")
+    tracker.complete(3)  # generating_embeddings completed
+
+    # 6. Store in vector DB
+    tracker.start(4)
+    document_metadata = {**existing_metadata, "file_name": filename, "content_hash": digest,
+                         "version": existing_metadata.get("version", 1) + 1 if existing else 1}
+    with metrics.stage("ingest", "store"):
+        if existing:
+            document_id = existing["id"]
+            await _store(loop, storage.update_document, document_id, new_chunks, embeddings, new_metadata,
+                         diff.updated, diff.removed, document_metadata)
+        else:
+            document_id = await _store(loop, storage.store_embeddings, chunks, embeddings, metadata_list,
+                                       document_metadata=document_metadata)
+    tracker.complete(4)  # storing_in_vector_db completed
+    metrics.chunks_total.inc(len(new_chunks))
+
+    # Create chunk previews (first 2 chunks with truncated text)
+    chunk_previews = []
+    for i, chunk in enumerate(chunks[:2]):
+        preview_text = chunk[:150] + "..." if len(chunk) > 150 else chunk
+        chunk_previews.append({
+            "index": i,
+            "preview": preview_text,
+            "full_length": len(chunk)
+        })
+
+    return {
+        "filename": filename,
+        "document_id": document_id,
+        "version": document_metadata["version"],
+        "changes": diff.summary(),
+        "num_chunks": len(chunks),
+        "chunk_previews": chunk_previews,
+        "embedding_preview": embeddings[0][:5] if embeddings else [],
+        "cached_embeddings": embedded.cache_hits,
+        "pages": pages,
+        "pages_per_second": round(pages / extract_seconds, 1) if extract_seconds else 0.0,
+        "normalizer": normalizer.name,
+        "processing_steps": tracker.steps
+    }
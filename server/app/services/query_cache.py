@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from app.services.embedding_cache import normalize_text
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "5000"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def question_key(question: str) -> str:
+    return normalize_text(question).lower()
+
+
+class QueryCache:
+    """
+    Three cache tiers for /query:
+    - normalized question -> question embedding
+    - (normalized question, top_k, corpus generation) -> retrieved chunks
+    - (normalized question, chunk ids, model) -> answer
+
+    Ingesting or deleting a document bumps the corpus generation, which
+    orphans earlier retrieval entries, and clears the answer tier.
+    """
+
+    def __init__(self):
+        self.embeddings = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+        self.retrievals = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        self.answers = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def retrieval_key(self, question: str, top_k: int, filter_key: Optional[tuple] = None) -> tuple:
+        return (question_key(question), top_k, filter_key, self.generation)
+
+    @staticmethod
+    def answer_key(question: str, chunk_ids: List[Any], model: str, temperature: Optional[float] = None) -> tuple:
+        return (question_key(question), tuple(chunk_ids), model, temperature)
+
+    def invalidate(self):
+        """Called whenever the stored corpus changes."""
+        with self._lock:
+            self.generation += 1
+            self.retrievals.clear()
+            self.answers.clear()
+
+    def stats(self) -> dict:
+        return {
+            "embeddings": self.embeddings.stats(),
+            "retrievals": self.retrievals.stats(),
+            "answers": self.answers.stats(),
+            "generation": self.generation,
+        }
+
+
+query_cache = QueryCache()
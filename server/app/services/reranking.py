@@ -0,0 +1,101 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.lexical_index import tokenize
+from app.services.tokens import count_tokens
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# Candidates retrieved per requested result for the reranker to choose from
+RERANK_CANDIDATE_FACTOR = int(os.getenv("RERANK_CANDIDATE_FACTOR", "3"))
+# Candidates scoring more than this below the best one are cut off
+RERANK_MARGIN = float(os.getenv("RERANK_MARGIN", "0.35"))
+# Chunks always kept, whatever their score
+RERANK_MIN_KEEP = int(os.getenv("RERANK_MIN_KEEP", "3"))
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or our that the their this to was "
+    "we what when where which who why will with you your".split()
+)
+
+
+def _bigrams(terms: List[str]) -> set:
+    return set(zip(terms, terms[1:]))
+
+
+class LexicalReranker:
+    """
+    Re-scores retrieved chunks against the question on the CPU with three
+    lexical features, each in [0, 1]:
+    - coverage: share of the question's terms found in the chunk, weighted
+      by their IDF within the candidate set
+    - phrase: share of the question's word bigrams found in the chunk
+    - prior: the chunk's position in the retrieval order
+
+    Candidates are sorted by the weighted sum and cut off once they score
+    more than margin below the best candidate.
+    """
+
+    def __init__(self, candidate_factor: int = RERANK_CANDIDATE_FACTOR, margin: float = RERANK_MARGIN,
+                 min_keep: int = RERANK_MIN_KEEP, weights: Tuple[float, float, float] = (0.6, 0.25, 0.15)):
+        self.candidate_factor = max(1, candidate_factor)
+        self.margin = margin
+        self.min_keep = max(1, min_keep)
+        self.weights = np.array(weights, dtype=np.float32)
+
+    def candidates(self, top_k: int) -> int:
+        """Number of chunks to retrieve for a request of top_k."""
+        return top_k * self.candidate_factor
+
+    def score(self, question: str, matches: List[Dict]) -> np.ndarray:
+        if not matches:
+            return np.zeros(0, dtype=np.float32)
+        question_terms = [term for term in tokenize(question) if term not in _STOPWORDS]
+        unique_terms = list(dict.fromkeys(question_terms))
+        question_bigrams = _bigrams(question_terms)
+        chunk_terms = [tokenize(match["content"]) for match in matches]
+        chunk_sets = [set(terms) for terms in chunk_terms]
+
+        features = np.zeros((len(matches), 3), dtype=np.float32)
+        if unique_terms:
+            present = np.array([[term in terms for term in unique_terms] for terms in chunk_sets], dtype=np.float32)
+            df = present.sum(axis=0)
+            idf = np.log1p((len(matches) - df + 0.5) / (df + 0.5)) + 1e-3
+            features[:, 0] = present @ idf / idf.sum()
+        if question_bigrams:
+            features[:, 1] = [
+                len(question_bigrams & _bigrams([t for t in terms if t not in _STOPWORDS])) / len(question_bigrams)
+                for terms in chunk_terms
+            ]
+        features[:, 2] = 1 - np.arange(len(matches), dtype=np.float32) / len(matches)
+        return features @ self.weights
+
+    def rerank(self, question: str, matches: List[Dict], top_k: int) -> Tuple[List[Dict], Dict]:
+        """
+        The best of matches for question, at most top_k and at least
+        min_keep of them, each with a rerank_score. Also returns stats with
+        the number of candidates, chunks kept and prompt tokens dropped.
+        """
+        scores = self.score(question, matches)
+        order = np.argsort(-scores, kind="stable")
+        kept: List[int] = []
+        for i in order[:top_k]:
+            if len(kept) >= self.min_keep and scores[i] < scores[order[0]] - self.margin:
+                break
+            kept.append(int(i))
+        kept_set = set(kept)
+        stats = {
+            "candidates": len(matches),
+            "kept": len(kept),
+            "cut_off": max(0, min(top_k, len(matches)) - len(kept)),
+            "tokens_dropped": sum(count_tokens(match["content"]) for i, match in enumerate(matches)
+                                  if i not in kept_set),
+            "top_score": round(float(scores[order[0]]), 4) if len(matches) else None,
+        }
+        return [{**matches[i], "rerank_score": float(scores[i])} for i in kept], stats
+
+
+def get_reranker() -> Optional[LexicalReranker]:
+    """The reranker, or None unless RERANK_ENABLED=true."""
+    return LexicalReranker() if RERANK_ENABLED else None
@@ -0,0 +1,157 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from postgrest.exceptions import APIError
+
+from app.services.clients import get_supabase
+from app.services.filters import ChunkFilter
+from app.services.lexical_index import BM25Index, get_lexical_index
+from app.services.quantization import VECTOR_QUANTIZATION, VECTOR_RESCORE_FACTOR
+from app.services.vector_index import RETRIEVAL_BACKEND, LocalVectorIndex, get_local_index
+
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Candidates fetched from each retriever per requested result before fusion
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "3"))
+# match_chunks calls in flight when match_chunks_batch is not installed
+RETRIEVAL_BATCH_CONCURRENCY = int(os.getenv("RETRIEVAL_BATCH_CONCURRENCY", "8"))
+
+
+def _match_each(retriever, query_embeddings: Sequence[List[float]], top_k: int, questions: Sequence[str],
+                filters: Optional[ChunkFilter]) -> List[List[Dict]]:
+    with ThreadPoolExecutor(max_workers=max(1, min(RETRIEVAL_BATCH_CONCURRENCY, len(query_embeddings)))) as pool:
+        return list(pool.map(lambda args: retriever.match_chunks(*args, filters=filters),
+                             zip(query_embeddings, [top_k] * len(query_embeddings), questions)))
+
+
+class SupabaseRetriever:
+    """
+    Nearest chunks from the match_chunks pgvector RPC. Without an explicit
+    client the shared one from the client registry is used. Filters are
+    passed as RPC arguments and applied in the SQL query itself.
+
+    With binary quantization match_chunks_binary is called instead: it
+    shortlists rescore_factor * top_k rows by Hamming distance of the
+    binary-quantized vectors and ranks those by full-precision similarity.
+    """
+
+    batch_rpc = True
+
+    def __init__(self, client=None, quantization: str = VECTOR_QUANTIZATION,
+                 rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        self.client = client
+        self.binary = quantization == "binary"
+        self.rescore_factor = max(1, rescore_factor)
+
+    def match_chunks(self, query_embedding: List[float], top_k: int, question: str = "",
+                     filters: Optional[ChunkFilter] = None) -> List[Dict]:
+        params = {
+            "query_embedding": query_embedding,
+            "match_count": top_k,
+            **(filters.rpc_params() if filters else {})
+        }
+        if self.binary:
+            return (self.client or get_supabase()).rpc(
+                "match_chunks_binary", {**params, "rescore_count": top_k * self.rescore_factor}
+            ).execute().data
+        return (self.client or get_supabase()).rpc("match_chunks", params).execute().data
+
+    def match_many(self, query_embeddings: Sequence[List[float]], top_k: int, questions: Sequence[str],
+                   filters: Optional[ChunkFilter] = None) -> List[List[Dict]]:
+        """
+        Nearest chunks for several queries in one match_chunks_batch call.
+        Falls back to concurrent match_chunks calls when the database does
+        not have that function yet, and with binary quantization.
+        """
+        if self.batch_rpc and not self.binary:
+            try:
+                rows = (self.client or get_supabase()).rpc(
+                    "match_chunks_batch",
+                    {
+                        "query_embeddings": list(query_embeddings),
+                        "match_count": top_k,
+                        **(filters.rpc_params() if filters else {})
+                    }
+                ).execute().data
+            except APIError as e:
+                if e.code != "PGRST202":  # function not found
+                    raise
+                print("match_chunks_batch is not installed, falling back to one match_chunks call per query")
+                SupabaseRetriever.batch_rpc = False
+            else:
+                results: List[List[Dict]] = [[] for _ in query_embeddings]
+                for row in rows:
+                    results[row.pop("query_index")].append(row)
+                return results
+        return _match_each(self, query_embeddings, top_k, questions, filters)
+
+
+class LocalRetriever:
+    """Nearest chunks from the in-process memory-mapped index."""
+
+    def __init__(self, index: LocalVectorIndex):
+        self.index = index
+
+    def match_chunks(self, query_embedding: List[float], top_k: int, question: str = "",
+                     filters: Optional[ChunkFilter] = None) -> List[Dict]:
+        return self.index.search(query_embedding, top_k, filters=filters)
+
+    def match_many(self, query_embeddings: Sequence[List[float]], top_k: int, questions: Sequence[str],
+                   filters: Optional[ChunkFilter] = None) -> List[List[Dict]]:
+        return self.index.search_many(query_embeddings, top_k, filters=filters)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], top_k: int, k: int = RRF_K) -> List[Dict]:
+    """
+    Merge ranked result lists by summing 1 / (k + rank) per chunk id.
+    The first row seen for a chunk is kept, with the fused score added.
+    """
+    fused: Dict[str, float] = {}
+    rows: Dict[str, Dict] = {}
+    for results in result_lists:
+        for rank, row in enumerate(results, start=1):
+            fused[row["id"]] = fused.get(row["id"], 0.0) + 1.0 / (k + rank)
+            rows.setdefault(row["id"], row)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [{**rows[chunk_id], "rrf_score": fused[chunk_id]} for chunk_id in best]
+
+
+class HybridRetriever:
+    """Vector retrieval fused with BM25 keyword retrieval by reciprocal rank fusion."""
+
+    def __init__(self, vector_retriever, lexical_index: BM25Index):
+        self.vector_retriever = vector_retriever
+        self.lexical_index = lexical_index
+
+    def match_chunks(self, query_embedding: List[float], top_k: int, question: str = "",
+                     filters: Optional[ChunkFilter] = None) -> List[Dict]:
+        candidates = top_k * HYBRID_CANDIDATE_FACTOR
+        vector_results = self.vector_retriever.match_chunks(query_embedding, candidates, filters=filters)
+        lexical_results = self.lexical_index.search(question, candidates, filters=filters) if question else []
+        return reciprocal_rank_fusion([vector_results, lexical_results], top_k)
+
+    def match_many(self, query_embeddings: Sequence[List[float]], top_k: int, questions: Sequence[str],
+                   filters: Optional[ChunkFilter] = None) -> List[List[Dict]]:
+        candidates = top_k * HYBRID_CANDIDATE_FACTOR
+        vector_results = self.vector_retriever.match_many(query_embeddings, candidates, questions, filters=filters)
+        return [
+            reciprocal_rank_fusion(
+                [vectors, self.lexical_index.search(question, candidates, filters=filters) if question else []], top_k)
+            for vectors, question in zip(vector_results, questions)
+        ]
+
+
+def get_retriever(supabase_client=None):
+    """
+    Pick the retrieval backend configured by RETRIEVAL_BACKEND (supabase or
+    local), wrapped in hybrid BM25 fusion when HYBRID_RETRIEVAL=true.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        retriever = LocalRetriever(get_local_index())
+    else:
+        retriever = SupabaseRetriever(supabase_client)
+
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        return HybridRetriever(retriever, lexical_index)
+    return retriever
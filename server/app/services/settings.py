@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+SETTINGS_FILE = os.getenv("SETTINGS_FILE", "settings.json")
+# Seconds between checks of the settings file's modification time
+SETTINGS_RELOAD_INTERVAL = float(os.getenv("SETTINGS_RELOAD_INTERVAL", "1.0"))
+# Settings express chunk sizes in characters, the chunker budgets tokens
+CHARS_PER_TOKEN = 4
+
+# Chunking and model match what upload and query used before they read
+# the settings: 500-character chunks with 50 characters of overlap, gpt-4
+DEFAULT_SETTINGS = {
+    "chunk_size": 500,
+    "chunk_overlap": 50,
+    "top_k_retrieval": 10,
+    "temperature": 0.7,
+    "model": "gpt-4",
+    "typewriter_speed": 50,
+    "theme": "light",
+    "batch_processing": True
+}
+
+
+class SettingsStore:
+    """
+    Application settings held in memory and backed by a JSON file.
+
+    get() serves the cached copy and only re-reads the file when its
+    modification time changes, checked at most every reload_interval
+    seconds, so edits made by hand or by another worker are picked up
+    without a restart. save() writes to a temporary file and renames it
+    over the original so readers never see a partial file.
+    """
+
+    def __init__(self, path: str = SETTINGS_FILE, reload_interval: float = SETTINGS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._settings: Dict = DEFAULT_SETTINGS.copy()
+        self._mtime: Optional[int] = None
+        self._checked_at = float("-inf")
+
+    def _mtime_on_disk(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        mtime = self._mtime_on_disk()
+        if mtime == self._mtime:
+            return
+        if mtime is None:
+            self._settings = DEFAULT_SETTINGS.copy()
+        else:
+            try:
+                with open(self.path, "r") as f:
+                    self._settings = {**DEFAULT_SETTINGS, **json.load(f)}
+            except (OSError, ValueError) as e:
+                # Keep serving the last good settings until the file is fixed
+                print(f"Could not load {self.path}: {e}")
+        self._mtime = mtime
+
+    def get(self) -> Dict:
+        """Current settings. The returned dict is a copy and safe to modify."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at >= self.reload_interval:
+                self._checked_at = now
+                self._reload_if_changed()
+            return self._settings.copy()
+
+    def save(self, settings: Dict) -> Dict:
+        """Atomically replace the settings file and the cached settings."""
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".settings-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(settings, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._settings = {**DEFAULT_SETTINGS, **settings}
+            self._mtime = self._mtime_on_disk()
+            self._checked_at = time.monotonic()
+            return self._settings.copy()
+
+
+settings_store = SettingsStore()
+
+
+def get_settings() -> Dict:
+    """FastAPI dependency returning the current settings."""
+    return settings_store.get()
+
+
+def chunking_params(settings: Dict) -> Tuple[int, int]:
+    """Chunker (max_tokens, overlap_tokens) from the character-based chunk settings."""
+    max_tokens = max(1, settings["chunk_size"] // CHARS_PER_TOKEN)
+    overlap_tokens = min(settings["chunk_overlap"] // CHARS_PER_TOKEN, max_tokens - 1)
+    return max_tokens, max(0, overlap_tokens)
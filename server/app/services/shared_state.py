@@ -0,0 +1,118 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from typing import Callable, List, Optional
+
+# Lock file and corpus generation counter shared by the worker processes
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", "shared_state")
+# Seconds between attempts of a reader worker to take over as the writer
+WRITER_RETRY_INTERVAL = float(os.getenv("WRITER_RETRY_INTERVAL", "5"))
+
+_COUNTER = struct.Struct("<Q")
+
+
+class SharedState:
+    """
+    Coordination between the worker processes of one server, through
+    two files in SHARED_STATE_DIR:
+    - writer.lock: an exclusive flock held by the one worker that runs
+      ingestion jobs and appends to the local index files. The other
+      workers serve queries and hand uploads to it through the job store.
+      The lock is released when the writer exits, so a reader can take over.
+    - generation: a memory-mapped counter the writer bumps after every
+      corpus change. A reader that sees a new value runs its on_change
+      callbacks, which pick up appended index rows and drop cached
+      retrievals and answers.
+
+    With a single worker the process is always the writer and sync() is
+    a no-op.
+    """
+
+    def __init__(self, directory: str = SHARED_STATE_DIR):
+        self.directory = directory
+        self._counter: Optional[mmap.mmap] = None
+        self._lock_file = None
+        self._seen = 0
+        self._sync_lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def started(self) -> bool:
+        return self._counter is not None
+
+    @property
+    def is_writer(self) -> bool:
+        """True in the writer worker, and in scripts that never started the shared state."""
+        return self._lock_file is not None or not self.started
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, "generation"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _COUNTER.size:
+                os.ftruncate(fd, _COUNTER.size)
+            self._counter = mmap.mmap(fd, _COUNTER.size)
+        finally:
+            os.close(fd)
+        self._seen = self.generation()
+        self.try_become_writer()
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the flock
+            self._lock_file = None
+        if self._counter is not None:
+            self._counter.close()
+            self._counter = None
+        self._callbacks = []
+
+    def try_become_writer(self) -> bool:
+        """Take the writer lock if no other worker holds it."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(self.directory, "writer.lock"), "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def generation(self) -> int:
+        return _COUNTER.unpack_from(self._counter)[0] if self._counter is not None else 0
+
+    def on_change(self, callback: Callable[[], None]):
+        """Run callback in readers whenever the writer has changed the corpus."""
+        self._callbacks.append(callback)
+
+    def publish(self):
+        """Tell the readers the corpus changed. Called by the writer after its files are written."""
+        if self._counter is None:
+            return
+        with self._sync_lock:
+            self._seen = self.generation() + 1
+            _COUNTER.pack_into(self._counter, 0, self._seen)
+
+    @property
+    def stale(self) -> bool:
+        """True in a reader that has not caught up with the writer's last change."""
+        return not self.is_writer and self.generation() != self._seen
+
+    def sync(self):
+        """Run the on_change callbacks if the writer changed the corpus since the last sync."""
+        if not self.stale:
+            return
+        with self._sync_lock:
+            generation = self.generation()
+            if generation == self._seen:
+                return
+            # Changes published while the callbacks run are picked up by the next sync
+            for callback in self._callbacks:
+                callback()
+            self._seen = generation
+
+
+shared_state = SharedState()
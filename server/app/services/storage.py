@@ -1,56 +1,216 @@
-from supabase import create_client, Client
-from typing import List, Dict
+from datetime import datetime, timezone
+from typing import List, Dict, Optional
 import os
+import uuid
+
+from app.services.admission import PriorityLimiter
+from app.services.clients import get_supabase
+from app.services.query_cache import query_cache
+from app.services.shared_state import shared_state
+from app.services.lexical_index import get_lexical_index
+from app.services.vector_index import get_local_index
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# Initialize Supabase client
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_ANON_KEY")
-)
+# Number of rows sent per insert request
+STORAGE_BATCH_SIZE = int(os.getenv("STORAGE_BATCH_SIZE", "200"))
+# Supabase operations in flight across queries and ingestion, and how many
+# of them ingestion may not use so retrieval never waits behind a batch upload
+STORAGE_MAX_CONCURRENCY = int(os.getenv("STORAGE_MAX_CONCURRENCY", "8"))
+STORAGE_INTERACTIVE_RESERVE = int(os.getenv("STORAGE_INTERACTIVE_RESERVE", "2"))
+
+storage_capacity = PriorityLimiter("storage", STORAGE_MAX_CONCURRENCY, STORAGE_INTERACTIVE_RESERVE)
+
+
+def _batched(rows: List, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _corpus_changed():
+    """Drop cached retrievals and answers here and tell the other workers to do the same."""
+    query_cache.invalidate()
+    shared_state.publish()
+
+
+def find_document(filename: str, client=None) -> Optional[Dict]:
+    """The stored document with this filename (id, metadata), if any."""
+    client = client or get_supabase()
+    rows = client.table("documents").select("id, metadata").eq("filename", filename).execute().data
+    return rows[0] if rows else None
+
+
+def fetch_chunks(document_id: str, client=None, page_size: int = 1000) -> List[Dict]:
+    """All chunk rows (id, document_id, content, metadata) of a document."""
+    client = client or get_supabase()
+    chunks, start = [], 0
+    while True:
+        page = (client.table("chunks").select("id, document_id, content, metadata")
+                .eq("document_id", document_id).order("id").range(start, start + page_size - 1).execute().data)
+        chunks.extend(page)
+        if len(page) < page_size:
+            return chunks
+        start += page_size
+
 
-def store_embeddings(chunks: List[str], embeddings: List[List[float]], metadata_list: List[Dict]):
+def _chunk_rows(document_id: str, chunks: List[str], embeddings: List[List[float]], metadata_list: List[Dict]):
+    """Chunk and embedding rows with ids generated here, so both can be inserted in bulk."""
+    # Set here rather than by the column default so the local indexes see the same timestamp
+    created_at = datetime.now(timezone.utc).isoformat()
+    chunk_rows = []
+    embedding_rows = []
+    for chunk, embedding, metadata in zip(chunks, embeddings, metadata_list):
+        chunk_id = str(uuid.uuid4())
+        chunk_rows.append({
+            "id": chunk_id,
+            "document_id": document_id,
+            "content": chunk,
+            "metadata": metadata,
+            "created_at": created_at
+        })
+        embedding_rows.append({
+            "chunk_id": chunk_id,
+            "vector_data": embedding
+        })
+    return chunk_rows, embedding_rows
+
+
+def _delete_chunks(client, chunk_ids: List[str], batch_size: int):
+    for batch in _batched(chunk_ids, batch_size):
+        client.table("embeddings").delete().in_("chunk_id", batch).execute()
+        client.table("chunks").delete().in_("id", batch).execute()
+
+
+def delete_document(document_id: str, chunk_ids: Optional[List[str]] = None, client=None, batch_size: Optional[int] = None):
+    """
+    Delete a document together with its chunks and embeddings.
+    chunk_ids can be passed when they are already known to skip the lookup.
+    """
+    client = client or get_supabase()
+    batch_size = batch_size or STORAGE_BATCH_SIZE
+
+    if chunk_ids is None:
+        rows = client.table("chunks").select("id").eq("document_id", document_id).execute()
+        chunk_ids = [row["id"] for row in rows.data]
+
+    for batch in _batched(chunk_ids, batch_size):
+        client.table("embeddings").delete().in_("chunk_id", batch).execute()
+    client.table("chunks").delete().eq("document_id", document_id).execute()
+    client.table("documents").delete().eq("id", document_id).execute()
+
+    local_index = get_local_index()
+    if local_index is not None:
+        local_index.delete_document(document_id)
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        lexical_index.delete_document(document_id)
+    _corpus_changed()
+
+
+def store_embeddings(chunks: List[str], embeddings: List[List[float]], metadata_list: List[Dict], client=None,
+                     batch_size: Optional[int] = None, document_metadata: Optional[Dict] = None) -> str:
     """
     Store text chunks and their embeddings with metadata into Supabase.
+
+    Ids are generated here so chunk and embedding rows can be inserted in
+    bulk, one request per batch. If any batch fails the partially written
+    document is removed again before the error is re-raised.
+    document_metadata (content hash, version) is merged into the document
+    row's metadata. Returns the new document id.
     """
+    client = client or get_supabase()
+    batch_size = batch_size or STORAGE_BATCH_SIZE
+
+    # Get filename from first metadata
+    filename = metadata_list[0].get('file_name', 'unknown')
+    document_id = str(uuid.uuid4())
+    chunk_rows, embedding_rows = _chunk_rows(document_id, chunks, embeddings, metadata_list)
+
+    # 1. Insert document record
+    document_data = {
+        "id": document_id,
+        "filename": filename,
+        "content": "",  # We don't store full content in documents table
+        "metadata": {"file_name": filename, **(document_metadata or {})}
+    }
+
     try:
-        # Get filename from first metadata
-        filename = metadata_list[0].get('file_name', 'unknown')
-        
-        # 1. Insert document record
-        document_data = {
-            "filename": filename,
-            "content": "",  # We don't store full content in documents table
-            "metadata": {"file_name": filename}
-        }
-        
-        document_result = supabase.table("documents").insert(document_data).execute()
-        document_id = document_result.data[0]["id"]
-        
-        # 2. Insert chunks and embeddings
-        for i, (chunk, embedding, metadata) in enumerate(zip(chunks, embeddings, metadata_list)):
-            # Insert chunk
-            chunk_data = {
-                "document_id": document_id,
-                "content": chunk,
-                "metadata": metadata
-            }
-            
-            chunk_result = supabase.table("chunks").insert(chunk_data).execute()
-            chunk_id = chunk_result.data[0]["id"]
-            
-            # Insert embedding
-            embedding_data = {
-                "chunk_id": chunk_id,
-                "vector_data": embedding
-            }
-            
-            supabase.table("embeddings").insert(embedding_data).execute()
-            
-        print(f"Stored {len(chunks)} chunks for document: {filename}")
-        
+        client.table("documents").insert(document_data).execute()
+
+        # 2. Insert chunks and embeddings in bulk
+        for batch in _batched(chunk_rows, batch_size):
+            client.table("chunks").insert(batch).execute()
+        for batch in _batched(embedding_rows, batch_size):
+            client.table("embeddings").insert(batch).execute()
+
+        # 3. Keep the local vector and keyword indexes in sync when enabled
+        local_index = get_local_index()
+        if local_index is not None:
+            local_index.add(chunk_rows, embeddings)
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            lexical_index.add(chunk_rows)
+
     except Exception as e:
         print(f"Error storing embeddings: {e}")
-        raise e
\ No newline at end of file
+        try:
+            delete_document(document_id, [row["id"] for row in chunk_rows], client=client, batch_size=batch_size)
+        except Exception as cleanup_error:
+            print(f"Error cleaning up document {document_id}: {cleanup_error}")
+        raise e
+
+    _corpus_changed()
+    print(f"Stored {len(chunks)} chunks for document: {filename}")
+    return document_id
+
+
+def update_document(document_id: str, chunks: List[str], embeddings: List[List[float]], metadata_list: List[Dict],
+                    updated_rows: List[Dict], removed_ids: List[str], document_metadata: Dict,
+                    client=None, batch_size: Optional[int] = None):
+    """
+    Apply a chunk diff to a stored document: insert the new chunks and
+    their embeddings, rewrite the metadata of kept chunks that moved,
+    delete removed chunks in bulk and finally record the new content hash
+    and version on the document row.
+
+    If inserting the new chunks fails they are removed again and the
+    document is left as it was. A failure after that leaves the old
+    content hash in place, so uploading the file again finishes the update.
+    """
+    client = client or get_supabase()
+    batch_size = batch_size or STORAGE_BATCH_SIZE
+    chunk_rows, embedding_rows = _chunk_rows(document_id, chunks, embeddings, metadata_list)
+
+    try:
+        for batch in _batched(chunk_rows, batch_size):
+            client.table("chunks").insert(batch).execute()
+        for batch in _batched(embedding_rows, batch_size):
+            client.table("embeddings").insert(batch).execute()
+    except Exception as e:
+        print(f"Error storing new chunks of document {document_id}: {e}")
+        try:
+            _delete_chunks(client, [row["id"] for row in chunk_rows], batch_size)
+        except Exception as cleanup_error:
+            print(f"Error cleaning up new chunks of document {document_id}: {cleanup_error}")
+        raise e
+
+    for batch in _batched(updated_rows, batch_size):
+        client.table("chunks").upsert(batch).execute()
+    _delete_chunks(client, removed_ids, batch_size)
+    client.table("documents").update({"metadata": document_metadata}).eq("id", document_id).execute()
+
+    local_index = get_local_index()
+    if local_index is not None:
+        local_index.add(chunk_rows, embeddings)
+        local_index.update_rows(updated_rows)
+        local_index.delete_chunks(removed_ids)
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        lexical_index.add(chunk_rows)
+        lexical_index.update_rows(updated_rows)
+        lexical_index.delete_chunks(removed_ids)
+
+    _corpus_changed()
+    print(f"Updated document {document_id}: {len(chunk_rows)} added, {len(updated_rows)} moved, "
+          f"{len(removed_ids)} removed")
@@ -0,0 +1,46 @@
+import math
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:  # listed in requirements.txt; without it token counts are estimated
+    tiktoken = None
+
+# Tokenizer shared by the embedding and chat models
+TOKEN_ENCODING = "cl100k_base"
+# Without tiktoken a token is estimated at 4 characters. Digits, code and
+# non-Latin scripts need more tokens than that, so estimates are padded by
+# this factor before they are checked against provider limits
+ESTIMATE_MARGIN = 2.0
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if tiktoken is None:
+        return max(1, len(text) // 4)
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+def count_tokens_many(texts: List[str]) -> List[int]:
+    """count_tokens for many texts; with tiktoken they are encoded in one batch call."""
+    if tiktoken is None:
+        return [max(1, len(text) // 4) for text in texts]
+    if len(texts) < 2:
+        return [count_tokens(text) for text in texts]
+    # encode_ordinary treats special tokens as text, like disallowed_special=()
+    return [len(tokens) for tokens in _get_encoding().encode_ordinary_batch(texts)]
+
+
+def limit_tokens(tokens: int) -> int:
+    """A count from count_tokens to check against a provider limit: padded when it is only an estimate."""
+    if tiktoken is None:
+        return math.ceil(tokens * ESTIMATE_MARGIN)
+    return tokens
@@ -0,0 +1,559 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.filters import ChunkFilter, created_epochs
+from app.services.quantization import VECTOR_QUANTIZATION, VECTOR_RESCORE_FACTOR, check_quantization, make_codes
+
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "supabase")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "vector_index")
+# Switch to the IVF approximate search above this many vectors (0 = always exact)
+LOCAL_INDEX_IVF_THRESHOLD = int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "50000"))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def live_mask(records) -> Tuple[List[Dict], List[bool]]:
+    """
+    Replay a rows.jsonl stream into (rows, alive flags). A
+    {"deleted_document": id} or {"deleted_chunks": [ids]} tombstone only
+    hides rows written before it, so a chunk re-added under the same id
+    after being replaced stays visible.
+    """
+    rows: List[Dict] = []
+    deleted_documents: Dict[str, int] = {}
+    deleted_chunks: Dict[str, int] = {}
+    for record in records:
+        if "deleted_document" in record:
+            deleted_documents[record["deleted_document"]] = len(rows)
+        elif "deleted_chunks" in record:
+            for chunk_id in record["deleted_chunks"]:
+                deleted_chunks[chunk_id] = len(rows)
+        else:
+            rows.append(record)
+    alive = [
+        i >= deleted_documents.get(row["document_id"], 0) and i >= deleted_chunks.get(row["id"], 0)
+        for i, row in enumerate(rows)
+    ]
+    return rows, alive
+
+
+def read_log(path: str, offset: int = 0) -> Tuple[List[Dict], int, Optional[int]]:
+    """
+    Records appended to a rows.jsonl file from byte offset on, the offset
+    after the last complete line and the file's inode (None if missing).
+    A line another process is still writing is left for the next read.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return [], 0, None
+    with f:
+        inode = os.fstat(f.fileno()).st_ino
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    return [json.loads(line) for line in data[:end].splitlines() if line.strip()], offset + end, inode
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting everything."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index: vectors are bucketed by their nearest
+    k-means centroid and a query only scores the rows of the nprobe
+    closest buckets.
+    """
+
+    def __init__(self, matrix: np.ndarray, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        n = len(matrix)
+        self.size = n
+        self.nlist = nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample to keep build time bounded on large corpora
+        sample = matrix[rng.choice(n, size=min(n, self.nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        self.centroids = centroids.astype(np.float32)
+
+        assignment = np.empty(n, dtype=np.int32)
+        for start in range(0, n, 65536):
+            block = np.asarray(matrix[start:start + 65536])
+            assignment[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = top_k_indices(self.centroids @ query, nprobe)
+        return np.concatenate([self.lists[c] for c in probe])
+
+
+class LocalVectorIndex:
+    """
+    Chunk embeddings kept in a contiguous float32 matrix memory-mapped
+    from LOCAL_INDEX_DIR/vectors.f32, with chunk rows in rows.jsonl.
+
+    Both files are append-only; deleted documents and chunks are recorded
+    as tombstones and masked out of searches until compact() rewrites them.
+    Rows are L2-normalized on insert so cosine similarity is a dot product.
+
+    With quantization (int8 or binary) compact codes of every row are kept
+    in memory and searched first; only the best top_k * rescore_factor
+    rows are then read from the memory-mapped float32 matrix and rescored.
+
+    Several worker processes can map the same directory: one writes, the
+    others call refresh() to pick up what it appended. The vectors file is
+    mapped read-only, so its pages are shared between them.
+
+    Above ivf_threshold rows an IVF index is built in a background thread
+    and swapped in when done; until then searches use the previous one and
+    scan the rows added since exactly.
+    """
+
+    def __init__(self, directory: str = LOCAL_INDEX_DIR, ivf_threshold: int = LOCAL_INDEX_IVF_THRESHOLD,
+                 nprobe: int = LOCAL_INDEX_NPROBE, quantization: str = VECTOR_QUANTIZATION,
+                 rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        check_quantization(quantization)
+        self.directory = directory
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.rows_path = os.path.join(directory, "rows.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self._lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self.rows: List[Dict] = []
+        self.positions: Dict[str, int] = {}
+        # Row positions per document and per filename, for filtered searches
+        self.by_document: Dict[str, List[int]] = {}
+        self.by_filename: Dict[str, List[int]] = {}
+        self.created = np.zeros(0, dtype=np.float64)  # created_at as epoch seconds
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.ivf: Optional[IVFIndex] = None
+        self.codes = None
+        # IVF build in progress, and a counter bumped when row positions
+        # change so a build over the old positions is discarded
+        self._ivf_thread: Optional[threading.Thread] = None
+        self._layout = 0
+        # Bytes of rows.jsonl read so far and its inode, for refresh()
+        self._offset = 0
+        self._inode: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def _load(self):
+        self._read_dim()
+        records, self._offset, self._inode = read_log(self.rows_path)
+        self.rows, alive = live_mask(records)
+        self.alive = np.array(alive, dtype=bool)
+        self.created = np.array(created_epochs(self.rows), dtype=np.float64)
+        self._track(self.rows, 0)
+        self.positions = {row["id"]: i for i, row in enumerate(self.rows) if alive[i]}
+        self._remap()
+        self._rebuild_codes()
+
+    def _read_dim(self):
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+
+    def _drop_unindexed_vectors(self):
+        """
+        Drop vectors whose rows never made it to disk, so appends stay
+        aligned. Done before appending rather than on load, because a
+        reader process loading the files must not cut off a write in flight.
+        """
+        expected = len(self.rows) * (self.dim or 0) * 4
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > expected:
+            os.truncate(self.vectors_path, expected)
+
+    def refresh(self):
+        """
+        Catch up with rows and tombstones another process appended since
+        the last load or refresh, and map the grown vectors file again.
+        Reloads everything when the files were replaced by compact().
+        """
+        with self._lock:
+            records, offset, inode = read_log(self.rows_path, self._offset)
+            if inode != self._inode:
+                self._reset()
+                self._load()
+                return
+            self._offset = offset
+            self._read_dim()
+            start, pending = len(self.rows), []
+            for record in records:
+                if "deleted_document" not in record and "deleted_chunks" not in record:
+                    pending.append(record)
+                    continue
+                # A tombstone only hides rows written before it
+                self._append_rows(pending)
+                pending = []
+                if "deleted_document" in record:
+                    self._forget_document(record["deleted_document"])
+                else:
+                    self._forget_chunks(record["deleted_chunks"])
+            self._append_rows(pending)
+            self._remap()
+            if len(self.rows) > start:
+                codes = self.codes if self.codes is not None else make_codes(self.quantization, self.dim)
+                if codes is not None:
+                    self.codes = codes.extended(np.asarray(self.matrix[start:]))
+                self._maybe_rebuild_ivf()
+
+    def _reset(self):
+        self.rows = []
+        self.positions, self.by_document, self.by_filename = {}, {}, {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.created = np.zeros(0, dtype=np.float64)
+        self.matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.ivf = None
+        self.codes = None
+        self._layout += 1
+
+    def _track(self, rows: List[Dict], start: int):
+        for i, row in enumerate(rows, start=start):
+            self.positions[row["id"]] = i
+            self.by_document.setdefault(row["document_id"], []).append(i)
+            self.by_filename.setdefault((row.get("metadata") or {}).get("file_name"), []).append(i)
+
+    def _remap(self):
+        """Map the vectors file again after it has grown."""
+        n = len(self.rows)
+        if not n or self.dim is None:
+            self.matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+            return
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _rebuild_codes(self, block_size: int = 65536):
+        """Quantize every stored vector again, e.g. after loading or compacting."""
+        codes = make_codes(self.quantization, self.dim) if self.dim else None
+        if codes is not None:
+            codes = codes.extended(*(np.asarray(self.matrix[start:start + block_size])
+                                     for start in range(0, len(self.matrix), block_size)))
+        self.codes = codes
+
+    def add(self, rows: List[Dict], vectors: List[List[float]]):
+        """
+        Append chunk rows (id, document_id, content, metadata) and their
+        embeddings. Called after every successful store_embeddings write.
+        """
+        if not rows:
+            return
+        block = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = block.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            if block.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dim vectors, got {block.shape[1]}")
+
+            self._drop_unindexed_vectors()
+            with open(self.vectors_path, "ab") as f:
+                f.write(block.tobytes())
+            with open(self.rows_path, "a") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                self._offset, self._inode = f.tell(), os.fstat(f.fileno()).st_ino
+
+            self._append_rows(rows)
+            self._remap()
+            codes = self.codes if self.codes is not None else make_codes(self.quantization, self.dim)
+            if codes is not None:
+                self.codes = codes.extended(block)
+            self._maybe_rebuild_ivf()
+
+    def _append_rows(self, rows: List[Dict]):
+        if not rows:
+            return
+        self._track(rows, len(self.rows))
+        self.rows = self.rows + list(rows)
+        self.alive = np.concatenate([self.alive, np.ones(len(rows), dtype=bool)])
+        self.created = np.concatenate([self.created, created_epochs(rows)])
+
+    def _forget_document(self, document_id: str):
+        # Rows appended for the document later are not hidden by this tombstone
+        forgotten = self.by_document.pop(document_id, [])
+        alive = self.alive.copy()
+        alive[forgotten] = False
+        for i in forgotten:
+            if self.positions.get(self.rows[i]["id"]) == i:
+                del self.positions[self.rows[i]["id"]]
+        self.alive = alive
+
+    def _forget_chunks(self, chunk_ids: List[str]):
+        alive = self.alive.copy()
+        for chunk_id in chunk_ids:
+            position = self.positions.pop(chunk_id, None)
+            if position is not None:
+                alive[position] = False
+        self.alive = alive
+
+    def delete_document(self, document_id: str):
+        with self._lock:
+            with open(self.rows_path, "a") as f:
+                f.write(json.dumps({"deleted_document": document_id}) + "\n")
+                self._offset, self._inode = f.tell(), os.fstat(f.fileno()).st_ino
+            self._forget_document(document_id)
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        """Mask out individual chunks, e.g. the ones removed by re-ingesting an edited document."""
+        if not chunk_ids:
+            return
+        with self._lock:
+            with open(self.rows_path, "a") as f:
+                f.write(json.dumps({"deleted_chunks": list(chunk_ids)}) + "\n")
+                self._offset, self._inode = f.tell(), os.fstat(f.fileno()).st_ino
+            self._forget_chunks(chunk_ids)
+
+    def update_rows(self, rows: List[Dict]):
+        """Replace the stored rows with the same ids, keeping their vectors."""
+        with self._lock:
+            rows = [{**self.rows[self.positions[row["id"]]], **row} for row in rows if row["id"] in self.positions]
+            if not rows:
+                return
+            vectors = np.asarray(self.matrix[[self.positions[row["id"]] for row in rows]])
+            self.delete_chunks([row["id"] for row in rows])
+            self.add(rows, vectors)
+
+    def compact(self):
+        """Rewrite the files without deleted rows. Only run in the writer; readers reload on refresh()."""
+        with self._lock:
+            keep = np.flatnonzero(self.alive)
+            rows = [self.rows[i] for i in keep]
+            vectors = np.asarray(self.matrix[keep]) if len(keep) else np.zeros((0, self.dim or 0), dtype=np.float32)
+            self.matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+            with open(self.vectors_path + ".tmp", "wb") as f:
+                f.write(vectors.tobytes())
+            with open(self.rows_path + ".tmp", "w") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+            os.replace(self.rows_path + ".tmp", self.rows_path)
+            self._offset, self._inode = os.path.getsize(self.rows_path), os.stat(self.rows_path).st_ino
+            self.rows = rows
+            self.positions, self.by_document, self.by_filename = {}, {}, {}
+            self._track(rows, 0)
+            self.alive = np.ones(len(rows), dtype=bool)
+            self.created = np.array(created_epochs(rows), dtype=np.float64)
+            self._remap()
+            self._rebuild_codes()
+            self.ivf = None
+            self._layout += 1
+            self._maybe_rebuild_ivf()
+
+    def _maybe_rebuild_ivf(self):
+        """Start an IVF build when needed. Called with the lock held; the build itself runs without it."""
+        n = len(self.rows)
+        if not self.ivf_threshold or n < self.ivf_threshold:
+            self.ivf = None
+            return
+        if self._ivf_thread is not None:
+            return  # checked again when the running build finishes
+        # Rows added since the last build are searched exactly, so only
+        # rebuild once that tail grows past a fraction of the index
+        if self.ivf is None or n - self.ivf.size > self.ivf.size // 10:
+            self._ivf_thread = threading.Thread(target=self._build_ivf, args=(self.matrix, self._layout),
+                                                name="ivf-build", daemon=True)
+            self._ivf_thread.start()
+
+    def _build_ivf(self, matrix: np.ndarray, layout: int):
+        try:
+            ivf = IVFIndex(matrix)
+        except Exception as e:
+            print(f"Error building IVF index: {e}")
+            ivf = None
+        with self._lock:
+            self._ivf_thread = None
+            if ivf is None:
+                return
+            if layout == self._layout:
+                self.ivf = ivf
+            # Catch up with rows added or compacted away during the build
+            self._maybe_rebuild_ivf()
+
+    def wait_for_ivf(self, timeout: Optional[float] = None):
+        """Block until a running IVF build has been swapped in, e.g. in benchmarks."""
+        while True:
+            with self._lock:
+                thread = self._ivf_thread
+            if thread is None:
+                return
+            thread.join(timeout)
+            if thread.is_alive():
+                return
+
+    def _shortlist(self, codes, query: np.ndarray, candidates: Optional[np.ndarray], alive: np.ndarray,
+                   count: int) -> np.ndarray:
+        """Rows with the best approximate scores from the compact codes, in row order for rescoring."""
+        if candidates is None:
+            approx = codes.scores(query)[:len(alive)]
+            approx[~alive] = -np.inf
+            best = top_k_indices(approx, count)
+            return np.sort(best[alive[best]])
+        return np.sort(candidates[top_k_indices(codes.scores(query, candidates), count)])
+
+    def search(self, query_embedding: List[float], top_k: int, exact: bool = False,
+               filters: Optional[ChunkFilter] = None) -> List[Dict]:
+        """
+        Return the top_k chunks by cosine similarity, shaped like the
+        match_chunks RPC rows (id, content, metadata, similarity).
+        With filters only the matching rows are scored, exactly, so a
+        filter on a few documents costs less than an unfiltered search.
+        With quantization the candidates are shortlisted on their codes
+        unless exact is set; similarities are always full precision.
+        """
+        with self._lock:
+            matrix, alive, rows, ivf, codes = self.matrix, self.alive, self.rows, self.ivf, self.codes
+            if filters:
+                candidates = filters.candidates(rows, self.by_document, self.by_filename, self.created)
+        if not len(rows):
+            return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        if filters:
+            candidates = candidates[alive[candidates]]
+        elif ivf is None or exact:
+            candidates = None
+        else:
+            tail = np.arange(ivf.size, len(rows))
+            candidates = np.concatenate([ivf.candidates(query, self.nprobe), tail])
+            candidates = candidates[alive[candidates]]
+        if codes is not None and not exact:
+            candidates = self._shortlist(codes, query, candidates, alive, top_k * self.rescore_factor)
+
+        if candidates is None:
+            candidates = np.flatnonzero(alive)
+            scores = matrix @ query
+            scores = scores[candidates] if len(candidates) < len(rows) else scores
+        else:
+            scores = matrix[candidates] @ query
+        best = top_k_indices(scores, top_k)
+
+        return [
+            {
+                "id": rows[candidates[i]]["id"],
+                "content": rows[candidates[i]]["content"],
+                "metadata": rows[candidates[i]]["metadata"],
+                "similarity": float(scores[i]),
+            }
+            for i in best
+        ]
+
+
+    def search_many(self, query_embeddings: List[List[float]], top_k: int, filters: Optional[ChunkFilter] = None,
+                    block_size: int = 64) -> List[List[Dict]]:
+        """
+        search() for several queries at once: exact searches score a block
+        of queries with one matrix-by-matrix product instead of one
+        matrix-vector product per query. Approximate (IVF or quantized)
+        searches run per query.
+        """
+        with self._lock:
+            matrix, alive, rows, ivf, codes = self.matrix, self.alive, self.rows, self.ivf, self.codes
+            if filters:
+                candidates = filters.candidates(rows, self.by_document, self.by_filename, self.created)
+        if not len(rows):
+            return [[] for _ in query_embeddings]
+        if (ivf is not None and not filters) or codes is not None:
+            return [self.search(query, top_k, filters=filters) for query in query_embeddings]
+
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if filters:
+            candidates = candidates[alive[candidates]]
+            vectors = matrix[candidates]
+        else:
+            candidates = np.flatnonzero(alive)
+            vectors = matrix
+
+        results = []
+        for start in range(0, len(queries), block_size):
+            scores = vectors @ queries[start:start + block_size].T
+            if len(scores) > len(candidates):
+                scores = scores[candidates]
+            for column in scores.T:
+                results.append([
+                    {
+                        "id": rows[candidates[i]]["id"],
+                        "content": rows[candidates[i]]["content"],
+                        "metadata": rows[candidates[i]]["metadata"],
+                        "similarity": float(column[i]),
+                    }
+                    for i in top_k_indices(column, top_k)
+                ])
+        return results
+
+_local_index: Optional[LocalVectorIndex] = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index() -> Optional[LocalVectorIndex]:
+    """The shared local index, or None unless RETRIEVAL_BACKEND=local."""
+    global _local_index
+    if RETRIEVAL_BACKEND != "local":
+        return None
+    with _local_index_lock:
+        if _local_index is None:
+            _local_index = LocalVectorIndex()
+    return _local_index
+
+
+def rebuild_from_supabase(client, index: LocalVectorIndex, page_size: int = 1000, ids_per_request: int = 100):
+    """
+    Load every stored chunk and embedding from Supabase into an empty local
+    index. Pages are ordered by id so none are skipped or repeated, and
+    embeddings are fetched ids_per_request chunk ids at a time: the ids go
+    into the URL, and a thousand UUIDs make one of about 37 KB.
+    """
+    start = 0
+    while True:
+        chunks = (client.table("chunks").select("id, document_id, content, metadata, created_at")
+                  .order("id").range(start, start + page_size - 1).execute().data)
+        if not chunks:
+            break
+        ids = [chunk["id"] for chunk in chunks]
+        embeddings = []
+        for offset in range(0, len(ids), ids_per_request):
+            embeddings.extend(client.table("embeddings").select("chunk_id, vector_data")
+                              .in_("chunk_id", ids[offset:offset + ids_per_request]).execute().data)
+        vectors = {
+            row["chunk_id"]: json.loads(row["vector_data"]) if isinstance(row["vector_data"], str) else row["vector_data"]
+            for row in embeddings
+        }
+        rows = [chunk for chunk in chunks if chunk["id"] in vectors]
+        index.add(rows, [vectors[row["id"]] for row in rows])
+        start += page_size
+    print(f"Loaded {len(index)} chunks into the local vector index")
@@ -0,0 +1,68 @@
+import hashlib
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from app.services.parsing import Source
+
+
+def content_hash(source: Source) -> str:
+    """sha256 of a document's bytes, read in blocks when given a path."""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ChunkDiff:
+    """
+    New chunk set of a document against its stored chunks. added holds
+    indices into the new records, updated the stored rows that are kept
+    but need new metadata (their position in the document moved), and
+    removed the ids of stored chunks that no longer occur.
+    """
+    added: List[int] = field(default_factory=list)
+    updated: List[Dict] = field(default_factory=list)
+    unchanged: int = 0
+    removed: List[str] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, int]:
+        return {"added": len(self.added), "updated": len(self.updated),
+                "unchanged": self.unchanged, "removed": len(self.removed)}
+
+
+def diff_chunks(metadata_list: List[Dict], chunks: List[str], stored: List[Dict]) -> ChunkDiff:
+    """
+    Match new chunks to stored rows (id, document_id, content, metadata)
+    by content hash. Identical chunks keep their row and embedding, so only
+    added chunks need embedding. Rows stored before chunk hashes were
+    recorded are hashed from their content.
+    """
+    available = defaultdict(list)
+    for row in stored:
+        available[row["metadata"].get("chunk_hash") or chunk_hash(row["content"])].append(row)
+
+    diff = ChunkDiff()
+    for i, metadata in enumerate(metadata_list):
+        rows = available.get(metadata["chunk_hash"])
+        if not rows:
+            diff.added.append(i)
+            continue
+        row = rows.pop(0)
+        if row["metadata"] == metadata:
+            diff.unchanged += 1
+        else:
+            diff.updated.append({"id": row["id"], "document_id": row["document_id"],
+                                 "content": chunks[i], "metadata": metadata})
+    diff.removed = [row["id"] for rows in available.values() for row in rows]
+    return diff
@@ -0,0 +1,123 @@
+"""
+/query latency while a large /upload/batch is being ingested. With
+--no-priority the embeddings and storage slots reserved for queries are
+turned off and every file of the batch starts at once, as before. A
+final burst sends more queries than QUERY_MAX_CONCURRENCY +
+QUERY_MAX_QUEUE to show the fast 429/503 rejections.
+Runs offline against the stub OpenAI server and the in-memory Supabase
+stand-in; the stub's --rpm limit makes embedding capacity scarce.
+
+    cd server
+    python -m benchmarks.bench_admission --files 24 --rpm 600
+    python -m benchmarks.bench_admission --files 24 --rpm 600 --no-priority
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.bench_e2e import WORDS, run_scenario, synthetic_pdf
+from benchmarks.stub_openai import start_stub_server
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies) or [0.0]
+    return (ordered[len(ordered) // 2] * 1000, ordered[max(0, int(len(ordered) * 0.99) - 1)] * 1000)
+
+
+async def run(args):
+    import httpx
+
+    from app.main import app
+    from app.services import metrics
+    from app.services.clients import clients
+    from app.services.memory_backend import MemoryClient
+
+    clients.start(supabase_client=MemoryClient(latency=args.db_latency))
+    files = [("files", (f"bulk-{i}.pdf", synthetic_pdf(args.pages, i), "application/pdf")) for i in range(args.files)]
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            seed = await client.post("/upload", files={"file": ("seed.pdf", synthetic_pdf(5, 999), "application/pdf")})
+            seed.raise_for_status()
+
+            async def query(i, tag):
+                question = f"{tag}: what does the handbook say about {WORDS[i % len(WORDS)]} case {i}?"
+                response = await client.post("/query", json={"question": question, "top_k": args.top_k})
+                return response.status_code == 200 and "error" not in response.json()
+
+            latencies, errors, _ = await run_scenario(args.queries, args.concurrency, lambda i: query(i, "idle"))
+            p50, p99 = percentiles(latencies)
+            print(f"queries alone          p50={p50:8.1f}ms  p99={p99:8.1f}ms  errors={errors}")
+
+            start = time.perf_counter()
+            upload = asyncio.create_task(client.post("/upload/batch", files=files))
+            await asyncio.sleep(args.head_start)
+            latencies, errors, _ = await run_scenario(args.queries, args.concurrency, lambda i: query(i, "busy"))
+            p50, p99 = percentiles(latencies)
+            print(f"queries during upload  p50={p50:8.1f}ms  p99={p99:8.1f}ms  errors={errors}")
+            body = (await upload).json()
+            print(f"batch of {args.files} files: {time.perf_counter() - start:.1f}s, "
+                  f"{body.get('failed_files')} failed")
+
+            statuses, retry_after = {}, set()
+
+            async def burst(i):
+                question = f"burst: {WORDS[i % len(WORDS)]} {i}?"
+                response = await client.post("/query", json={"question": question, "top_k": args.top_k})
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if "retry-after" in response.headers:
+                    retry_after.add(response.headers["retry-after"])
+
+            await asyncio.gather(*(burst(i) for i in range(args.burst)))
+            print(f"burst of {args.burst} queries: statuses {statuses}, Retry-After {sorted(retry_after)}")
+
+    for line in metrics.registry.render().splitlines():
+        if line.startswith(("rag_admission_rejected_total", "rag_capacity_wait_seconds_sum",
+                            "rag_capacity_wait_seconds_count")):
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=300)
+    parser.add_argument("--head-start", type=float, default=1.0, help="seconds the upload runs before the queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub OpenAI seconds per request")
+    parser.add_argument("--rpm", type=int, default=600, help="stub requests per minute before 429 (0 = unlimited)")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="simulated Supabase seconds per request")
+    parser.add_argument("--no-priority", action="store_true", help="no interactive reserve, unbounded batch uploads")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency=args.latency, requests_per_minute=args.rpm)
+    workdir = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "stub",
+        "SUPABASE_URL": base_url.rsplit("/v1", 1)[0],
+        "SUPABASE_ANON_KEY": "stub",
+        "EMBED_CACHE_PATH": "",
+        "JOBS_DB": os.path.join(workdir.name, "jobs.db"),
+        "SETTINGS_FILE": os.path.join(workdir.name, "settings.json"),
+        "SHARED_STATE_DIR": os.path.join(workdir.name, "shared_state"),
+    })
+    if args.no_priority:
+        os.environ.update({
+            "EMBED_INTERACTIVE_RESERVE": "0",
+            "STORAGE_INTERACTIVE_RESERVE": "0",
+            "UPLOAD_BATCH_CONCURRENCY": str(args.files),
+        })
+    os.chdir(workdir.name)
+    try:
+        asyncio.run(run(args))
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+p50/p99 latency of the query path's external calls (question embedding,
+match_chunks RPC, chat completion) against the local stub, with clients
+built per request as query_docs used to, and with the shared pooled
+client registry.
+
+    cd server
+    python -m benchmarks.bench_clients --requests 300 --concurrency 8
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_openai import start_stub_server
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("SUPABASE_ANON_KEY", "stub")
+
+
+def query_calls(openai_client, supabase_client, i: int):
+    embedding = openai_client.embeddings.create(model="text-embedding-3-small", input=[f"question {i}"]).data[0].embedding
+    rows = supabase_client.rpc("match_chunks", {"query_embedding": embedding[:8], "match_count": 5}).execute().data
+    openai_client.chat.completions.create(
+        model="gpt-4",
+        messages=[{"role": "system", "content": "\n\n".join(row["content"] for row in rows)}],
+    )
+
+
+def run(label, call, requests, concurrency):
+    def timed(i):
+        start = time.perf_counter()
+        call(i)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f"{label:22s} p50={statistics.median(latencies):7.2f}ms  p99={p99:7.2f}ms  {requests / elapsed:7.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub latency per call in seconds")
+    args = parser.parse_args()
+
+    process, base_url = start_stub_server(latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["SUPABASE_URL"] = base_url.rsplit("/v1", 1)[0]
+
+    # Imported after the environment points at the stub
+    from openai import OpenAI
+    from supabase import create_client
+    from app.services.clients import clients
+
+    try:
+        def per_call(i):
+            query_calls(OpenAI(), create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_ANON_KEY"]), i)
+
+        def shared(i):
+            query_calls(clients.openai(), clients.supabase(), i)
+
+        clients.start()
+        for _ in range(2):  # warm up imports and connections once per mode
+            per_call(0)
+            shared(0)
+        run("per-call clients", per_call, args.requests, args.concurrency)
+        run("shared registry", shared, args.requests, args.concurrency)
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+End-to-end benchmark of /upload, /upload/batch and /query, fully offline:
+OpenAI is the stub server running in its own process, and Supabase is the
+in-memory backend with its match_chunks RPC. Uploads cycle through the
+sample_docs PDFs plus synthetic multi-page PDFs, then queries run
+against everything that was ingested.
+
+Reports throughput, p50/p95/p99 latency and peak RSS (this process plus
+its parse workers) per scenario. --save writes the results as a JSON
+baseline and --compare fails when a later run regresses past --tolerance.
+
+    cd server
+    python -m benchmarks.bench_e2e --concurrency 8 --save benchmarks/baselines/local.json
+    python -m benchmarks.bench_e2e --concurrency 8 --compare benchmarks/baselines/local.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.stub_openai import start_stub_server
+
+SAMPLE_DOCS = Path(__file__).resolve().parents[2] / "sample_docs"
+WORDS = ("employee manager policy leave benefits handbook remote office security review training expense "
+         "travel approval schedule holiday insurance conduct payroll overtime equipment laptop vpn").split()
+
+
+def synthetic_pdf(pages: int, seed: int) -> bytes:
+    """A PDF with `pages` pages of handbook-like sentences."""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        paragraphs = []
+        for _ in range(5):
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 18))).capitalize() + "."
+                         for _ in range(rng.randint(3, 5))]
+            paragraphs.append(" ".join(sentences))
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), f"Section {seed}.{page_number}\n\n" + "\n\n".join(paragraphs),
+                            fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def load_corpus(synthetic_docs: int, synthetic_pages: int):
+    corpus = [(path.name, path.read_bytes()) for path in sorted(SAMPLE_DOCS.glob("*.pdf"))]
+    corpus += [(f"synthetic-{i}.pdf", synthetic_pdf(synthetic_pages, i)) for i in range(synthetic_docs)]
+    return corpus
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+class RssSampler:
+    """
+    Samples the resident memory of this process and its descendants (the
+    parse worker processes) every interval seconds on Linux. Elsewhere the
+    peak falls back to getrusage for this process alone.
+    """
+
+    def __init__(self, interval: float = 0.05, exclude=()):
+        self.interval = interval
+        self.exclude = set(exclude)
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _total_kb(self) -> int:
+        total, pending = 0, [os.getpid()]
+        while pending:
+            pid = pending.pop()
+            if pid in self.exclude:
+                continue
+            total += _rss_kb(pid)
+            pending.extend(_children(pid))
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, self._total_kb())
+            self._stop.wait(self.interval)
+
+    def reset(self):
+        self.peak_kb = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_mb(self) -> float:
+        peak_kb = self.peak_kb
+        if not peak_kb:
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == "darwin":
+                peak_kb //= 1024
+        return round(peak_kb / 1024, 1)
+
+
+def summarize(name: str, latencies, errors: int, elapsed: float, concurrency: int, sampler: RssSampler,
+              payload_bytes: int = 0) -> dict:
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 1)
+
+    result = {
+        "requests": len(ordered),
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 2),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "peak_rss_mb": sampler.peak_mb,
+    }
+    if payload_bytes:
+        result["throughput_mb_s"] = round(payload_bytes / 2**20 / elapsed, 2)
+    print(f"{name:13s} n={result['requests']:4d} c={concurrency:3d} err={errors:3d} "
+          f"{result['throughput_rps']:8.2f} req/s  p50={result['p50_ms']:8.1f}ms  p95={result['p95_ms']:8.1f}ms  "
+          f"p99={result['p99_ms']:8.1f}ms  rss={result['peak_rss_mb']:7.1f}MB")
+    return result
+
+
+async def run_scenario(requests: int, concurrency: int, send):
+    """Run send(i) for i in range(requests) with at most concurrency in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            ok = await send(i)
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_suite(args, corpus, sampler: RssSampler) -> dict:
+    import httpx
+
+    from app.main import app
+    from app.services.clients import clients
+    from app.services.memory_backend import MemoryClient
+
+    memory = MemoryClient(latency=args.db_latency)
+    clients.start(supabase_client=memory)
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+            async def upload(i):
+                name, data = corpus[i % len(corpus)]
+                response = await client.post("/upload", files={"file": (f"u{i}-{name}", data, "application/pdf")})
+                return response.status_code == 200 and response.json().get("num_chunks", 0) > 0
+
+            async def upload_batch(i):
+                files = []
+                for j in range(args.batch_size):
+                    name, data = corpus[(i * args.batch_size + j) % len(corpus)]
+                    files.append(("files", (f"b{i}-{j}-{name}", data, "application/pdf")))
+                response = await client.post("/upload/batch", files=files)
+                return response.status_code == 200 and response.json().get("failed_files") == 0
+
+            async def query(i):
+                question = f"What does the handbook say about {WORDS[i % len(WORDS)]} policy number {i}?"
+                response = await client.post("/query", json={"question": question, "top_k": args.top_k})
+                return response.status_code == 200 and "error" not in response.json()
+
+            sizes = [len(corpus[i % len(corpus)][1]) for i in range(args.uploads)]
+            sampler.reset()
+            latencies, errors, elapsed = await run_scenario(args.uploads, args.concurrency, upload)
+            results["upload"] = summarize("upload", latencies, errors, elapsed, args.concurrency, sampler, sum(sizes))
+
+            sizes = [len(corpus[i % len(corpus)][1]) for i in range(args.batches * args.batch_size)]
+            sampler.reset()
+            concurrency = max(1, args.concurrency // args.batch_size)
+            latencies, errors, elapsed = await run_scenario(args.batches, concurrency, upload_batch)
+            results["upload_batch"] = summarize("upload_batch", latencies, errors, elapsed, concurrency, sampler, sum(sizes))
+
+            sampler.reset()
+            latencies, errors, elapsed = await run_scenario(args.queries, args.concurrency, query)
+            results["query"] = summarize("query", latencies, errors, elapsed, args.concurrency, sampler)
+    results["stored_chunks"] = len(memory.tables.get("chunks", []))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Scenario metrics that got worse than the baseline by more than tolerance."""
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        current = results["scenarios"].get(name)
+        if not current:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"):
+            if current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {current[metric]}")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}.throughput_rps: {base['throughput_rps']} -> {current['throughput_rps']}")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}.errors: {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=16)
+    parser.add_argument("--batches", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--synthetic-docs", type=int, default=4)
+    parser.add_argument("--synthetic-pages", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub OpenAI seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="stub seconds per generated token")
+    parser.add_argument("--rpm", type=int, default=0, help="stub requests per minute before 429 (0 = unlimited)")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="simulated Supabase seconds per request")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency=args.latency, requests_per_minute=args.rpm,
+                                       token_latency=args.token_latency)
+    workdir = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "stub",
+        "SUPABASE_URL": base_url.rsplit("/v1", 1)[0],
+        "SUPABASE_ANON_KEY": "stub",
+        # Every run embeds from scratch and keeps its state out of the repo
+        "EMBED_CACHE_PATH": "",
+        "JOBS_DB": os.path.join(workdir.name, "jobs.db"),
+        "SETTINGS_FILE": os.path.join(workdir.name, "settings.json"),
+        "LOCAL_INDEX_DIR": os.path.join(workdir.name, "vector_index"),
+        "LEXICAL_INDEX_DIR": os.path.join(workdir.name, "lexical_index"),
+    })
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(workdir.name)  # debug output files land in the temp directory
+
+    corpus = load_corpus(args.synthetic_docs, args.synthetic_pages)
+    print(f"corpus: {len(corpus)} PDFs, {sum(len(data) for _, data in corpus) / 2**20:.1f} MB")
+
+    try:
+        with RssSampler(exclude=[stub.pid]) as sampler:
+            scenarios = asyncio.run(run_suite(args, corpus, sampler))
+    finally:
+        stub.terminate()
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "stored_chunks": scenarios.pop("stored_chunks"),
+        "scenarios": scenarios,
+    }
+    if save_path:
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        with open(save_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved baseline to {save_path}")
+    if compare_path:
+        with open(compare_path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("no regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measure the embedding engine against the local stub OpenAI server:
+sequential vs concurrent batch dispatch, and retries under rate limits.
+
+    cd server
+    python -m benchmarks.bench_embedding --chunks 2000 --batch-tokens 20000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_openai import start_stub_server, stub_stats
+
+
+def run(embedding, chunks, concurrency):
+    embedding._dispatch_pool = ThreadPoolExecutor(max_workers=concurrency)
+    start = time.perf_counter()
+    # Without the cache every run sends all batches, so the runs are comparable
+    result = embedding.embed_texts(chunks, use_cache=False)
+    elapsed = time.perf_counter() - start
+    print(f"concurrency={concurrency:2d}  batches={result.requests:3d}  retries={result.retries:3d}  "
+          f"failed={len(result.failed):4d}  {elapsed:7.3f}s  {len(chunks) / elapsed:8.0f} chunks/s")
+    result.raise_for_failures()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.1, help="stub seconds per request")
+    parser.add_argument("--batch-tokens", type=int, default=20000)
+    parser.add_argument("--rpm", type=int, default=0, help="stub requests per minute limit")
+    args = parser.parse_args()
+
+    process, base_url = start_stub_server(latency=args.latency, requests_per_minute=args.rpm)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark-key")
+
+    from app.services import embedding
+    embedding.EMBED_BATCH_TOKENS = args.batch_tokens
+    embedding.EMBED_BACKOFF_SECONDS = 0.05
+
+    chunks = [f"Section {i}. Employees accrue paid time off monthly. " * 8 for i in range(args.chunks)]
+    for concurrency in (1, 2, 4, 8):
+        run(embedding, chunks, concurrency)
+    stats = stub_stats(base_url)
+    print(f"stub requests={stats['requests']} rate_limited={stats['rate_limited']}")
+    process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Re-embed a corpus with a small fraction of edited chunks and compare API
+calls and time with and without the embedding cache.
+
+    cd server
+    python -m benchmarks.bench_embedding_cache --chunks 3000 --edit-ratio 0.05
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.stub_openai import start_stub_server, stub_stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--edit-ratio", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    process, base_url = start_stub_server(latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark-key")
+
+    from app.services import embedding
+    from app.services.embedding_cache import EmbeddingCache
+    embedding.EMBED_BATCH_TOKENS = 20000
+
+    corpus = [f"Policy {i}: remote work requires manager approval. " * 6 for i in range(args.chunks)]
+    edited = list(corpus)
+    edits = int(args.chunks * args.edit_ratio)
+    for i in random.Random(0).sample(range(args.chunks), edits):
+        edited[i] = edited[i] + " Updated."
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "cache.db"))
+        embedding.get_cache = lambda: cache
+
+        for label, texts, use_cache in (
+            ("initial ingest", corpus, True),
+            ("re-ingest, no cache", edited, False),
+            ("re-ingest, cached", edited, True),
+        ):
+            before = stub_stats(base_url)["requests"]
+            start = time.perf_counter()
+            result = embedding.embed_texts(texts, use_cache=use_cache)
+            elapsed = time.perf_counter() - start
+            result.raise_for_failures()
+            requests = stub_stats(base_url)["requests"] - before
+            print(f"{label:22s} api_requests={requests:3d}  cache_hits={result.cache_hits:5d}  {elapsed:7.3f}s")
+
+        stats = cache.stats()
+        print(f"cache stats: {stats}")
+        # Only the edited chunks miss on the cached re-ingest
+        expected = {"hits": args.chunks - edits, "misses": args.chunks + edits, "entries": args.chunks + edits}
+        if stats != expected:
+            raise SystemExit(f"unexpected cache stats {stats}, expected {expected}")
+        cache.close()
+    process.terminate()
+
+
+if __name__ == "__main__":
+    main()
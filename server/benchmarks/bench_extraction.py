@@ -0,0 +1,53 @@
+"""
+Pages/sec of PDF text extraction on a synthetic manual: the old per-page
+`text +=` loop over a bytes copy, the streaming single-core reader, and
+page ranges spread over a process pool.
+
+    cd server
+    python -m benchmarks.bench_extraction --pages 800 --workers 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+from app.services.parsing import iter_pages
+from benchmarks.bench_e2e import synthetic_pdf
+
+
+def legacy_extract(data: bytes) -> str:
+    text = ""
+    with fitz.open(stream=bytes(data), filetype="pdf") as doc:
+        for page in doc:
+            text += page.get_text()
+    return text
+
+
+def run(label, fn, pages):
+    start = time.perf_counter()
+    text = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:24s} {elapsed * 1000:8.1f}ms  {pages / elapsed:8.1f} pages/s  ({len(text)} chars)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=800)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    data = synthetic_pdf(args.pages, seed=0)
+    print(f"{args.pages} pages, {len(data) / 1e6:.1f} MB, {args.workers} workers")
+    view = memoryview(data)
+
+    run("text += (before)", lambda: legacy_extract(data), args.pages)
+    run("streaming, 1 core", lambda: "".join(text for _, text in iter_pages("manual.pdf", view)), args.pages)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(abs, range(args.workers)))  # start the workers outside the timing
+        run("page ranges, pool", lambda: "".join(text for _, text in iter_pages("manual.pdf", view, pool)), args.pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Overhead of the metrics layer: cost per stage timer, counter and
+histogram update, /metrics rendering, and requests per second through
+the request-metrics middleware against a bare app.
+
+    cd server
+    python -m benchmarks.bench_metrics --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.services import metrics
+
+
+def per_op(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:34s} {elapsed / iterations * 1e9:8.0f} ns/op")
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        with metrics.stage("bench", "handler"):
+            return {"status": "ok"}
+
+    if instrumented:
+        app.add_middleware(metrics.RequestMetricsMiddleware, server_timing=True)
+    return app
+
+
+async def requests_per_second(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):
+            await client.get("/health")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/health")
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    def timed_stage():
+        with metrics.stage("bench", "noop"):
+            pass
+
+    per_op("stage() context manager", timed_stage, args.iterations)
+    per_op("Counter.inc with labels", lambda: metrics.cache_lookups_total.inc(cache="bench", result="hit"), args.iterations)
+    per_op("Histogram.observe with labels", lambda: metrics.stage_seconds.observe(0.02, pipeline="bench", stage="x"), args.iterations)
+
+    start = time.perf_counter()
+    text = metrics.registry.render()
+    print(f"render /metrics: {len(text.splitlines())} lines in {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    bare = asyncio.run(requests_per_second(make_app(False), args.requests))
+    instrumented = asyncio.run(requests_per_second(make_app(True), args.requests))
+    print(f"bare app          {bare:8.0f} req/s")
+    print(f"with middleware   {instrumented:8.0f} req/s  ({(1 / instrumented - 1 / bare) * 1e6:.0f} us/request overhead)")
+
+
+if __name__ == "__main__":
+    main()
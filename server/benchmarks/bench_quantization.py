@@ -0,0 +1,91 @@
+"""
+Memory per vector, query latency and recall@k of the local vector index
+for each embedding size and quantization setting. Shortened embeddings
+are simulated like the dimensions parameter produces them: the leading
+components of a full-size vector, which carry most of its variance.
+Recall is measured against exact search over the full-size vectors.
+
+    cd server
+    python -m benchmarks.bench_quantization --vectors 100000 --dims 1536,512,256
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.vector_index import LocalVectorIndex
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    # Leading components carry more variance, like embeddings trained for shortening
+    return vectors / np.sqrt(1 + np.arange(dim, dtype=np.float32) / 64)
+
+
+def build(tmp: str, data: np.ndarray, quantization: str, rescore_factor: int) -> LocalVectorIndex:
+    index = LocalVectorIndex(tmp, ivf_threshold=0, quantization=quantization, rescore_factor=rescore_factor)
+    for offset in range(0, len(data), 10000):
+        block = data[offset:offset + 10000]
+        rows = [{"id": str(offset + i), "document_id": "bench", "content": "", "metadata": {}} for i in range(len(block))]
+        index.add(rows, block)
+    return index
+
+
+def measure(index, queries, top_k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([row["id"] for row in index.search(query, top_k)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return results, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dims", default="1536,512,256")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--max-int8-ratio", type=float, default=1.0,
+                        help="fail if int8 p50 exceeds this multiple of the none p50")
+    args = parser.parse_args()
+
+    dims = [int(d) for d in args.dims.split(",")]
+    full = max(dims)
+    data = synthetic_embeddings(args.vectors, full, args.clusters)
+    queries = synthetic_embeddings(args.queries, full, args.clusters, seed=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        truth, _, _ = measure(build(f"{tmp}/truth", data, "none", 1), queries, args.top_k)
+
+    print(f"{args.vectors} vectors, top_k={args.top_k}, rescore_factor={args.rescore_factor}")
+    print(f"{'dim':>5s} {'codes':7s} {'hot bytes/vec':>13s} {'p50 ms':>8s} {'p99 ms':>8s} {'recall':>7s}")
+    slow = []
+    for dim in dims:
+        p50s = {}
+        for quantization in ("none", "int8", "binary"):
+            with tempfile.TemporaryDirectory() as tmp:
+                index = build(tmp, data[:, :dim], quantization, args.rescore_factor)
+                found, p50, p99 = measure(index, queries[:, :dim], args.top_k)
+                # Without codes every search scans the float32 matrix
+                hot = index.codes.bytes_per_vector if index.codes is not None else dim * 4
+            recall = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(truth, found)])
+            print(f"{dim:5d} {quantization:7s} {hot:13d} {p50:8.2f} {p99:8.2f} {recall:7.3f}")
+            p50s[quantization] = p50
+        if p50s["int8"] > args.max_int8_ratio * p50s["none"]:
+            slow.append(f"{dim} dims: int8 p50 {p50s['int8']:.2f}ms vs none {p50s['none']:.2f}ms")
+    # int8 only pays for itself if it saves memory without costing latency
+    if slow:
+        raise SystemExit("int8 search slower than exact search: " + "; ".join(slow))
+
+
+if __name__ == "__main__":
+    main()
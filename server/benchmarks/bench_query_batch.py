@@ -0,0 +1,85 @@
+"""
+Evaluation-set throughput: questions sent one at a time through /query,
+the way evaluation jobs used to, against a single /query/batch request.
+Runs offline against the stub OpenAI server and the in-memory Supabase
+stand-in, after uploading sample_docs.
+
+    cd server
+    python -m benchmarks.bench_query_batch --questions 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.bench_e2e import WORDS, load_corpus
+from benchmarks.stub_openai import start_stub_server
+
+
+async def run(args):
+    import httpx
+
+    from app.main import app
+    from app.services.clients import clients
+    from app.services.memory_backend import MemoryClient
+
+    clients.start(supabase_client=MemoryClient(latency=args.db_latency))
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name, data in load_corpus(synthetic_docs=2, synthetic_pages=10):
+                response = await client.post("/upload", files={"file": (name, data, "application/pdf")})
+                response.raise_for_status()
+
+            def questions(mode):
+                # Different wording per mode so neither run hits the other's caches
+                return [f"{mode}: what does the handbook say about {WORDS[i % len(WORDS)]} case {i}?"
+                        for i in range(args.questions)]
+
+            start = time.perf_counter()
+            for question in questions("single"):
+                response = await client.post("/query", json={"question": question, "top_k": args.top_k})
+                assert "error" not in response.json(), response.json()
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = await client.post("/query/batch", json={"questions": questions("batch"), "top_k": args.top_k})
+            body = response.json()
+            assert body.get("failed_questions") == 0, body
+            batched = time.perf_counter() - start
+
+    print(f"/query one at a time  {sequential:7.2f}s  {args.questions / sequential:7.1f} questions/s")
+    print(f"/query/batch          {batched:7.2f}s  {args.questions / batched:7.1f} questions/s  "
+          f"({sequential / batched:.1f}x)")
+    print(f"batch timings: {body['timings']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub OpenAI seconds per request")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="simulated Supabase seconds per request")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency=args.latency)
+    workdir = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "stub",
+        "SUPABASE_URL": base_url.rsplit("/v1", 1)[0],
+        "SUPABASE_ANON_KEY": "stub",
+        "EMBED_CACHE_PATH": "",
+        "JOBS_DB": os.path.join(workdir.name, "jobs.db"),
+        "SETTINGS_FILE": os.path.join(workdir.name, "settings.json"),
+    })
+    os.chdir(workdir.name)
+    try:
+        asyncio.run(run(args))
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
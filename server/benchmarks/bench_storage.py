@@ -0,0 +1,63 @@
+"""
+Compare row-by-row chunk writes with the bulk write path in storage.py
+against the in-memory Supabase stand-in.
+
+    cd server
+    python -m benchmarks.bench_storage --chunks 300 --latency 0.02
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "offline-benchmark-key")
+
+from app.services import storage
+from app.services.memory_backend import MemoryClient
+
+
+def store_row_by_row(client, chunks, embeddings, metadata_list):
+    """The previous write path: two round-trips per chunk."""
+    document = client.table("documents").insert({"filename": "bench.pdf", "content": "", "metadata": {}}).execute()
+    document_id = document.data[0]["id"]
+    for chunk, embedding, metadata in zip(chunks, embeddings, metadata_list):
+        chunk_result = client.table("chunks").insert({"document_id": document_id, "content": chunk, "metadata": metadata}).execute()
+        client.table("embeddings").insert({"chunk_id": chunk_result.data[0]["id"], "vector_data": embedding}).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per request")
+    parser.add_argument("--batch-size", type=int, default=storage.STORAGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    chunks = [f"chunk {i} " * 40 for i in range(args.chunks)]
+    embeddings = [[0.001 * i] * args.dim for i in range(args.chunks)]
+    metadata_list = [{"file_name": "bench.pdf", "chunk_index": i} for i in range(args.chunks)]
+
+    client = MemoryClient(latency=args.latency)
+    start = time.perf_counter()
+    store_row_by_row(client, chunks, embeddings, metadata_list)
+    row_time = time.perf_counter() - start
+    print(f"row-by-row: {client.requests:5d} requests  {row_time:8.3f}s")
+
+    client = MemoryClient(latency=args.latency)
+    start = time.perf_counter()
+    storage.store_embeddings(chunks, embeddings, metadata_list, client=client, batch_size=args.batch_size)
+    bulk_time = time.perf_counter() - start
+    print(f"bulk:       {client.requests:5d} requests  {bulk_time:8.3f}s  ({row_time / bulk_time:.1f}x faster)")
+
+    # A failing batch must not leave any rows behind
+    client = MemoryClient(fail_after=2)
+    try:
+        storage.store_embeddings(chunks, embeddings, metadata_list, client=client, batch_size=args.batch_size)
+    except RuntimeError:
+        pass
+    leftover = {name: len(rows) for name, rows in client.tables.items()}
+    print(f"rows left after failed write: {leftover}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Recall vs latency of the local vector index: exact argpartition search
+against IVF search at several nprobe settings, on synthetic clustered
+embeddings.
+
+    cd server
+    python -m benchmarks.bench_vector_index --vectors 100000 --dim 1536
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.vector_index import IVFIndex, LocalVectorIndex
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+
+
+def measure(index, queries, top_k, exact):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([row["id"] for row in index.search(query, top_k, exact=exact)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return results, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.vectors, args.dim, args.clusters)
+    queries = synthetic_embeddings(args.queries, args.dim, args.clusters, seed=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(tmp, ivf_threshold=0)
+        start = time.perf_counter()
+        for offset in range(0, args.vectors, 10000):
+            block = data[offset:offset + 10000]
+            rows = [{"id": str(offset + i), "document_id": "bench", "content": "", "metadata": {}} for i in range(len(block))]
+            index.add(rows, block)
+        print(f"indexed {args.vectors} x {args.dim} vectors in {time.perf_counter() - start:.2f}s")
+
+        truth, p50, p99 = measure(index, queries, args.top_k, exact=True)
+        print(f"exact          p50={p50:7.2f}ms  p99={p99:7.2f}ms  recall@{args.top_k}=1.000")
+
+        start = time.perf_counter()
+        index.ivf = IVFIndex(index.matrix)
+        print(f"built IVF with {index.ivf.nlist} lists in {time.perf_counter() - start:.2f}s")
+        for nprobe in (1, 4, 8, 16, 32):
+            index.nprobe = nprobe
+            found, p50, p99 = measure(index, queries, args.top_k, exact=False)
+            recall = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(truth, found)])
+            print(f"ivf nprobe={nprobe:3d} p50={p50:7.2f}ms  p99={p99:7.2f}ms  recall@{args.top_k}={recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
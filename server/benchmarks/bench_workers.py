@@ -0,0 +1,132 @@
+"""
+/query throughput of the server run as 1, 2 and 4 uvicorn worker
+processes over the same local vector index. The index is built once in
+a temp directory from stub embeddings; every worker maps the same
+vectors file, so adding workers adds cores without copying the index.
+OpenAI is the stub server with no added latency, so the time per query
+is mostly the exact vector search and the request handling in Python.
+
+Every question is unique, so no query cache hides the search. The load
+generator runs in this process; on small machines it can become the
+bottleneck before the workers do.
+
+    cd server
+    python -m benchmarks.bench_workers --vectors 100000 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_e2e import WORDS, run_scenario
+from benchmarks.stub_openai import _free_port, fake_embedding, start_stub_server
+
+
+def build_index(directory: str, vectors: int, dim: int):
+    """Fill a local index with stub embeddings of synthetic chunks."""
+    from app.services.vector_index import LocalVectorIndex
+
+    index = LocalVectorIndex(directory, ivf_threshold=0)
+    rng = np.random.default_rng(0)
+    for offset in range(0, vectors, 5000):
+        count = min(5000, vectors - offset)
+        texts = [" ".join(rng.choice(WORDS, size=12)) + f" {offset + i}" for i in range(count)]
+        rows = [{"id": f"chunk-{offset + i}", "document_id": f"doc-{(offset + i) // 50}", "content": text,
+                 "metadata": {"file_name": f"doc-{(offset + i) // 50}.pdf"}} for i, text in enumerate(texts)]
+        index.add(rows, [fake_embedding(text, dim) for text in texts])
+    return len(index)
+
+
+def start_server(workers: int, env: dict):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health").status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"server with {workers} workers did not start")
+
+
+async def load(base_url: str, requests: int, concurrency: int, top_k: int, offset: int):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+
+        async def query(i):
+            question = f"What does the handbook say about {WORDS[i % len(WORDS)]} policy number {offset + i}?"
+            response = await client.post("/query", json={"question": question, "top_k": top_k})
+            return response.status_code == 200 and "error" not in response.json()
+
+        return await run_scenario(requests, concurrency, query)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server()
+    workdir = tempfile.TemporaryDirectory()
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": stub_url,
+        "OPENAI_API_KEY": "stub",
+        "SUPABASE_URL": stub_url.rsplit("/v1", 1)[0],
+        "SUPABASE_ANON_KEY": "stub",
+        "RETRIEVAL_BACKEND": "local",
+        "LOCAL_INDEX_DIR": os.path.join(workdir.name, "vector_index"),
+        "LOCAL_INDEX_IVF_THRESHOLD": "0",
+        "EMBEDDING_DIMENSIONS": str(args.dim),
+        "EMBED_CACHE_PATH": "",
+        "JOBS_DB": os.path.join(workdir.name, "jobs.db"),
+        "SETTINGS_FILE": os.path.join(workdir.name, "settings.json"),
+        "SHARED_STATE_DIR": os.path.join(workdir.name, "shared_state"),
+    }
+    try:
+        count = build_index(env["LOCAL_INDEX_DIR"], args.vectors, args.dim)
+        print(f"{count} vectors of {args.dim} dims, {os.cpu_count()} CPUs, concurrency {args.concurrency}")
+        print(f"{'workers':>7s} {'qps':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'errors':>6s} {'speedup':>7s}")
+        baseline = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            server, base_url = start_server(workers, env)
+            try:
+                asyncio.run(load(base_url, args.warmup, args.concurrency, args.top_k, offset=-args.warmup))
+                latencies, errors, elapsed = asyncio.run(
+                    load(base_url, args.queries, args.concurrency, args.top_k, offset=workers * args.queries))
+            finally:
+                server.terminate()
+                server.wait()
+            qps = args.queries / elapsed
+            baseline = baseline or qps
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            print(f"{workers:7d} {qps:8.1f} {p50:8.1f} {p99:8.1f} {errors:6d} {qps / baseline:6.2f}x")
+    finally:
+        stub.terminate()
+        workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs with
+configurable latency, rate limiting and error injection. It also answers
+the Supabase match_chunks and match_chunks_batch RPCs and table reads
+under /rest/v1 with synthetic rows, so the query path can run without a
+database.
+
+    python -m benchmarks.stub_openai --port 8100 --latency 0.05 --rpm 600
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 and
+SUPABASE_URL=http://127.0.0.1:8100.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import socket
+import struct
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dimensions: int = 1536):
+    """Deterministic unit vector derived from the text."""
+    digest = hashlib.shake_256(text.encode("utf-8")).digest(dimensions)
+    vector = [(b - 127.5) for b in digest]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [round(v / norm, 6) for v in vector]
+
+
+class StubState:
+    def __init__(self, latency: float = 0.0, requests_per_minute: int = 0, error_rate: float = 0.0,
+                 token_latency: float = 0.0, answer_tokens: int = 40):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def admit(self) -> float:
+        """
+        Sliding one-minute window. Returns 0 when the request is admitted,
+        otherwise the seconds until a slot frees up for the Retry-After header.
+        """
+        with self._lock:
+            self.requests += 1
+            if not self.requests_per_minute:
+                return 0
+            now = time.monotonic()
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            if len(self._window) >= self.requests_per_minute:
+                self.rate_limited += 1
+                return max(0.01, 60 - (now - self._window[0]))
+            self._window.append(now)
+            return 0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY every
+    # keep-alive response waits on the client's delayed ACK
+    disable_nagle_algorithm = True
+    state: StubState = StubState()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/stats":
+            state = self.state
+            return self._send(200, {"requests": state.requests, "rate_limited": state.rate_limited, "errors": state.errors})
+        if self.path.startswith("/rest/v1/"):
+            if self.state.latency:
+                time.sleep(self.state.latency)
+            return self._send(200, [])
+        self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = self._read_json()
+        state = self.state
+        retry_after = state.admit()
+        if retry_after:
+            return self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": f"{retry_after:.2f}"})
+        if state.latency:
+            time.sleep(state.latency)
+        if state.error_rate and random.random() < state.error_rate:
+            state.errors += 1
+            return self._send(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(body)
+        if self.path.endswith("/rpc/match_chunks"):
+            return self._match_chunks(body)
+        if self.path.endswith("/rpc/match_chunks_batch"):
+            return self._match_chunks_batch(body)
+        self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _embeddings(self, body: dict):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or 1536
+        vectors = [fake_embedding(text, dimensions) for text in inputs]
+        if body.get("encoding_format") == "base64":
+            # The SDK asks for packed float32 by default, like the real API returns
+            vectors = [base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode("ascii") for vector in vectors]
+        data = [
+            {"object": "embedding", "index": i, "embedding": vector}
+            for i, vector in enumerate(vectors)
+        ]
+        tokens = sum(max(1, len(text) // 4) for text in inputs)
+        self._send(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+    def _chat(self, body: dict):
+        prompt = json.dumps(body.get("messages", []))
+        words = [f"word{b % 50}" for b in hashlib.shake_256(prompt.encode("utf-8")).digest(self.state.answer_tokens)]
+        model = body.get("model", "gpt-4")
+        if not body.get("stream"):
+            time.sleep(self.state.token_latency * len(words))
+            return self._send(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(words),
+                          "total_tokens": len(prompt) // 4 + len(words)},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(self.state.token_latency)
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _synthetic_rows(match_count: int):
+        return [
+            {"id": f"chunk-{i}", "content": f"Synthetic chunk {i} about leave policy and approvals.",
+             "metadata": {"file_name": "stub.pdf", "chunk_index": i}, "similarity": 1.0 - i / 100}
+            for i in range(match_count)
+        ]
+
+    def _match_chunks(self, body: dict):
+        self._send(200, self._synthetic_rows(body.get("match_count", 10)))
+
+    def _match_chunks_batch(self, body: dict):
+        rows = [
+            {"query_index": q, **row}
+            for q in range(len(body.get("query_embeddings", [])))
+            for row in self._synthetic_rows(body.get("match_count", 10))
+        ]
+        self._send(200, rows)
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(port: int, **state_options):
+    state = StubState(**state_options)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(port: int = 0, **state_options):
+    """
+    Run the stub in a separate process so it does not compete with the
+    code under test for the GIL. Returns (process, base_url).
+    """
+    port = port or _free_port()
+    process = multiprocessing.Process(target=serve, args=(port,), kwargs=state_options, daemon=True)
+    process.start()
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            stub_stats(base_url)
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, base_url
+
+
+def stub_stats(base_url: str) -> dict:
+    """Request, 429 and error counters of a running stub."""
+    root = base_url.rsplit("/v1", 1)[0]
+    with urllib.request.urlopen(f"{root}/stats") as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before returning 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated chat token")
+    args = parser.parse_args()
+
+    print(f"Stub OpenAI server listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        serve(args.port, latency=args.latency, requests_per_minute=args.rpm, error_rate=args.error_rate,
+              token_latency=args.token_latency)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
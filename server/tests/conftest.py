@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+# Settings are read when the app modules are imported: keep every file the
+# tests create in a temporary directory and the optional backends off
+_state_dir = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ.update({
+    "OPENAI_API_KEY": "test",
+    "SUPABASE_URL": "http://supabase.invalid",
+    "SUPABASE_ANON_KEY": "test",
+    "EMBED_CACHE_PATH": "",
+    "JOBS_DB": os.path.join(_state_dir, "jobs.db"),
+    "SETTINGS_FILE": os.path.join(_state_dir, "settings.json"),
+    "SHARED_STATE_DIR": os.path.join(_state_dir, "shared_state"),
+    "LOCAL_INDEX_DIR": os.path.join(_state_dir, "vector_index"),
+    "LEXICAL_INDEX_DIR": os.path.join(_state_dir, "lexical_index"),
+    "NORMALIZER_DEBUG_DIR": "",
+    "RETRIEVAL_BACKEND": "supabase",
+    "HYBRID_RETRIEVAL": "false",
+})
+
+import pytest  # noqa: E402
+
+from app.services import pipeline, storage  # noqa: E402
+from app.services.embedding import EmbeddingResult  # noqa: E402
+from app.services.memory_backend import MemoryClient  # noqa: E402
+
+
+@pytest.fixture
+def memory(monkeypatch) -> MemoryClient:
+    """An in-memory Supabase used by the storage layer for one test."""
+    client = MemoryClient()
+    monkeypatch.setattr(storage, "get_supabase", lambda: client)
+    return client
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Replace the embeddings API with fixed vectors; returns the list of texts sent per call."""
+    calls = []
+
+    def embed_texts(chunks, **kwargs):
+        calls.append(list(chunks))
+        return EmbeddingResult(embeddings=[[float(len(chunk)), 1.0, 0.5] for chunk in chunks])
+
+    monkeypatch.setattr(pipeline.embedding, "embed_texts", embed_texts)
+    return calls
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _shutdown_pools():
+    yield
+    pipeline.shutdown()
@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.admission import (
+    BULK, INTERACTIVE, AdmissionMiddleware, Overloaded, PriorityLimiter, RouteLimiter,
+)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_requests_under_the_limit_are_admitted_at_once():
+    async def scenario():
+        limiter = RouteLimiter("test", limit=2, max_queue=0, queue_timeout=1)
+        await limiter.acquire()
+        await limiter.acquire()
+        assert limiter.in_flight == 2
+        limiter.release(0.5)
+        limiter.release(0.5)
+        assert limiter.in_flight == 0
+
+    run(scenario())
+
+
+def test_full_queue_fails_fast_with_429():
+    async def scenario():
+        limiter = RouteLimiter("test", limit=1, max_queue=1, queue_timeout=5)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await settle()
+
+        started = time.perf_counter()
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire()
+        assert time.perf_counter() - started < 0.1
+        assert error.value.status_code == 429
+        # One request in the queue plus this one, one second each, over one slot
+        assert error.value.retry_after == 2
+
+        limiter.release(1.0)
+        await waiting
+
+    run(scenario())
+
+
+def test_waiting_past_the_timeout_gets_503():
+    async def scenario():
+        limiter = RouteLimiter("test", limit=1, max_queue=4, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(Overloaded) as error:
+            await limiter.acquire()
+        assert error.value.status_code == 503
+        assert error.value.retry_after >= 1
+        assert limiter.queued == 0  # the timed-out waiter left the queue
+        assert limiter.in_flight == 1
+
+    run(scenario())
+
+
+def test_retry_after_follows_the_service_time():
+    limiter = RouteLimiter("test", limit=2, max_queue=8, queue_timeout=1)
+    limiter.in_flight = 2
+    for _ in range(100):
+        limiter.release(6.0)
+        limiter.in_flight += 1
+    assert limiter.service_seconds == pytest.approx(6.0, rel=0.01)
+    assert limiter.retry_after() == 3  # (0 queued + 1) * 6s / 2 slots
+
+
+def test_released_slot_goes_to_the_oldest_waiter():
+    async def scenario():
+        limiter = RouteLimiter("test", limit=1, max_queue=4, queue_timeout=5)
+        order = []
+
+        async def request(name):
+            await limiter.acquire()
+            order.append(name)
+
+        await limiter.acquire()
+        tasks = [asyncio.create_task(request(name)) for name in "abc"]
+        await settle()
+        assert limiter.queued == 3
+
+        for _ in tasks:
+            limiter.release(0.0)
+            await settle()
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+        # The slot was handed on each time, never freed in between
+        assert limiter.in_flight == 1
+
+    run(scenario())
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def scenario():
+        limiter = RouteLimiter("test", limit=1, max_queue=4, queue_timeout=5)
+        await limiter.acquire()
+        gone = asyncio.create_task(limiter.acquire())
+        next_in_line = asyncio.create_task(limiter.acquire())
+        await settle()
+
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        assert limiter.queued == 1
+        limiter.release(0.0)
+        await next_in_line
+        assert limiter.in_flight == 1
+
+    run(scenario())
+
+
+def test_middleware_answers_with_retry_after():
+    limiter = RouteLimiter("query", limit=1, max_queue=0, queue_timeout=1)
+    limiter.in_flight = 1  # taken by a request still running
+    app = FastAPI()
+
+    @app.post("/query")
+    def query():
+        return {"answer": "admitted"}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    app.add_middleware(AdmissionMiddleware, limiters={"query": limiter}, groups={"/query": "query"})
+    client = TestClient(app)
+
+    response = client.post("/query")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/health").status_code == 200  # routes outside ROUTE_GROUPS are not limited
+
+    limiter.release(0.0)
+    assert client.post("/query").json() == {"answer": "admitted"}
+    assert limiter.in_flight == 0
+
+
+def hold(limiter, priority, entered, release):
+    """Start a thread that holds a slot of limiter until release is set."""
+    def body():
+        with limiter.slot(priority):
+            entered.release()
+            release.wait(5)
+    thread = threading.Thread(target=body, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_bulk_callers_leave_the_interactive_reserve_free():
+    limiter = PriorityLimiter("test", capacity=3, reserve=1)
+    entered, release = threading.Semaphore(0), threading.Event()
+    threads = [hold(limiter, BULK, entered, release) for _ in range(3)]
+    assert entered.acquire(timeout=1) and entered.acquire(timeout=1)
+    assert not entered.acquire(timeout=0.1)  # the third bulk caller waits
+    assert limiter.in_use[BULK] == 2
+    assert limiter.waiting[BULK] == 1
+
+    # A query still gets the reserved slot right away
+    assert limiter.run(INTERACTIVE, lambda: limiter.in_use[INTERACTIVE]) == 1
+
+    release.set()
+    for thread in threads:
+        thread.join(1)
+    assert limiter.in_use == [0, 0]
+
+
+def test_waiting_interactive_callers_go_before_bulk():
+    limiter = PriorityLimiter("test", capacity=1)
+    entered, release = threading.Semaphore(0), threading.Event()
+    order = []
+    holder = hold(limiter, BULK, entered, release)
+    assert entered.acquire(timeout=1)
+
+    waiters = [threading.Thread(target=limiter.run, args=(BULK, order.append, "bulk"))]
+    waiters[0].start()
+    while not limiter.waiting[BULK]:
+        time.sleep(0.001)
+    waiters.append(threading.Thread(target=limiter.run, args=(INTERACTIVE, order.append, "interactive")))
+    waiters[1].start()
+    while not limiter.waiting[INTERACTIVE]:
+        time.sleep(0.001)
+
+    release.set()
+    holder.join(1)
+    for thread in waiters:
+        thread.join(1)
+    assert order == ["interactive", "bulk"]
+
+
+def test_run_async_waits_in_its_own_threads():
+    async def scenario():
+        limiter = PriorityLimiter("test", capacity=1)
+        entered, release = threading.Semaphore(0), threading.Event()
+        holder = hold(limiter, BULK, entered, release)
+        assert entered.acquire(timeout=1)
+
+        waiting = [asyncio.create_task(limiter.run_async(INTERACTIVE, threading.current_thread))
+                   for _ in range(40)]
+        await asyncio.sleep(0.05)
+        # More queries than the default executor has threads, and it stays free
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: "free"), 1) == "free"
+
+        release.set()
+        threads = await asyncio.gather(*waiting)
+        holder.join(1)
+        assert {thread.name.split("_")[0] for thread in threads} == {"test"}
+        limiter.shutdown()
+
+    run(scenario())
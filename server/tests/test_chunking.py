@@ -0,0 +1,97 @@
+import subprocess
+import sys
+
+from app.services.chunking import chunk_document, iter_chunks
+from app.services.tokens import count_tokens
+
+SENTENCES = [f"Sentence number {i} talks about topic {i} in a few plain words." for i in range(40)]
+TEXT = " ".join(SENTENCES)
+
+
+def words(text):
+    return " ".join(text.split())
+
+
+def test_chunker_does_not_load_the_api_clients():
+    code = "import sys, app.services.chunking; print(sorted(m for m in sys.modules if m.startswith(('app.', 'openai'))))"
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert "app.services.embedding" not in loaded
+    assert "openai" not in loaded
+
+
+def test_chunks_respect_the_budget_and_keep_sentences_whole():
+    chunks = chunk_document(TEXT, max_tokens=60, overlap_tokens=0)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["tokens"] <= 60
+        assert chunk["text"].startswith("Sentence") and chunk["text"].endswith(".")
+    # Without overlap every sentence appears exactly once, in order
+    assert " ".join(chunk["text"] for chunk in chunks) == TEXT
+
+
+def test_offsets_point_at_the_source_text():
+    for chunk in chunk_document(TEXT, max_tokens=60, overlap_tokens=0):
+        assert words(TEXT[chunk["char_start"]:chunk["char_end"]]) == chunk["text"]
+
+
+def test_overlap_repeats_the_end_of_the_previous_chunk():
+    chunks = chunk_document(TEXT, max_tokens=60, overlap_tokens=20)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["char_start"] < previous["char_end"]
+        shared = TEXT[chunk["char_start"]:previous["char_end"]]
+        assert previous["text"].endswith(words(shared))
+        assert chunk["text"].startswith(words(shared))
+        assert count_tokens(shared) <= 20 + 1
+    assert chunks[-1]["text"].endswith(SENTENCES[-1])
+
+
+def test_overlap_never_pushes_a_chunk_over_budget():
+    for overlap in (0, 10, 30, 59):
+        for chunk in chunk_document(TEXT, max_tokens=60, overlap_tokens=overlap):
+            assert chunk["tokens"] <= 60
+
+
+def test_oversized_sentence_is_split_on_words():
+    long_sentence = " ".join(f"word{i}" for i in range(400)) + "."
+    text = f"A short opening sentence. {long_sentence} A short closing sentence."
+    chunks = chunk_document(text, max_tokens=50, overlap_tokens=10)
+
+    assert len(chunks) > 3
+    assert all(chunk["tokens"] <= 50 for chunk in chunks)
+    # Every word survives, none is cut in the middle
+    seen = {word for chunk in chunks for word in chunk["text"].split()}
+    assert {f"word{i}" for i in range(399)} <= seen
+    assert "word399." in seen
+    assert chunks[-1]["text"].endswith("A short closing sentence.")
+
+
+def test_paragraph_breaks_are_kept_and_preferred():
+    paragraphs = [" ".join(SENTENCES[i:i + 3]) for i in range(0, 12, 3)]
+    chunks = chunk_document("\n\n".join(paragraphs), max_tokens=100, overlap_tokens=0)
+
+    # A chunk that is half full ends at the next paragraph rather than mid-paragraph
+    assert all(chunk["text"].endswith(paragraph[-20:]) for chunk, paragraph in zip(chunks, paragraphs))
+    assert chunk_document("\n\n".join(paragraphs[:2]), max_tokens=500, overlap_tokens=0)[0]["text"] == \
+        "\n\n".join(paragraphs[:2])
+
+
+def test_pages_are_tracked_across_chunks():
+    pages = [(1, " ".join(SENTENCES[:5])), (2, " ".join(SENTENCES[5:10])), (3, " ".join(SENTENCES[10:15]))]
+    chunks = list(iter_chunks(iter(pages), max_tokens=60, overlap_tokens=0))
+
+    assert chunks[0]["page_start"] == 1
+    assert chunks[-1]["page_end"] == 3
+    for chunk in chunks:
+        assert chunk["page_start"] <= chunk["page_end"]
+    assert any(chunk["page_start"] != chunk["page_end"] for chunk in chunks)  # a chunk spans pages
+    # A new page starts a new paragraph; offsets count characters across the whole document
+    document = "".join(text for _, text in pages)
+    for chunk in chunks:
+        assert words(document[chunk["char_start"]:chunk["char_end"]]).replace(".Sentence", ". Sentence") == \
+            words(chunk["text"])
+
+
+def test_empty_input_yields_no_chunks():
+    assert chunk_document("") == []
+    assert chunk_document(" \n\n \n") == []
+    assert list(iter_chunks([(1, ""), (2, "   ")])) == []
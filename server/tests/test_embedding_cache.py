@@ -0,0 +1,78 @@
+import pytest
+
+from app.services import embedding
+from app.services import embedding_cache
+from app.services.embedding_cache import EmbeddingCache, cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=5)
+    yield cache
+    cache.close()
+
+
+def vector(i):
+    return [float(i), 0.5, -1.0]
+
+
+def test_writes_do_not_count_the_table(cache):
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    for i in range(4):
+        cache.put_many({f"k{i}": vector(i)})
+    assert not [sql for sql in statements if "COUNT(*)" in sql]
+    assert cache._entries == 4
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.put_many({f"k{i}": vector(i) for i in range(5)})
+    cache.get_many(["k0"])  # k0 is now the most recently used
+    cache.put_many({"k5": vector(5), "k6": vector(6)})
+
+    assert cache.stats()["entries"] == 5
+    assert set(cache.get_many([f"k{i}" for i in range(7)])) == {"k0", "k3", "k4", "k5", "k6"}
+
+
+def test_rewriting_a_key_does_not_grow_the_count(cache):
+    cache.put_many({"k0": vector(0)})
+    cache.put_many({"k0": vector(1), "k1": vector(1)})
+    assert cache._entries == cache.stats()["entries"] == 2
+    assert cache.get_many(["k0"])["k0"] == vector(1)
+
+
+def test_entries_written_by_another_worker_are_counted_before_evicting(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = EmbeddingCache(path, max_entries=6), EmbeddingCache(path, max_entries=6)
+    try:
+        first.put_many({f"a{i}": vector(i) for i in range(4)})
+        second.put_many({f"b{i}": vector(i) for i in range(4)})
+        assert second.stats()["entries"] == 8  # second only knows about its own 4 so far
+        first.put_many({"a4": vector(4), "a5": vector(5), "a6": vector(6)})
+        assert first.stats()["entries"] == 6
+    finally:
+        first.close()
+        second.close()
+
+
+def test_hits_and_misses_count_every_lookup(cache):
+    cache.put_many({"k0": vector(0)})
+    cache.get_many(["k0", "k0", "k1", "k1", "k2"])
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 3
+
+
+def test_cache_stats_agree_with_the_lookup_metrics(cache, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "get_cache", lambda: cache)
+    monkeypatch.setattr(embedding, "get_cache", lambda: cache)
+    monkeypatch.setattr(embedding, "_embed_batch", lambda texts, *args: ([vector(len(t)) for t in texts], 0))
+
+    chunks = ["alpha", "beta", "alpha", "gamma", "beta"]
+    first = embedding.embed_texts(chunks)
+    second = embedding.embed_texts(chunks + ["delta"])
+
+    assert (first.cache_hits, second.cache_hits) == (0, 5)
+    assert cache.stats()["hits"] == first.cache_hits + second.cache_hits
+    assert cache.stats()["misses"] == (len(chunks) - first.cache_hits) + (len(chunks) + 1 - second.cache_hits)
+    assert set(cache.get_many([cache_key(c, embedding.EMBEDDING_MODEL) for c in chunks])) == \
+        {cache_key(c, embedding.EMBEDDING_MODEL) for c in chunks}
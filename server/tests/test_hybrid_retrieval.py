@@ -0,0 +1,135 @@
+import pytest
+
+from app.services.filters import ChunkFilter
+from app.services.lexical_index import BM25Index
+from app.services.retrieval import HybridRetriever, reciprocal_rank_fusion
+
+CONTENTS = {
+    "a-0": "Vacation days accrue monthly for every employee.",
+    "a-1": "Unused vacation days carry over to the next year.",
+    "b-0": "Expense reports need a receipt for every purchase.",
+    "b-1": "Travel expenses are reimbursed within thirty days.",
+    "c-0": "The vacation policy was updated in March.",
+}
+
+
+def row(chunk_id):
+    document_id = chunk_id.split("-")[0]
+    return {"id": chunk_id, "document_id": document_id, "content": CONTENTS[chunk_id],
+            "metadata": {"file_name": f"{document_id}.pdf"}, "created_at": "2024-01-01T00:00:00+00:00"}
+
+
+def ids(rows):
+    return [r["id"] for r in rows]
+
+
+@pytest.fixture
+def bm25(tmp_path):
+    index = BM25Index(str(tmp_path / "lexical"))
+    index.add([row(chunk_id) for chunk_id in CONTENTS])
+    return index
+
+
+def test_rrf_rewards_agreement_between_lists():
+    vector = [{"id": "x"}, {"id": "y"}, {"id": "z"}]
+    lexical = [{"id": "z"}, {"id": "y"}, {"id": "w"}]
+    fused = reciprocal_rank_fusion([vector, lexical], top_k=4, k=60)
+
+    # z: 1/63 + 1/61 edges out y: 1/62 + 1/62
+    assert ids(fused) == ["z", "y", "x", "w"]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused[1]["rrf_score"] == pytest.approx(2 / 62)
+
+
+def test_rrf_ties_keep_the_first_list_order():
+    fused = reciprocal_rank_fusion([[{"id": "v1"}, {"id": "v2"}], [{"id": "l1"}, {"id": "l2"}]], top_k=4)
+    # Same ranks score the same; the vector list was seen first
+    assert ids(fused) == ["v1", "l1", "v2", "l2"]
+
+
+def test_rrf_keeps_the_first_row_seen_and_top_k():
+    fused = reciprocal_rank_fusion([[{"id": "x", "similarity": 0.9}], [{"id": "x", "score": 3.0}, {"id": "y"}]],
+                                   top_k=1)
+    assert fused == [{"id": "x", "similarity": 0.9, "rrf_score": pytest.approx(2 / 61)}]
+    assert reciprocal_rank_fusion([[], []], top_k=5) == []
+
+
+def test_bm25_ranks_by_term_matches(bm25):
+    hits = ids(bm25.search("unused vacation days", 5))
+    assert hits[:2] == ["a-1", "a-0"]
+    assert set(hits[2:]) == {"b-1", "c-0"}
+    assert bm25.search("nothing matches this", 3) == []
+
+
+def scored(rows):
+    return sorted((r["id"], round(r["score"], 5)) for r in rows)
+
+
+def test_deleted_document_leaves_no_postings_behind(bm25, tmp_path):
+    bm25.delete_document("a")
+    assert set(ids(bm25.search("vacation days", 5))) == {"b-1", "c-0"}
+
+    # Scores match an index that never held the deleted rows: their postings
+    # stay until compact() but no longer count towards document frequencies
+    fresh = BM25Index(str(tmp_path / "fresh"))
+    fresh.add([row(chunk_id) for chunk_id in CONTENTS if not chunk_id.startswith("a-")])
+    for query in ("vacation days", "every", "expenses receipt"):
+        assert scored(bm25.search(query, 5)) == scored(fresh.search(query, 5))
+
+
+def test_updated_rows_replace_their_postings(bm25):
+    bm25.update_rows([{"id": "a-1", "content": "Sick leave is unlimited.", "metadata": {"file_name": "a.pdf"}}])
+    bm25.delete_chunks(["a-0"])
+
+    assert ids(bm25.search("vacation", 5)) == ["c-0"]
+    assert ids(bm25.search("sick leave", 5)) == ["a-1"]
+    assert len(bm25) == 4
+
+
+def test_tombstones_survive_reload_and_compact(bm25, tmp_path):
+    bm25.delete_document("b")
+    bm25.delete_chunks(["a-1"])
+    reader = BM25Index(bm25.directory)
+    assert scored(reader.search("vacation days", 5)) == scored(bm25.search("vacation days", 5))
+    assert set(ids(reader.search("vacation days", 5))) == {"a-0", "c-0"}
+
+    bm25.compact()
+    assert len(bm25.rows) == 2
+    reader.refresh()
+    assert scored(reader.search("vacation days", 5)) == scored(bm25.search("vacation days", 5))
+
+
+class StubVectorRetriever:
+    def __init__(self, results):
+        self.results = results
+        self.requested = []
+
+    def match_chunks(self, query_embedding, top_k, question="", filters=None):
+        self.requested.append(top_k)
+        return self.results[:top_k]
+
+    def match_many(self, query_embeddings, top_k, questions, filters=None):
+        return [self.match_chunks(embedding, top_k) for embedding in query_embeddings]
+
+
+def test_hybrid_fuses_vector_and_keyword_results(bm25, monkeypatch):
+    monkeypatch.setattr("app.services.retrieval.HYBRID_CANDIDATE_FACTOR", 2)
+    vectors = StubVectorRetriever([row("b-0"), row("c-0"), row("b-1")])
+    retriever = HybridRetriever(vectors, bm25)
+
+    fused = retriever.match_chunks([0.0], 4, "unused vacation days")
+    assert vectors.requested == [8]
+    # c-0 and b-1 are found by both retrievers; b-0, the best vector match,
+    # ties with a-1, the best keyword match, and the vector list goes first
+    assert ids(fused) == ["c-0", "b-1", "b-0", "a-1"]
+
+    # Without a question only the vector results count
+    assert ids(retriever.match_chunks([0.0], 4)) == ["b-0", "c-0", "b-1"]
+    assert [ids(hits) for hits in retriever.match_many([[0.0], [0.0]], 4, ["unused vacation days", ""])] == \
+        [["c-0", "b-1", "b-0", "a-1"], ["b-0", "c-0", "b-1"]]
+
+
+def test_hybrid_applies_filters_to_keyword_results(bm25):
+    retriever = HybridRetriever(StubVectorRetriever([]), bm25)
+    only_c = ChunkFilter(document_ids=["c"])
+    assert ids(retriever.match_chunks([0.0], 3, "vacation days", filters=only_c)) == ["c-0"]
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+import pytest
+
+from app.services import parsing
+
+
+def pdf(pages):
+    with fitz.open() as doc:
+        for i in range(pages):
+            doc.new_page().insert_text((72, 72), f"page {i + 1}")
+        return doc.tobytes()
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Record every source the caller opens as a PDF."""
+    sources = []
+    open_pdf = parsing._open_pdf
+
+    def recording(source):
+        sources.append(source)
+        return open_pdf(source)
+
+    monkeypatch.setattr(parsing, "_open_pdf", recording)
+    return sources
+
+
+@pytest.mark.parametrize("page_count", [3, 10])
+def test_pdf_is_opened_once_to_pick_the_extraction_path(monkeypatch, opened, page_count):
+    monkeypatch.setattr(parsing, "EXTRACT_PARALLEL_MIN_PAGES", 5)
+    with ThreadPoolExecutor(2) as executor:
+        pages = list(parsing.iter_pages("doc.pdf", memoryview(pdf(page_count)), executor))
+
+    assert len(opened) == 1
+    assert [number for number, _ in pages] == list(range(1, page_count + 1))
+    assert [text.strip() for _, text in pages] == [f"page {i}" for i in range(1, page_count + 1)]
+
+
+def test_empty_pdf_has_no_pages(opened):
+    with ThreadPoolExecutor(1) as executor:
+        assert list(parsing.iter_pages("doc.pdf", b"", executor)) == []
+    assert opened == []
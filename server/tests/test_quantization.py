@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from app.services.quantization import BinaryCodes, Int8Codes, check_quantization, make_codes
+from app.services.vector_index import top_k_indices
+
+
+def normalized(matrix):
+    return (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Embedding-like vectors: noisy members of a few hundred topics, and queries near some of them."""
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((200, 256))
+    vectors = normalized(topics[rng.integers(0, 200, 5000)] + 0.6 * rng.standard_normal((5000, 256)))
+    queries = normalized(topics[rng.integers(0, 200, 50)] + 0.6 * rng.standard_normal((50, 256)))
+    return vectors, queries
+
+
+def recall(codes, vectors, queries, top_k=10, rescore_factor=4):
+    """recall@top_k of shortlisting on codes and rescoring exactly, as LocalVectorIndex does."""
+    found = 0
+    for query in queries:
+        exact = set(top_k_indices(vectors @ query, top_k))
+        shortlist = top_k_indices(codes.scores(query), top_k * rescore_factor)
+        rescored = shortlist[top_k_indices(vectors[shortlist] @ query, top_k)]
+        found += len(exact & set(rescored))
+    return found / (top_k * len(queries))
+
+
+def test_int8_round_trip(corpus):
+    vectors, _ = corpus
+    codes = Int8Codes(vectors.shape[1]).extended(vectors[:100])
+    decoded = codes.codes.astype(np.float32) * codes.scales[:, None]
+    # Rounding to the nearest step leaves at most half a step per component
+    assert np.all(np.abs(decoded - vectors[:100]) <= codes.scales[:, None] / 2 + 1e-7)
+    assert codes.bytes_per_vector == vectors.shape[1] + 4
+
+
+def test_int8_scores_approximate_dot_products(corpus):
+    vectors, queries = corpus
+    codes = Int8Codes(vectors.shape[1]).extended(vectors[:2000], vectors[2000:])
+    scores = codes.scores(queries[0])
+    assert len(codes) == len(scores) == len(vectors)
+    assert np.max(np.abs(scores - vectors @ queries[0])) < 0.02
+    rows = np.array([5, 17, 4321])
+    np.testing.assert_allclose(codes.scores(queries[0], rows), scores[rows], rtol=1e-5)
+
+
+def test_int8_handles_zero_rows():
+    codes = Int8Codes(4).extended(np.zeros((1, 4), dtype=np.float32))
+    assert codes.scales[0] == 1.0
+    assert codes.scores(np.ones(4, dtype=np.float32))[0] == 0.0
+
+
+def test_extended_leaves_the_snapshot_unchanged(corpus):
+    vectors, _ = corpus
+    for empty in (Int8Codes(vectors.shape[1]), BinaryCodes(vectors.shape[1])):
+        snapshot = empty.extended(vectors[:10])
+        grown = snapshot.extended(vectors[10:20])
+        assert (len(snapshot), len(grown)) == (10, 20)
+
+
+def test_binary_scores_are_sign_agreement():
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((50, 13)).astype(np.float32)  # not a multiple of 8
+    query = rng.standard_normal(13).astype(np.float32)
+    codes = BinaryCodes(13).extended(vectors)
+
+    assert codes.bytes_per_vector == 2
+    np.testing.assert_array_equal(codes.scores(query), np.sign(vectors) @ np.sign(query))
+    np.testing.assert_array_equal(np.unpackbits(codes.codes, axis=1)[:, :13], (vectors > 0).astype(np.uint8))
+
+
+def test_rescored_recall(corpus):
+    vectors, queries = corpus
+    dim = vectors.shape[1]
+    assert recall(Int8Codes(dim).extended(vectors), vectors, queries) >= 0.99
+    assert recall(BinaryCodes(dim).extended(vectors), vectors, queries) >= 0.9
+
+
+def test_quantization_setting_is_checked():
+    assert make_codes("none", 8) is None
+    assert isinstance(make_codes("int8", 8), Int8Codes)
+    assert isinstance(make_codes("binary", 8), BinaryCodes)
+    with pytest.raises(ValueError):
+        check_quantization("int4")
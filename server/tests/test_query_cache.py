@@ -0,0 +1,104 @@
+import pytest
+
+from app.services import query_cache as query_cache_module
+from app.services import storage
+from app.services.query_cache import QueryCache, TTLCache
+from app.services.shared_state import SharedState
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a is now the most recently used
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.stats() == {"hits": 3, "misses": 1, "entries": 2}
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache_module.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=10, ttl=30)
+    cache.set("a", 1)
+
+    now[0] += 29
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_zero_size_cache_stores_nothing():
+    cache = TTLCache(max_entries=0, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_answer_key_depends_on_model_and_temperature():
+    key = QueryCache.answer_key("What is  RAG?", ["c1", "c2"], "gpt-4", 0.2)
+    assert QueryCache.answer_key("what is rag?", ["c1", "c2"], "gpt-4", 0.2) == key
+    assert QueryCache.answer_key("What is RAG?", ["c1", "c2"], "gpt-4o", 0.2) != key
+    assert QueryCache.answer_key("What is RAG?", ["c1", "c2"], "gpt-4", 0.7) != key
+    assert QueryCache.answer_key("What is RAG?", ["c2", "c1"], "gpt-4", 0.2) != key
+
+
+def test_invalidate_orphans_retrievals_and_clears_answers():
+    cache = QueryCache()
+    key = cache.retrieval_key("question", 5)
+    cache.retrievals.set(key, ["chunk"])
+    cache.answers.set(cache.answer_key("question", ["chunk"], "gpt-4"), "answer")
+    cache.embeddings.set("question", [0.1, 0.2])
+
+    cache.invalidate()
+
+    assert cache.retrieval_key("question", 5) != key
+    assert cache.retrievals.stats()["entries"] == cache.answers.stats()["entries"] == 0
+    # Question embeddings do not depend on the corpus
+    assert cache.embeddings.get("question") == [0.1, 0.2]
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """The storage layer writing as the writer worker, and the query cache of a reader worker."""
+    writer, reader = SharedState(str(tmp_path)), SharedState(str(tmp_path))
+    writer.start()
+    reader.start()
+    writer_cache, reader_cache = QueryCache(), QueryCache()
+    reader.on_change(reader_cache.invalidate)
+    monkeypatch.setattr(storage, "shared_state", writer)
+    monkeypatch.setattr(storage, "query_cache", writer_cache)
+    yield writer_cache, reader, reader_cache
+    writer.close()
+    reader.close()
+
+
+def fill(cache):
+    cache.retrievals.set(cache.retrieval_key("question", 5), ["chunk"])
+    cache.answers.set(cache.answer_key("question", ["chunk"], "gpt-4"), "answer")
+
+
+def cached_entries(cache):
+    return cache.retrievals.stats()["entries"] + cache.answers.stats()["entries"]
+
+
+def test_storing_and_deleting_a_document_clears_every_worker(memory, workers):
+    writer_cache, reader, reader_cache = workers
+
+    fill(writer_cache)
+    fill(reader_cache)
+    document_id = storage.store_embeddings(["some text"], [[0.1, 0.2, 0.3]], [{"file_name": "a.pdf"}])
+    assert cached_entries(writer_cache) == 0
+    assert reader.stale
+    reader.sync()
+    assert cached_entries(reader_cache) == 0
+    assert reader_cache.generation == 1
+
+    fill(writer_cache)
+    fill(reader_cache)
+    storage.delete_document(document_id)
+    assert cached_entries(writer_cache) == 0
+    reader.sync()
+    assert cached_entries(reader_cache) == 0
+    assert reader_cache.generation == writer_cache.generation == 2
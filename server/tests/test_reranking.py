@@ -0,0 +1,71 @@
+import pytest
+
+from app.services.reranking import LexicalReranker
+from app.services.tokens import count_tokens
+
+QUESTION = "How many vacation days do new employees accrue?"
+RELEVANT = [
+    "New employees accrue vacation days at 1.5 days per month.",
+    "Vacation days accrue from the first month for new employees.",
+]
+UNRELATED = [
+    "The cafeteria is open from 8am to 3pm on weekdays.",
+    "Parking permits are issued by the facilities team.",
+    "Laptops are replaced every three years.",
+    "The office is closed on public holidays.",
+]
+
+
+def matches(contents):
+    return [{"id": str(i), "content": content, "metadata": {}} for i, content in enumerate(contents)]
+
+
+def test_relevant_chunks_move_to_the_front():
+    reranker = LexicalReranker(margin=1.0, min_keep=1)
+    kept, _ = reranker.rerank(QUESTION, matches(UNRELATED + RELEVANT), top_k=6)
+    assert {row["content"] for row in kept[:2]} == set(RELEVANT)
+    scores = [row["rerank_score"] for row in kept]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_candidates_below_the_margin_are_cut_off():
+    reranker = LexicalReranker(margin=0.35, min_keep=1)
+    candidates = matches(RELEVANT + UNRELATED)
+    kept, stats = reranker.rerank(QUESTION, candidates, top_k=6)
+
+    assert [row["content"] for row in kept] == RELEVANT
+    assert stats["candidates"] == 6 and stats["kept"] == 2 and stats["cut_off"] == 4
+    assert stats["tokens_dropped"] == sum(count_tokens(text) for text in UNRELATED)
+    assert stats["top_score"] == pytest.approx(kept[0]["rerank_score"], abs=1e-4)
+
+
+def test_min_keep_overrides_the_margin():
+    reranker = LexicalReranker(margin=0.0, min_keep=3)
+    kept, stats = reranker.rerank(QUESTION, matches(RELEVANT + UNRELATED), top_k=6)
+    assert len(kept) == 3
+    assert [row["content"] for row in kept[:2]] == RELEVANT
+    assert stats["cut_off"] == 3
+
+
+def test_never_more_than_top_k():
+    reranker = LexicalReranker(margin=10.0, min_keep=5)
+    kept, stats = reranker.rerank(QUESTION, matches(RELEVANT + UNRELATED), top_k=2)
+    assert len(kept) == 2
+    assert stats["cut_off"] == 0
+
+
+def test_retrieval_order_breaks_ties():
+    reranker = LexicalReranker(margin=1.0, min_keep=1)
+    kept, _ = reranker.rerank("unrelated question text", matches(UNRELATED), top_k=4)
+    assert [row["id"] for row in kept] == ["0", "1", "2", "3"]
+
+
+def test_no_candidates():
+    kept, stats = LexicalReranker().rerank(QUESTION, [], top_k=5)
+    assert kept == []
+    assert stats["kept"] == 0 and stats["top_score"] is None
+
+
+def test_candidates_per_request():
+    assert LexicalReranker(candidate_factor=3).candidates(10) == 30
+    assert LexicalReranker(candidate_factor=0).candidates(10) == 10
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from app.services.shared_state import SharedState
+from app.services.vector_index import LocalVectorIndex
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """A writer and a reader sharing one state directory, as two uvicorn workers would."""
+    writer, reader = SharedState(str(tmp_path)), SharedState(str(tmp_path))
+    writer.start()
+    reader.start()
+    yield writer, reader
+    writer.close()
+    reader.close()
+
+
+def test_first_worker_becomes_the_writer(workers):
+    writer, reader = workers
+    assert writer.is_writer
+    assert not reader.is_writer
+    assert not reader.try_become_writer()
+
+
+def test_reader_takes_over_when_the_writer_exits(workers):
+    writer, reader = workers
+    writer.close()
+    assert reader.try_become_writer()
+    assert reader.is_writer
+
+    # The lock is held again, so a restarted worker comes back as a reader
+    restarted = SharedState(reader.directory)
+    restarted.start()
+    try:
+        assert not restarted.is_writer
+    finally:
+        restarted.close()
+
+
+def test_reader_runs_callbacks_once_per_change(workers):
+    writer, reader = workers
+    calls = []
+    reader.on_change(lambda: calls.append(reader.generation()))
+
+    reader.sync()
+    assert calls == []
+
+    writer.publish()
+    writer.publish()
+    assert reader.stale
+    reader.sync()
+    reader.sync()
+    assert calls == [2]
+    assert not reader.stale
+
+
+def test_writer_ignores_its_own_changes(workers):
+    writer, _ = workers
+    writer.on_change(lambda: pytest.fail("the writer must not refresh from its own changes"))
+    writer.publish()
+    assert not writer.stale
+    writer.sync()
+
+
+def chunk_rows(document_id, count, start=0):
+    return [
+        {"id": f"{document_id}-{i}", "document_id": document_id, "content": f"chunk {i} of {document_id}",
+         "metadata": {"file_name": f"{document_id}.pdf", "chunk_index": i},
+         "created_at": "2024-01-01T00:00:00+00:00"}
+        for i in range(start, start + count)
+    ]
+
+
+def vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32).tolist()
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_refresh_picks_up_rows_appended_by_the_writer(tmp_path, quantization):
+    writer = LocalVectorIndex(str(tmp_path), quantization=quantization)
+    reader = LocalVectorIndex(str(tmp_path), quantization=quantization)
+    assert len(reader) == 0
+
+    first = vectors(5, seed=1)
+    writer.add(chunk_rows("a", 5), first)
+    assert len(reader) == 0
+    reader.refresh()
+    assert len(reader) == 5
+    assert reader.search(first[3], 1)[0]["id"] == "a-3"
+
+    second = vectors(3, seed=2)
+    writer.add(chunk_rows("b", 3), second)
+    reader.refresh()
+    assert len(reader) == 8
+    assert reader.search(second[0], 1)[0]["id"] == "b-0"
+    assert reader.by_document["b"] == [5, 6, 7]
+
+
+def test_refresh_applies_tombstones_and_moved_rows(tmp_path):
+    writer = LocalVectorIndex(str(tmp_path))
+    reader = LocalVectorIndex(str(tmp_path))
+    writer.add(chunk_rows("a", 3), vectors(3, seed=1))
+    writer.add(chunk_rows("b", 2), vectors(2, seed=2))
+    reader.refresh()
+
+    writer.delete_document("a")
+    writer.update_rows([{"id": "b-1", "metadata": {"file_name": "b.pdf", "chunk_index": 0}}])
+    writer.delete_chunks(["b-0"])
+    reader.refresh()
+
+    assert len(reader) == len(writer) == 1
+    assert [hit["id"] for hit in reader.search(vectors(1, seed=3)[0], 5)] == ["b-1"]
+    assert reader.rows[reader.positions["b-1"]]["metadata"]["chunk_index"] == 0
+
+
+def test_refresh_reloads_after_compact(tmp_path):
+    writer = LocalVectorIndex(str(tmp_path))
+    reader = LocalVectorIndex(str(tmp_path))
+    writer.add(chunk_rows("a", 3), vectors(3, seed=1))
+    writer.add(chunk_rows("b", 2), vectors(2, seed=2))
+    writer.delete_document("a")
+    reader.refresh()
+
+    writer.compact()
+    reader.refresh()
+
+    assert len(reader.rows) == 2
+    assert sorted(reader.positions) == ["b-0", "b-1"]
@@ -0,0 +1,56 @@
+import pytest
+
+from app.services import embedding, tokens
+
+
+@pytest.fixture
+def estimated(monkeypatch):
+    """Count tokens as if tiktoken were not installed."""
+    monkeypatch.setattr(tokens, "tiktoken", None)
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Record the batches embed_texts sends instead of calling the API."""
+    batches = []
+
+    def embed_batch(texts, batch_tokens, *args):
+        batches.append((list(texts), batch_tokens))
+        return [[1.0, 0.0] for _ in texts], 0
+
+    monkeypatch.setattr(embedding, "_embed_batch", embed_batch)
+    return batches
+
+
+def test_estimate_is_padded_for_limits(estimated):
+    assert tokens.count_tokens("x" * 400) == 100
+    assert tokens.count_tokens_many(["x" * 400, "", "abc"]) == [100, 1, 1]
+    assert tokens.limit_tokens(100) == 200
+
+
+def test_exact_counts_are_not_padded():
+    pytest.importorskip("tiktoken")
+    try:
+        count = tokens.count_tokens("hello world")
+    except Exception as e:  # the encoding is downloaded on first use
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+    assert tokens.limit_tokens(count) == count == 2
+
+
+def test_estimated_input_over_the_model_limit_is_rejected(estimated, sent):
+    # About 5,000 estimated tokens, which may be 10,000 real ones
+    too_long = "word " * 4000
+    result = embedding.embed_texts([too_long, "short text"], use_cache=False)
+
+    assert 0 in result.failed and "10000 tokens" in result.failed[0]
+    assert [texts for texts, _ in sent] == [["short text"]]
+
+
+def test_batches_stay_under_the_padded_token_limit(estimated, sent, monkeypatch):
+    monkeypatch.setattr(embedding, "EMBED_BATCH_TOKENS", 1000)
+    chunks = [f"{i:03d}" + "x" * 397 for i in range(10)]  # 100 estimated tokens each
+    embedding.embed_texts(chunks, use_cache=False)
+
+    # 200 padded tokens each, so five per request rather than ten
+    assert [len(texts) for texts, _ in sent] == [5, 5]
+    assert [batch_tokens for _, batch_tokens in sent] == [1000, 1000]
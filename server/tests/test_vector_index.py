@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services import vector_index
+from app.services.vector_index import LocalVectorIndex
+
+
+def chunk_rows(document_id, count, start=0):
+    return [
+        {"id": f"{document_id}-{i}", "document_id": document_id, "content": f"chunk {i} of {document_id}",
+         "metadata": {"file_name": f"{document_id}.pdf", "chunk_index": i},
+         "created_at": "2024-01-01T00:00:00+00:00"}
+        for i in range(start, start + count)
+    ]
+
+
+def vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32).tolist()
+
+
+@pytest.fixture
+def gated_ivf(monkeypatch):
+    """Make IVF builds wait for the returned event, recording the size of each build."""
+    gate, sizes = threading.Event(), []
+    build = vector_index.IVFIndex
+
+    def slow_build(matrix, *args, **kwargs):
+        sizes.append(len(matrix))
+        gate.wait(5)
+        return build(matrix, *args, **kwargs)
+
+    monkeypatch.setattr(vector_index, "IVFIndex", slow_build)
+    return gate, sizes
+
+
+def test_ivf_is_built_without_blocking_writes_or_searches(tmp_path, gated_ivf):
+    gate, sizes = gated_ivf
+    index = LocalVectorIndex(str(tmp_path), ivf_threshold=50)
+    first = vectors(60, seed=1)
+    index.add(chunk_rows("a", 60), first)
+
+    # The build is waiting on the gate, yet the index keeps serving
+    assert sizes == [60] and index.ivf is None
+    index.add(chunk_rows("b", 5), vectors(5, seed=2))
+    assert index.search(first[7], 1)[0]["id"] == "a-7"
+
+    gate.set()
+    index.wait_for_ivf(5)
+    assert index.ivf is not None and index.ivf.size == 60
+    # Rows added during the build are still found, as the exactly searched tail
+    assert index.search(vectors(5, seed=2)[3], 1)[0]["id"] == "b-3"
+
+
+def test_build_over_old_positions_is_discarded_after_compact(tmp_path, gated_ivf):
+    gate, sizes = gated_ivf
+    index = LocalVectorIndex(str(tmp_path), ivf_threshold=50)
+    index.add(chunk_rows("a", 40), vectors(40, seed=1))
+    index.add(chunk_rows("b", 40), vectors(40, seed=2))
+    index.delete_document("a")
+    index.compact()
+
+    gate.set()
+    index.wait_for_ivf(5)
+    assert sizes == [80]
+    assert index.ivf is None  # the 80-row build was dropped, 40 rows are below the threshold
+
+    index.add(chunk_rows("c", 20), vectors(20, seed=3))
+    index.wait_for_ivf(5)
+    assert sizes == [80, 60]
+    assert index.ivf.size == len(index.rows) == 60
+
+
+def test_delete_document_only_hides_its_own_rows(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.add(chunk_rows("a", 3), vectors(3, seed=1))
+    index.add(chunk_rows("b", 3), vectors(3, seed=2))
+
+    index.delete_document("a")
+    assert len(index) == 3
+    assert sorted(index.positions) == ["b-0", "b-1", "b-2"]
+    assert "a" not in index.by_document
+
+    # Rows stored for the document after the tombstone stay visible, also after a reload
+    index.add(chunk_rows("a", 1, start=3), vectors(1, seed=3))
+    assert len(index) == 4
+    reloaded = LocalVectorIndex(str(tmp_path))
+    assert sorted(reloaded.positions) == ["a-3", "b-0", "b-1", "b-2"]
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_search_many_matches_search(tmp_path, quantization):
+    index = LocalVectorIndex(str(tmp_path), quantization=quantization)
+    stored = vectors(50, seed=1)
+    index.add(chunk_rows("a", 50), stored)
+    queries = vectors(5, seed=2) + stored[:2]
+
+    expected = [[hit["id"] for hit in index.search(query, 4)] for query in queries]
+    assert [[hit["id"] for hit in hits] for hits in index.search_many(queries, 4)] == expected
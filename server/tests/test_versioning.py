@@ -0,0 +1,201 @@
+import asyncio
+
+import fitz
+import pytest
+
+from app.services import pipeline
+from app.services.settings import DEFAULT_SETTINGS
+from app.services.versioning import chunk_hash, diff_chunks
+
+# Small chunks so every sentence below becomes a chunk of its own
+SETTINGS = {**DEFAULT_SETTINGS, "chunk_size": 80, "chunk_overlap": 0}
+
+SENTENCES = [
+    "Employees accrue paid time off every month of the year.",
+    "Remote work requires written approval from a manager.",
+    "Expense reports are due within thirty days of travel.",
+    "Security training is mandatory for every new hire.",
+]
+
+
+def make_pdf(sentences, title=""):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n\n".join(sentences), fontsize=10)
+    doc.set_metadata({"title": title})
+    return doc.tobytes()
+
+
+def ingest(data, filename="handbook.pdf"):
+    return asyncio.run(pipeline.ingest_document(filename, data, settings=SETTINGS))
+
+
+def rows(memory, table):
+    return memory.tables.get(table, [])
+
+
+def contents(memory):
+    return sorted(row["content"] for row in rows(memory, "chunks"))
+
+
+def assert_consistent(memory):
+    """One embedding per chunk, every chunk in the one document row."""
+    chunk_ids = [row["id"] for row in rows(memory, "chunks")]
+    assert len(set(chunk_ids)) == len(chunk_ids)
+    assert sorted(row["chunk_id"] for row in rows(memory, "embeddings")) == sorted(chunk_ids)
+    assert len(rows(memory, "documents")) == 1
+
+
+def meta(index, text):
+    return {"chunk_index": index, "chunk_hash": chunk_hash(text)}
+
+
+def stored(row_id, index, text, with_hash=True):
+    return {"id": row_id, "document_id": "doc", "content": text,
+            "metadata": meta(index, text) if with_hash else {"chunk_index": index}}
+
+
+def test_diff_matches_duplicate_hashes_one_row_each():
+    new = ["a", "b", "a", "a"]
+    diff = diff_chunks([meta(i, text) for i, text in enumerate(new)], new,
+                       [stored("r0", 0, "a"), stored("r1", 1, "a"), stored("r2", 2, "b")])
+
+    # Two stored "a" rows serve the first two "a" chunks; the third is new
+    assert diff.added == [3]
+    assert diff.unchanged == 1  # r0 at index 0
+    assert [(row["id"], row["metadata"]["chunk_index"]) for row in diff.updated] == [("r2", 1), ("r1", 2)]
+    assert diff.removed == []
+    assert diff.summary() == {"added": 1, "updated": 2, "unchanged": 1, "removed": 0}
+
+
+def test_diff_removes_surplus_duplicates():
+    diff = diff_chunks([meta(0, "a")], ["a"], [stored("r0", 0, "a"), stored("r1", 1, "a")])
+    assert diff.unchanged == 1
+    assert diff.removed == ["r1"]
+
+
+def test_diff_hashes_legacy_rows_from_content():
+    new = ["a", "b"]
+    diff = diff_chunks([meta(i, text) for i, text in enumerate(new)], new,
+                       [stored("r0", 0, "a", with_hash=False), stored("r1", 1, "c", with_hash=False)])
+    assert diff.added == [1]
+    assert [row["id"] for row in diff.updated] == ["r0"]  # gains its chunk_hash
+    assert diff.removed == ["r1"]
+
+
+def test_unchanged_reupload_is_skipped(memory, embedded):
+    data = make_pdf(SENTENCES)
+    first = ingest(data)
+    second = ingest(data)
+
+    assert second["status"] == "skipped"
+    assert second["document_id"] == first["document_id"]
+    assert len(embedded) == 1
+    assert_consistent(memory)
+
+
+def test_new_bytes_with_identical_chunks_only_bump_the_version(memory, embedded):
+    first = ingest(make_pdf(SENTENCES, title="v1"))
+    hash_before = rows(memory, "documents")[0]["metadata"]["content_hash"]
+    ids_before = sorted(row["id"] for row in rows(memory, "chunks"))
+
+    second = ingest(make_pdf(SENTENCES, title="v2"))
+
+    assert second["changes"] == {"added": 0, "updated": 0, "unchanged": first["num_chunks"], "removed": 0}
+    assert second["version"] == 2
+    assert embedded[1] == []  # nothing re-embedded
+    assert sorted(row["id"] for row in rows(memory, "chunks")) == ids_before
+    document = rows(memory, "documents")[0]
+    assert document["metadata"]["version"] == 2
+    assert document["metadata"]["content_hash"] != hash_before
+    assert_consistent(memory)
+
+
+def test_edited_sentence_replaces_only_its_chunk(memory, embedded):
+    first = ingest(make_pdf(SENTENCES))
+    edited = SENTENCES[:-1] + ["Security training is mandatory for every contractor."]
+
+    second = ingest(make_pdf(edited))
+
+    assert second["changes"]["added"] == 1
+    assert second["changes"]["removed"] == 1
+    assert second["changes"]["added"] + second["changes"]["updated"] + second["changes"]["unchanged"] == \
+        second["num_chunks"] == first["num_chunks"]
+    assert embedded[1] == ["Security training is mandatory for every contractor."]
+    assert contents(memory) == sorted(edited)
+    assert_consistent(memory)
+
+
+def test_inserted_sentence_moves_the_following_chunks(memory, embedded):
+    ingest(make_pdf(SENTENCES))
+    ids_before = {row["content"]: row["id"] for row in rows(memory, "chunks")}
+    edited = ["Welcome to the company handbook."] + SENTENCES
+
+    second = ingest(make_pdf(edited))
+
+    assert second["changes"] == {"added": 1, "updated": len(SENTENCES), "unchanged": 0, "removed": 0}
+    ids_after = {row["content"]: row["id"] for row in rows(memory, "chunks")}
+    assert all(ids_after[text] == ids_before[text] for text in SENTENCES)  # rows and embeddings kept
+    by_content = {row["content"]: row["metadata"] for row in rows(memory, "chunks")}
+    assert [by_content[text]["chunk_index"] for text in edited] == list(range(len(edited)))
+    assert_consistent(memory)
+
+
+def test_legacy_document_without_hashes_is_upgraded_in_place(memory, embedded):
+    data = make_pdf(SENTENCES)
+    ingest(data)
+    # As stored before documents and chunks were hashed
+    document = rows(memory, "documents")[0]
+    document["metadata"] = {"file_name": "handbook.pdf"}
+    for row in rows(memory, "chunks"):
+        del row["metadata"]["chunk_hash"]
+
+    result = ingest(data)
+
+    assert "status" not in result  # not skipped: the stored document has no content hash
+    assert result["changes"] == {"added": 0, "updated": len(SENTENCES), "unchanged": 0, "removed": 0}
+    assert embedded[1] == []
+    assert all(row["metadata"]["chunk_hash"] == chunk_hash(row["content"]) for row in rows(memory, "chunks"))
+    assert document["metadata"]["content_hash"]
+    assert document["metadata"]["version"] == 2
+    assert_consistent(memory)
+
+
+def test_failed_insert_leaves_the_stored_version(memory, embedded):
+    ingest(make_pdf(SENTENCES))
+    hash_before = rows(memory, "documents")[0]["metadata"]["content_hash"]
+    edited = SENTENCES[:-1] + ["Security training is mandatory for every contractor."]
+
+    # The chunk insert succeeds, the embedding insert fails
+    memory.fail_after = memory.writes + 1
+    with pytest.raises(RuntimeError):
+        ingest(make_pdf(edited))
+
+    assert contents(memory) == sorted(SENTENCES)
+    assert rows(memory, "documents")[0]["metadata"]["content_hash"] == hash_before
+    assert_consistent(memory)
+
+
+def test_failure_after_insert_is_repaired_by_the_next_upload(memory, embedded):
+    ingest(make_pdf(SENTENCES[:3]))
+    edited = ["Welcome to the company handbook for all staff members.",
+              "Please read it carefully before your first working day."] + SENTENCES[1:3]
+
+    # The new chunks and their embeddings are inserted, then moving the kept rows fails
+    memory.fail_after = memory.writes + 2
+    with pytest.raises(RuntimeError):
+        ingest(make_pdf(edited))
+
+    # Old and new chunks are both stored until the file is uploaded again
+    assert contents(memory) == sorted(SENTENCES[:3] + edited[:2])
+    assert rows(memory, "documents")[0]["metadata"]["version"] == 1
+
+    memory.fail_after = None
+    result = ingest(make_pdf(edited))
+
+    # The rows inserted by the failed attempt are reused rather than duplicated
+    assert result["changes"] == {"added": 0, "updated": 2, "unchanged": 2, "removed": 1}
+    assert result["version"] == 2
+    assert embedded[-1] == []
+    assert contents(memory) == sorted(edited)
+    assert_consistent(memory)